@@ -1,15 +1,54 @@
 # Основной файл FastAPI
 
 import os
-from fastapi import FastAPI, Depends, HTTPException
+import json
+import time
+import asyncio
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.dependencies import get_db
-from app.schemas.review import ReviewCreate, ReviewResponse, FindSimilarRequest, TaskResponse, StatusResponse
+from app.dependencies import get_db, async_session, statement_cache_guard
+from app.schemas.review import (
+    ReviewCreate, ReviewResponse, FindSimilarRequest, TaskResponse, StatusResponse,
+    SearchRequest, SearchResponse, AddReviewsResponse,
+    BatchSearchRequest, BatchSearchResponse, FindSimilarBatchRequest, SearchFilters,
+    ClassifyRequest, ClassifyBatchRequest, SentimentResult, ClassifyBatchResponse
+)
 from app.models.review import Review
-from app.tasks.tasks import find_similar_reviews
+from app.tasks.tasks import find_similar_reviews, find_similar_reviews_batch
+from app.services.embedding import (
+    check_model_ready, is_model_loaded, load_model, warm_up, embedding_batcher, embedding_cache,
+    model_stats, describe_sentiment, sentiment_columns, split_encoded, reload_model, model_watcher,
+    EmbedderSaturated, EMBEDDING_RETRY_AFTER, MODEL_PRELOAD
+)
+from app.services.search import decode_cursor, encode_cursor, search_similar, search_similar_many, version_check
+from app.services.cache import corpus_generation, result_cache
+from app.services.vector_index import SEARCH_BACKEND, vector_index
+from app.services.projection import projected_columns
+from app.services.metrics import (
+    HTTP_REQUEST_SECONDS, REQUEST_ID_HEADER, begin_request, observe_serialization, render_metrics, result_ready
+)
+from app.services.profiling import PROFILE_HEADER, active_profile, save_profile, start_profile
 from celery.result import AsyncResult
-from transformers import DistilBertForSequenceClassification, DistilBertTokenizer
-import torch
+
+# Таймаут синхронного поиска по умолчанию (секунды)
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "5"))
+
+# Максимальное число отзывов в одном запросе /add_reviews
+ADD_REVIEWS_MAX_ITEMS = int(os.getenv("ADD_REVIEWS_MAX_ITEMS", "1000"))
+
+# Максимальное число текстов в одном запросе /search_batch и /find_similar_batch
+SEARCH_BATCH_MAX_TEXTS = int(os.getenv("SEARCH_BATCH_MAX_TEXTS", "1000"))
+
+# Источник отзывов, добавленных через API без явного source
+DEFAULT_REVIEW_SOURCE = "api"
+
+# Под gunicorn --preload модуль импортируется в мастер-процессе до fork воркеров,
+# поэтому веса загружаются один раз и разделяются воркерами (прогрев - уже в воркерах)
+if MODEL_PRELOAD and check_model_ready():
+    load_model()
 
 app = FastAPI(
     title="IMDB Reviews Similarity API", 
@@ -17,55 +56,71 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Глобальные переменные для модели и токенизатора
-model = None
-tokenizer = None
-
-def check_model_ready():
-    """Проверка готовности модели"""
-    model_path = './fine_tuned_model'
-    required_files = [
-        'config.json',
-        'pytorch_model.bin', 
-        'special_tokens_map.json',
-        'tokenizer_config.json',
-        'vocab.txt'
-    ]
-    
-    if not os.path.exists(model_path):
-        return False
-        
-    for file_name in required_files:
-        file_path = os.path.join(model_path, file_name)
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            return False
-    
-    return True
+async def _observe_request(request: Request, state: dict, profile, started: float, status_code: int):
+    """Длительность запроса, этап сериализации и профиль запроса после отправки ответа"""
+    observe_serialization(state)
+    # Шаблон пути, а не сам путь: иначе /status/{task_id} дает по серии на задачу
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    elapsed = time.perf_counter() - started
+    HTTP_REQUEST_SECONDS.labels(request.method, route_path, str(status_code)).observe(elapsed)
+    if profile is not None:
+        await asyncio.to_thread(
+            save_profile, profile, method=request.method, route=route_path, status=status_code,
+            duration_s=round(elapsed, 4)
+        )
 
-def load_model():
-    """Загрузка модели и токенизатора, если они еще не загружены"""
-    global model, tokenizer
-    
-    if model is None or tokenizer is None:
-        model_path = './fine_tuned_model'
-        
-        if not check_model_ready():
-            raise FileNotFoundError(f"Дообученная модель не готова по пути {model_path}. Модель все еще обучается или произошла ошибка.")
-        
-        print("🤖 Загрузка модели и токенизатора...")
-        try:
-            model = DistilBertForSequenceClassification.from_pretrained(model_path, local_files_only=True)
-            tokenizer = DistilBertTokenizer.from_pretrained(model_path, local_files_only=True)
-            model.eval()
-            print("Модель и токенизатор успешно загружены!")
-        except Exception as e:
-            print(f"Ошибка загрузки модели: {e}")
-            raise
+async def _observed_body(body_iterator, finish):
+    """Тело ответа, после отправки которого (или обрыва соединения) запрос замеряется вызовом finish.
+
+    call_next возвращает ответ, как только обработчик вернул StreamingResponse, а потоковые
+    ответы (NDJSON /add_reviews, /search_batch?stream=1) еще векторизуют и ищут, пока отдается тело.
+    """
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        await finish()
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """request id запроса (из заголовка X-Request-ID или новый), длительность запроса и этап сериализации.
+
+    request id передается в задачи Celery, поставленные обработчиком, и возвращается в ответе.
+    Профилируемый запрос (заголовок X-Profile или PROFILE_SAMPLE_RATE) сохраняет профиль,
+    имя его каталога возвращается в заголовке X-Profile. Длительность замеряется, когда отправлено
+    все тело ответа, поэтому у потоковых ответов в нее входит вся обработка.
+    """
+    state = begin_request(request.headers.get(REQUEST_ID_HEADER))
+    profile = start_profile(request.headers.get(PROFILE_HEADER))
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        await _observe_request(request, state, profile, started, 500)
+        raise
+    response.body_iterator = _observed_body(
+        response.body_iterator,
+        lambda: _observe_request(request, state, profile, started, response.status_code)
+    )
+    response.headers[REQUEST_ID_HEADER] = state["request_id"]
+    if profile is not None:
+        response.headers[PROFILE_HEADER] = profile.name
+    return response
 
 @app.on_event("startup")
 async def startup_event():
-    """Проверка готовности при запуске (без принудительной загрузки)"""
+    """Проверка готовности при запуске и прогрев модели вне цикла событий"""
     print("Запуск IMDB Reviews Similarity API...")
+
+    # Векторный индекс в памяти загружаем заранее, чтобы первый поиск не ждал полного чтения таблицы
+    if SEARCH_BACKEND == "numpy":
+        try:
+            async with async_session() as session:
+                await vector_index.refresh(session)
+            print(f"Векторный индекс в памяти загружен: {len(vector_index)} векторов")
+        except Exception as e:
+            print(f"Не удалось загрузить векторный индекс, он будет загружен при первом поиске: {e}")
     
     # Проверяем, идет ли обучение
     if os.path.exists("./training_in_progress.marker"):
@@ -73,11 +128,11 @@ async def startup_event():
         print("API будет доступен после завершения обучения")
         return
     
-    # Проверяем готовность модели без загрузки
+    # Если модель готова, загружаем ее и делаем пробный прямой проход в отдельном потоке
     if check_model_ready():
         print("Обученная модель найдена и готова к использованию")
         try:
-            load_model()
+            await asyncio.to_thread(warm_up)
             print("🎉 API полностью готов к работе!")
         except Exception as e:
             print(f"Модель найдена, но возникла ошибка загрузки: {e}")
@@ -86,6 +141,9 @@ async def startup_event():
         print("Обученная модель не найдена")
         print("Модель будет загружена после завершения обучения")
 
+    # Новые версии модели подхватываются без перезапуска по указателю current
+    model_watcher.start()
+
 @app.get("/health")
 async def health_check():
     """Проверка состояния сервиса"""
@@ -93,10 +151,60 @@ async def health_check():
         "status": "healthy",
         "training_in_progress": os.path.exists("./training_in_progress.marker"),
         "model_ready": check_model_ready(),
-        "model_loaded": model is not None and tokenizer is not None
+        "model_loaded": is_model_loaded(),
+        "model": model_stats(),
+        "embedding_queue_size": embedding_batcher.qsize(),
+        "embedding_cache": embedding_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "search_backend": SEARCH_BACKEND,
+        "vector_index_size": len(vector_index) if SEARCH_BACKEND == "numpy" else None
     }
     return status
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики процесса API в формате Prometheus (с PROMETHEUS_MULTIPROC_DIR - всех процессов)"""
+    content, content_type = render_metrics()
+    return Response(content, media_type=content_type)
+
+@app.post("/model/reload")
+async def reload_current_model():
+    """Немедленная проверка указателя текущей версии модели (без ожидания MODEL_RELOAD_INTERVAL).
+
+    Переключается только этот процесс; остальные процессы API и воркеры Celery
+    подхватят версию сами при следующей проверке.
+    """
+    if not is_model_loaded():
+        raise HTTPException(
+            status_code=409,
+            detail="Модель еще не загружена - текущая версия будет загружена при первом запросе"
+        )
+    switched = await asyncio.to_thread(reload_model)
+    return {"switched": switched is not None, "model": model_stats()}
+
+def _filter_values(filters: SearchFilters):
+    """Заданные фильтры запроса для сервиса поиска (None - без фильтров)"""
+    return filters.model_dump(exclude_none=True) if filters else None
+
+def _filter_task_args(filters: SearchFilters):
+    """Заданные фильтры запроса в виде JSON для аргументов задачи Celery"""
+    return filters.model_dump(mode="json", exclude_none=True) if filters else None
+
+async def _encode_text(text: str):
+    """Вектор и логиты текста запроса (Encoded) через общую очередь векторизации.
+
+    Профилируемый запрос проходит ту же очередь (и получает EmbedderSaturated при ее
+    переполнении), но векторизуется отдельным батчем без кэша под профайлерами.
+    """
+    return await embedding_batcher.aembed(text, with_logits=True, profile=active_profile())
+
+def _metadata_columns(texts, sources, logits) -> list:
+    """Метаданные новых отзывов: тональность (по логитам прямого прохода), длина текста и источник"""
+    return [
+        {**sentiment, "text_length": len(text), "source": source or DEFAULT_REVIEW_SOURCE}
+        for text, source, sentiment in zip(texts, sources, sentiment_columns(logits))
+    ]
+
 @app.post("/add_review", response_model=ReviewResponse)
 async def add_review(review: ReviewCreate, db: AsyncSession = Depends(get_db)):
     """Добавление нового отзыва в базу данных с генерацией его векторного представления"""
@@ -107,10 +215,10 @@ async def add_review(review: ReviewCreate, db: AsyncSession = Depends(get_db)):
             detail="Модель все еще обучается. Пожалуйста, подождите завершения обучения."
         )
     
-    # Загрузка модели, если она еще не загружена
-    if model is None or tokenizer is None:
+    # Загрузка модели, если она еще не загружена (в отдельном потоке, чтобы не блокировать цикл событий)
+    if not is_model_loaded():
         try:
-            load_model()
+            await asyncio.to_thread(load_model)
         except FileNotFoundError:
             raise HTTPException(
                 status_code=503, 
@@ -122,12 +230,15 @@ async def add_review(review: ReviewCreate, db: AsyncSession = Depends(get_db)):
                 detail=f"Ошибка загрузки модели: {str(e)}"
             )
     
-    # Генерация вектора для отзыва
+    # Генерация вектора и логитов тональности для отзыва (запрос объединяется в батч с параллельными запросами)
     try:
-        with torch.no_grad():
-            inputs = tokenizer(review.text, return_tensors="pt", truncation=True, max_length=512)
-            outputs = model.distilbert(**inputs)
-            embedding = outputs.last_hidden_state[:, 0, :].detach().numpy().tolist()[0]
+        encoded = await _encode_text(review.text)
+    except EmbedderSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис векторизации перегружен. Пожалуйста, повторите запрос позже.",
+            headers={"Retry-After": str(EMBEDDING_RETRY_AFTER)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -136,17 +247,155 @@ async def add_review(review: ReviewCreate, db: AsyncSession = Depends(get_db)):
     
     # Сохранение в базу данных
     try:
-        db_review = Review(text=review.text, vector=embedding)
+        metadata = _metadata_columns([review.text], [review.source], encoded.logits)[0]
+        db_review = Review(
+            text=review.text, vector=encoded.vector, model_version=encoded.model_version,
+            **metadata, **projected_columns(encoded.vector)
+        )
         db.add(db_review)
         await db.commit()
         await db.refresh(db_review)
-        return db_review
     except Exception as e:
         await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка сохранения в базу данных: {str(e)}"
         )
+    
+    # Новый отзыв может оказаться ближайшим соседом - сбрасываем кэш результатов поиска
+    corpus_generation.bump()
+    return result_ready(db_review)
+
+def _validate_review_item(item):
+    """Проверка одного элемента пакета, возвращает ReviewCreate или текст ошибки"""
+    if not isinstance(item, dict):
+        return "Элемент пакета должен быть объектом с полем text"
+    try:
+        return ReviewCreate(**item)
+    except ValidationError as e:
+        return f"Некорректный отзыв: {e.errors()[0]['msg']}"
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return _validate_review_item(json.loads(line))
+    except ValueError as e:
+        return f"Некорректная строка NDJSON: {e}"
+
+async def _read_review_items(request: Request):
+    """Чтение пакета отзывов из JSON-массива или потока NDJSON (по одному объекту на строку).
+
+    Возвращает список, где каждый элемент - ReviewCreate или текст ошибки разбора.
+    """
+    content_type = request.headers.get("content-type", "")
+    
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        items = []
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            items.extend(_parse_ndjson_line(line) for line in lines if line.strip())
+            if len(items) > ADD_REVIEWS_MAX_ITEMS:
+                break
+        if buffer.strip():
+            items.append(_parse_ndjson_line(buffer))
+    else:
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Тело запроса должно быть JSON-массивом или NDJSON")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=400, detail="Тело запроса должно быть JSON-массивом отзывов")
+        items = [_validate_review_item(item) for item in payload]
+    
+    if len(items) > ADD_REVIEWS_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много отзывов в одном запросе (максимум {ADD_REVIEWS_MAX_ITEMS})"
+        )
+    
+    return items
+
+@app.post("/add_reviews", response_model=AddReviewsResponse)
+async def add_reviews(request: Request, db: AsyncSession = Depends(get_db)):
+    """Пакетное добавление отзывов: батчевая векторизация и вставка одной транзакцией.
+
+    Принимает JSON-массив объектов ReviewCreate или NDJSON (Content-Type: application/x-ndjson).
+    Возвращает id новых отзывов в порядке входного списка и ошибки по каждому элементу.
+    """
+    # Проверяем, идет ли обучение
+    if os.path.exists("./training_in_progress.marker"):
+        raise HTTPException(
+            status_code=503, 
+            detail="Модель все еще обучается. Пожалуйста, подождите завершения обучения."
+        )
+    
+    if not check_model_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Модель недоступна или все еще обучается. Пожалуйста, проверьте статус через /health"
+        )
+    
+    items = await _read_review_items(request)
+    results = [{"index": index, "id": None, "error": None} for index in range(len(items))]
+    valid = [(index, item) for index, item in enumerate(items) if isinstance(item, ReviewCreate)]
+    for index, item in enumerate(items):
+        if not isinstance(item, ReviewCreate):
+            results[index]["error"] = item
+    
+    # Векторизация батчами через общую очередь (вектор и логиты тональности каждого отзыва)
+    try:
+        embeddings = await embedding_batcher.aembed_many([item.text for _, item in valid], with_logits=True)
+    except EmbedderSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис векторизации перегружен. Пожалуйста, повторите запрос позже.",
+            headers={"Retry-After": str(EMBEDDING_RETRY_AFTER)}
+        )
+    
+    rows = []
+    row_indexes = []
+    row_logits = []
+    for (index, item), embedding in zip(valid, embeddings):
+        if isinstance(embedding, BaseException):
+            results[index]["error"] = f"Ошибка генерации векторного представления: {str(embedding)}"
+        else:
+            rows.append({"text": item.text, "vector": embedding.vector, "model_version": embedding.model_version})
+            row_indexes.append(index)
+            row_logits.append(embedding.logits)
+    
+    # Сохранение одной транзакцией многострочной вставкой
+    if rows:
+        metadata = _metadata_columns(
+            [row["text"] for row in rows], [items[index].source for index in row_indexes], row_logits
+        )
+        for row, columns in zip(rows, metadata):
+            row.update(columns)
+        projected = projected_columns([row["vector"] for row in rows])
+        for row, reduced in zip(rows, projected.get("vector_reduced", [])):
+            row.update(vector_reduced=reduced, projection_version=projected["projection_version"])
+        try:
+            inserted = await db.execute(
+                insert(Review).returning(Review.id, sort_by_parameter_order=True),
+                rows
+            )
+            ids = inserted.scalars().all()
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=500,
+                detail=f"Ошибка сохранения в базу данных: {str(e)}"
+            )
+        corpus_generation.bump()
+        for index, review_id in zip(row_indexes, ids):
+            results[index]["id"] = review_id
+    
+    return result_ready({
+        "inserted": len(rows),
+        "failed": len(items) - len(rows),
+        "items": results
+    })
 
 @app.post("/find_similar", response_model=TaskResponse)
 async def find_similar(request: FindSimilarRequest):
@@ -167,7 +416,229 @@ async def find_similar(request: FindSimilarRequest):
     
     # Создание асинхронной задачи в Celery
     try:
-        task = find_similar_reviews.delay(request.text)
+        task = find_similar_reviews.delay(
+            request.text, request.k, request.ef_search, request.probes, request.mode, request.vector_weight,
+            _filter_task_args(request.filters)
+        )
+        return {"task_id": task.id}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка создания задачи: {str(e)}"
+        )
+
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    """Синхронный поиск похожих отзывов без обращения к Celery.
+
+    Векторизация выполняется в процессе API, поиск — через асинхронную сессию.
+    Если очередь векторизации переполнена, запрос передается в Celery
+    и возвращается task_id для проверки через /status/{task_id}.
+    """
+    # Проверяем, идет ли обучение
+    if os.path.exists("./training_in_progress.marker"):
+        raise HTTPException(
+            status_code=503, 
+            detail="Модель все еще обучается. Пожалуйста, подождите завершения обучения."
+        )
+    
+    # Проверяем готовность модели
+    if not check_model_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Модель недоступна. Пожалуйста, проверьте статус через /health"
+        )
+    
+    # Курсор продолжает векторную выдачу; у гибридного поиска нет сквозного порядка по расстоянию
+    after = None
+    if request.cursor:
+        if request.mode == "hybrid":
+            raise HTTPException(status_code=400, detail="Курсор поддерживается только для mode=vector")
+        try:
+            after = decode_cursor(request.cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    async def embed_and_search():
+        encoded = await _encode_text(request.text)
+        results = await search_similar(
+            db, encoded.vector, request.k, request.ef_search, request.probes,
+            query_text=request.text if request.mode == "hybrid" else None, vector_weight=request.vector_weight,
+            filters=_filter_values(request.filters), after=after
+        )
+        return results, encoded
+    
+    try:
+        results, encoded = await asyncio.wait_for(embed_and_search(), timeout=request.timeout or SEARCH_TIMEOUT)
+        next_cursor = None
+        if request.mode == "vector" and len(results) == request.k:
+            next_cursor = encode_cursor(results[-1])
+        return result_ready({
+            "status": "completed",
+            "results": results,
+            "next_cursor": next_cursor,
+            "sentiment": describe_sentiment(encoded.logits)[0],
+            **version_check(encoded.model_version, results)
+        })
+    except EmbedderSaturated:
+        # Векторизатор перегружен - переключаемся на асинхронную обработку в Celery
+        try:
+            task = find_similar_reviews.delay(
+                request.text, request.k, request.ef_search, request.probes, request.mode, request.vector_weight,
+                _filter_task_args(request.filters), request.cursor, search_response=True
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Ошибка создания задачи: {str(e)}"
+            )
+        response.status_code = 202
+        return {"status": "pending", "task_id": task.id}
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Превышено время ожидания поиска"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка поиска похожих отзывов: {str(e)}"
+        )
+
+def _check_batch_ready(texts):
+    """Общие проверки пакетного поиска: обучение, готовность модели и размер пакета"""
+    if os.path.exists("./training_in_progress.marker"):
+        raise HTTPException(
+            status_code=503, 
+            detail="Модель все еще обучается. Пожалуйста, подождите завершения обучения."
+        )
+    
+    if not check_model_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Модель недоступна. Пожалуйста, проверьте статус через /health"
+        )
+    
+    if len(texts) > SEARCH_BATCH_MAX_TEXTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много текстов в одном запросе (максимум {SEARCH_BATCH_MAX_TEXTS})"
+        )
+
+async def _batch_search_items(db: AsyncSession, indexes, embeddings, request: BatchSearchRequest):
+    """Поиск для части пакета одним запросом к БД.
+
+    embeddings - Encoded (вектор, логиты тональности и версия модели) или исключение
+    векторизации для каждой позиции indexes, ошибки сообщаются поэлементно.
+    """
+    items = {index: {"index": index, "results": None, "error": None, "sentiment": None} for index in indexes}
+    found = []
+    versions = {}
+    for index, embedding in zip(indexes, embeddings):
+        if isinstance(embedding, BaseException):
+            items[index]["error"] = f"Ошибка генерации векторного представления: {str(embedding)}"
+        else:
+            items[index]["sentiment"] = describe_sentiment(embedding.logits)[0]
+            versions[index] = embedding.model_version
+            found.append((index, embedding.vector))
+    
+    if found:
+        try:
+            results = await search_similar_many(
+                db, [embedding for _, embedding in found], request.k, request.ef_search, request.probes,
+                query_texts=[request.texts[index] for index, _ in found] if request.mode == "hybrid" else None,
+                vector_weight=request.vector_weight, filters=_filter_values(request.filters)
+            )
+            for (index, _), rows in zip(found, results):
+                items[index]["results"] = rows
+                items[index].update(version_check(versions[index], rows))
+        except Exception as e:
+            await db.rollback()
+            for index, _ in found:
+                items[index]["error"] = f"Ошибка поиска похожих отзывов: {str(e)}"
+    
+    return [items[index] for index in indexes]
+
+def _stream_batch_search(request: BatchSearchRequest, futures):
+    """Построчная (NDJSON) выдача результатов по мере векторизации частей пакета"""
+    chunk_size = embedding_batcher.max_batch_size
+    
+    async def lines():
+        try:
+            # Сессия открывается внутри генератора: ответ отдается после выхода из обработчика
+            await statement_cache_guard.check()
+            async with async_session() as session:
+                for start, future in zip(range(0, len(request.texts), chunk_size), futures):
+                    indexes = list(range(start, min(start + chunk_size, len(request.texts))))
+                    try:
+                        embeddings = split_encoded(await asyncio.wrap_future(future))
+                    except Exception as e:
+                        embeddings = [e] * len(indexes)
+                    for item in await _batch_search_items(session, indexes, embeddings, request):
+                        yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился - необработанные части больше не нужны
+            for future in futures:
+                future.cancel()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/search_batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    """Синхронный поиск похожих отзывов сразу для списка текстов.
+
+    Тексты векторизуются батчами, соседи для всех векторов ищутся одним запросом к БД.
+    При stream=true результаты отдаются в формате NDJSON (по строке на текст) по мере
+    готовности частей пакета. Если очередь векторизации переполнена, запрос передается
+    в Celery и возвращается task_id.
+    """
+    _check_batch_ready(request.texts)
+    
+    try:
+        if request.stream:
+            return _stream_batch_search(request, embedding_batcher.submit_many(request.texts, with_logits=True))
+        
+        async def embed_and_search():
+            embeddings = await embedding_batcher.aembed_many(request.texts, with_logits=True)
+            return await _batch_search_items(db, list(range(len(request.texts))), embeddings, request)
+        
+        items = await asyncio.wait_for(embed_and_search(), timeout=request.timeout)
+        return result_ready({"status": "completed", "items": items})
+    except EmbedderSaturated:
+        # Векторизатор перегружен - переключаемся на асинхронную обработку в Celery
+        try:
+            task = find_similar_reviews_batch.delay(
+                request.texts, request.k, request.ef_search, request.probes, request.mode, request.vector_weight,
+                _filter_task_args(request.filters), search_response=True
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Ошибка создания задачи: {str(e)}"
+            )
+        response.status_code = 202
+        return {"status": "pending", "task_id": task.id}
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail="Превышено время ожидания поиска"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка поиска похожих отзывов: {str(e)}"
+        )
+
+@app.post("/find_similar_batch", response_model=TaskResponse)
+async def find_similar_batch(request: FindSimilarBatchRequest):
+    """Пакетный поиск похожих отзывов одной задачей Celery (результат - списки текстов по порядку)"""
+    _check_batch_ready(request.texts)
+    
+    try:
+        task = find_similar_reviews_batch.delay(
+            request.texts, request.k, request.ef_search, request.probes, request.mode, request.vector_weight,
+            _filter_task_args(request.filters)
+        )
         return {"task_id": task.id}
     except Exception as e:
         raise HTTPException(
@@ -175,6 +646,52 @@ async def find_similar(request: FindSimilarRequest):
             detail=f"Ошибка создания задачи: {str(e)}"
         )
 
+@app.post("/classify", response_model=SentimentResult)
+async def classify(request: ClassifyRequest):
+    """Тональность текста: логиты классификационной головы из того же прямого прохода, что и вектор.
+
+    Запрос идет через общую очередь векторизации и кэш векторов, поэтому для уже
+    векторизованного текста классификация не требует прохода модели.
+    """
+    _check_batch_ready([request.text])
+    
+    try:
+        encoded = await _encode_text(request.text)
+    except EmbedderSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис векторизации перегружен. Пожалуйста, повторите запрос позже.",
+            headers={"Retry-After": str(EMBEDDING_RETRY_AFTER)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка классификации: {str(e)}"
+        )
+    return result_ready(describe_sentiment(encoded.logits)[0])
+
+@app.post("/classify_batch", response_model=ClassifyBatchResponse)
+async def classify_batch(request: ClassifyBatchRequest):
+    """Тональность списка текстов батчами через общую очередь; ошибки сообщаются поэлементно"""
+    _check_batch_ready(request.texts)
+    
+    try:
+        encoded = await embedding_batcher.aembed_many(request.texts, with_logits=True)
+    except EmbedderSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис векторизации перегружен. Пожалуйста, повторите запрос позже.",
+            headers={"Retry-After": str(EMBEDDING_RETRY_AFTER)}
+        )
+    
+    items = []
+    for index, item in enumerate(encoded):
+        if isinstance(item, BaseException):
+            items.append({"index": index, "result": None, "error": f"Ошибка классификации: {str(item)}"})
+        else:
+            items.append({"index": index, "result": describe_sentiment(item.logits)[0], "error": None})
+    return result_ready({"items": items})
+
 @app.get("/status/{task_id}", response_model=StatusResponse)
 async def get_status(task_id: str):
     """Проверка статуса выполнения задачи Celery"""
@@ -187,9 +704,10 @@ async def get_status(task_id: str):
                 result = task_result.get()
                 return {"status": "completed", "result": result}
             else:
-                # В случае ошибки возвращаем информацию об ошибке
+                # В случае ошибки возвращаем информацию об ошибке с кодом 500: задача не подменяет
+                # ошибку пустым результатом, и клиент должен отличить сбой от пустой выдачи
                 error_info = str(task_result.info) if task_result.info else "Неизвестная ошибка"
-                return {"status": "failed", "result": error_info}
+                return JSONResponse(status_code=500, content={"status": "failed", "result": error_info})
         else:
             return {"status": "pending", "result": None}
     except Exception as e:
@@ -0,0 +1,19 @@
+# Модель для состояния корпуса отзывов
+
+from sqlalchemy import Column, DateTime, String, func, select
+from app.models.review import Base
+
+# Запись с версией модели векторов корпуса: пишется scripts/reembed.py при переключении на
+# пересчитанные векторы (до первого переключения записи нет)
+VECTORS_VERSION = "vectors_version"
+
+class CorpusState(Base):
+    __tablename__ = 'corpus_state'
+
+    name = Column(String(64), primary_key=True)  # Имя значения, например vectors_version
+    value = Column(String(64), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+def vectors_version_query():
+    """Версия модели векторов корпуса (None, если векторы еще не пересчитывались)"""
+    return select(CorpusState.value).where(CorpusState.name == VECTORS_VERSION)
@@ -0,0 +1,11 @@
+# Модель для контрольных точек загрузки данных
+
+from sqlalchemy import Column, DateTime, Integer, String, func
+from app.models.review import Base
+
+class IngestCheckpoint(Base):
+    __tablename__ = 'ingest_checkpoints'
+
+    name = Column(String, primary_key=True)  # Источник данных, например imdb:test
+    position = Column(Integer, nullable=False, default=0)  # Число уже загруженных строк источника
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,14 +1,200 @@
 # Модель для таблицы отзывов
 
-from sqlalchemy import Column, Integer, Text
-from sqlalchemy.orm import declarative_base
+import os
+from sqlalchemy import (
+    Column, Computed, DateTime, Index, Integer, String, Text, cast, column as column_clause, func, text as sql_text
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, deferred
+from sqlalchemy.types import Float, UserDefinedType
 from pgvector.sqlalchemy import Vector
 
+# Тип ANN-индекса по столбцу vector: hnsw, ivfflat или none (последовательный перебор)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_INDEX_NAME = "ix_reviews_vector"
+
+# Размерность вектора DistilBERT
+VECTOR_DIM = 768
+
+# Размерность векторов после проекции (столбец vector_reduced, см. app/services/projection.py)
+PROJECTION_DIM = int(os.getenv("PROJECTION_DIM", "256"))
+
+# Представление векторов в ANN-индексе: full (float32), halfvec (float16, индекс вдвое меньше),
+# binary (1 бит на измерение, расстояние Хэмминга) или reduced (столбец vector_reduced после
+# проекции в PROJECTION_DIM измерений). Для halfvec и binary индекс строится по выражению
+# над столбцом vector; для всех компактных представлений найденные кандидаты
+# переранжируются по точному косинусному расстоянию полных векторов
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+VECTOR_STORAGES = ("full", "halfvec", "binary", "reduced")
+
+# Конфигурация полнотекстового поиска PostgreSQL для столбца text_tsv (отзывы IMDB - на английском).
+# Выражение генерируемого столбца фиксируется при его создании
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "english")
+TEXT_INDEX_NAME = "ix_reviews_text_tsv"
+
+# Метки тональности по номеру класса классификационной головы модели (как в датасете IMDB)
+SENTIMENT_LABELS = ("negative", "positive")
+
+# Частичные ANN-индексы по каждой метке тональности (WHERE sentiment_label = ...):
+# поиск с фильтром по тональности идет по индексу только подходящих строк
+VECTOR_PARTIAL_INDEXES = os.getenv("VECTOR_PARTIAL_INDEXES", "0") == "1"
+
+# Параметры построения индексов
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
 Base = declarative_base()
 
+# Основной столбец -> теневой столбец, в который пишет фоновый пересчет векторов
+SHADOW_COLUMNS = {
+    "vector": "vector_next",
+    "model_version": "model_version_next",
+    "sentiment_label": "sentiment_label_next",
+    "sentiment_score": "sentiment_score_next",
+}
+
+class NativeVector(Vector):
+    """Vector с передачей numpy-массивов драйверу asyncpg без преобразования в строку.
+
+    Для asyncpg в app/dependencies.py на каждом соединении регистрируется бинарный кодек
+    pgvector, поэтому строковый литерал '[...]' не формируется и не разбирается сервером.
+    psycopg2 передает параметры только текстом - для него остается обычное преобразование.
+    """
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        if dialect.driver == "asyncpg":
+            return None
+        return super().bind_processor(dialect)
+
+class HalfVector(UserDefinedType):
+    """Тип halfvec pgvector (float16), используется только в выражениях индекса и поиска"""
+
+    cache_ok = True
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        super(UserDefinedType, self).__init__()
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return "HALFVEC(%d)" % self.dim
+
+class Bit(UserDefinedType):
+    """Битовая строка PostgreSQL фиксированной длины (результат binary_quantize)"""
+
+    cache_ok = True
+
+    def __init__(self, length: int = VECTOR_DIM):
+        super(UserDefinedType, self).__init__()
+        self.length = length
+
+    def get_col_spec(self, **kw):
+        return "BIT(%d)" % self.length
+
+def compact_vector(vector, storage: str = VECTOR_STORAGE):
+    """Компактное представление вектора (столбца или параметра) для индекса и грубого поиска"""
+    if storage == "halfvec":
+        return cast(vector, HalfVector(VECTOR_DIM))
+    if storage == "binary":
+        return cast(func.binary_quantize(vector), Bit(VECTOR_DIM))
+    raise ValueError(f"Неизвестное представление векторов: {storage}")
+
+def compact_distance(vector, embedding, storage: str = VECTOR_STORAGE):
+    """Расстояние грубого прохода: косинусное для halfvec, Хэмминга для binary"""
+    if storage == "binary":
+        return compact_vector(vector, storage).op("<~>", return_type=Integer)(func.binary_quantize(embedding))
+    return compact_vector(vector, storage).op("<=>", return_type=Float)(compact_vector(embedding, storage))
+
+# Классы операторов индекса для каждого представления
+VECTOR_OPS = {
+    "full": "vector_cosine_ops",
+    "halfvec": "halfvec_cosine_ops",
+    "binary": "bit_hamming_ops",
+    "reduced": "vector_cosine_ops",
+}
+
+def vector_index(
+    column="vector",
+    index_type: str = VECTOR_INDEX_TYPE,
+    name: str = VECTOR_INDEX_NAME,
+    m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    lists: int = IVFFLAT_LISTS,
+    storage: str = VECTOR_STORAGE,
+    **kwargs
+):
+    """Описание ANN-индекса по столбцу векторов (класс операторов - VECTOR_OPS[storage]).
+
+    column - имя столбца (для __table_args__) или объект Column таблицы.
+    Для storage halfvec и binary индекс строится по выражению compact_vector(column),
+    для reduced - по столбцу <column>_reduced.
+    """
+    column_name = column if isinstance(column, str) else column.name
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Неизвестное представление векторов: {storage}")
+
+    if index_type == "hnsw":
+        params = {"m": m, "ef_construction": ef_construction}
+    elif index_type == "ivfflat":
+        params = {"lists": lists}
+    else:
+        raise ValueError(f"Неизвестный тип векторного индекса: {index_type}")
+
+    expression = column
+    if storage == "reduced":
+        column_name = f"{column_name}_reduced"
+        expression = column_name if isinstance(column, str) else column.table.c[column_name]
+    elif storage != "full":
+        source = column_clause(column) if isinstance(column, str) else column
+        column_name = f"{column_name}_{storage}"
+        expression = compact_vector(source, storage).label(column_name)
+
+    return Index(
+        name,
+        expression,
+        postgresql_using=index_type,
+        postgresql_with=params,
+        postgresql_ops={column_name: VECTOR_OPS[storage]},
+        **kwargs
+    )
+
 class Review(Base):
     __tablename__ = 'reviews'
-    
+
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
-    vector = Column(Vector(768))  # Размерность вектора DistilBERT - 768
\ No newline at end of file
+    vector = Column(NativeVector(VECTOR_DIM))  # Размерность вектора DistilBERT - 768
+    vector_reduced = Column(NativeVector(PROJECTION_DIM), nullable=True)  # Вектор после проекции (если она включена)
+    projection_version = Column(String(64), nullable=True)  # Версия проекции, которой получен vector_reduced
+    model_version = Column(String(64), nullable=True)  # Версия модели, которой получен vector
+    # Лексемы текста для полнотекстового поиска: вычисляются PostgreSQL при вставке и изменении text,
+    # при загрузке объектов не читаются
+    text_tsv = deferred(Column(TSVECTOR, Computed(f"to_tsvector('{TEXT_SEARCH_CONFIG}', text)", persisted=True)))
+    # Метаданные для фильтров поиска, заполняются при вставке
+    sentiment_label = Column(String(16), nullable=True)  # Тональность по классификационной голове модели
+    sentiment_score = Column(Float, nullable=True)  # Вероятность положительной тональности
+    text_length = Column(Integer, nullable=True)  # Длина текста в символах
+    created_at = Column(DateTime(timezone=True), nullable=True, server_default=func.now())
+    source = Column(String(64), nullable=True)  # Источник: api, imdb:<сплит> и т.п.
+    # Теневые столбцы пересчета корпуса новой версией модели (scripts/reembed.py): заполняются,
+    # пока поиск читает основные, и в конце одной транзакцией заменяют их (см. SHADOW_COLUMNS).
+    # Приложение их только пишет, поэтому при загрузке объектов Review они не читаются
+    vector_next = deferred(Column(NativeVector(VECTOR_DIM), nullable=True))
+    model_version_next = deferred(Column(String(64), nullable=True))
+    sentiment_label_next = deferred(Column(String(16), nullable=True))
+    sentiment_score_next = deferred(Column(Float, nullable=True))
+
+    __table_args__ = (
+        ((vector_index(),) if VECTOR_INDEX_TYPE != "none" else ())
+        + tuple(
+            vector_index(
+                name=f"{VECTOR_INDEX_NAME}_{label}",
+                postgresql_where=sql_text(f"sentiment_label = '{label}'")
+            )
+            for label in SENTIMENT_LABELS
+            if VECTOR_PARTIAL_INDEXES and VECTOR_INDEX_TYPE != "none"
+        )
+        + (Index(TEXT_INDEX_NAME, "text_tsv", postgresql_using="gin"),)
+    )
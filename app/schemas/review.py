@@ -1,10 +1,29 @@
 # Схемы для валидации запросов и ответов
 
-from pydantic import BaseModel
-from typing import Optional, List, Union
+from datetime import datetime
+from pydantic import BaseModel, Discriminator, Field, Tag, model_validator
+from typing import Annotated, Literal, Optional, List, Union
 
 class ReviewCreate(BaseModel):
     text: str
+    source: Optional[str] = Field(None, max_length=64)  # Источник отзыва; по умолчанию api
+
+class SearchFilters(BaseModel):
+    """Фильтры поиска по метаданным отзывов (все условия объединяются через AND)"""
+    sentiment: Optional[Literal["negative", "positive"]] = None
+    source: Optional[str] = Field(None, max_length=64)
+    min_length: Optional[int] = Field(None, ge=0)  # Длина текста в символах
+    max_length: Optional[int] = Field(None, ge=0)
+    created_after: Optional[datetime] = None  # Включительно
+    created_before: Optional[datetime] = None  # Не включительно
+
+    @model_validator(mode="after")
+    def check_ranges(self):
+        if self.min_length is not None and self.max_length is not None and self.min_length > self.max_length:
+            raise ValueError("min_length не может быть больше max_length")
+        if self.created_after and self.created_before and self.created_after >= self.created_before:
+            raise ValueError("created_after должен быть раньше created_before")
+        return self
 
 class ReviewResponse(BaseModel):
     id: int
@@ -13,12 +32,122 @@ class ReviewResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class BatchItemResult(BaseModel):
+    index: int  # Позиция элемента во входном списке
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class AddReviewsResponse(BaseModel):
+    inserted: int
+    failed: int
+    items: List[BatchItemResult]
+
 class FindSimilarRequest(BaseModel):
     text: str
+    k: int = Field(3, ge=1, le=100)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # hnsw.ef_search для запроса
+    probes: Optional[int] = Field(None, ge=1)  # ivfflat.probes для запроса
+    mode: Literal["vector", "hybrid"] = "vector"  # hybrid - векторный и полнотекстовый поиск, объединенные RRF
+    vector_weight: Optional[float] = Field(None, ge=0, le=1)  # Вес векторного списка; по умолчанию HYBRID_VECTOR_WEIGHT
+    filters: Optional[SearchFilters] = None  # Фильтры по метаданным
 
 class TaskResponse(BaseModel):
     task_id: str
 
+class SearchRequest(BaseModel):
+    text: str
+    k: int = Field(3, ge=1, le=100)
+    timeout: Optional[float] = Field(None, gt=0)  # Секунды; по умолчанию SEARCH_TIMEOUT
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+    mode: Literal["vector", "hybrid"] = "vector"
+    vector_weight: Optional[float] = Field(None, ge=0, le=1)
+    filters: Optional[SearchFilters] = None
+    cursor: Optional[str] = None  # next_cursor предыдущей страницы (только mode=vector)
+
+class SearchResult(BaseModel):
+    id: int
+    text: str
+    distance: float
+    score: Optional[float] = None  # Оценка RRF (только для mode=hybrid)
+    model_version: Optional[str] = None  # Версия модели, посчитавшей вектор отзыва (None - неизвестна)
+
+class SentimentResult(BaseModel):
+    label: Literal["negative", "positive"]
+    score: float  # Вероятность положительной тональности
+    logits: List[float]  # Логиты классификационной головы (negative, positive)
+
+class SearchResponse(BaseModel):
+    status: str  # completed - результаты в ответе, pending - запрос передан в Celery
+    results: Optional[List[SearchResult]] = None
+    task_id: Optional[str] = None
+    next_cursor: Optional[str] = None  # Курсор следующей страницы, если страница заполнена
+    sentiment: Optional[SentimentResult] = None  # Тональность текста запроса
+    model_version: Optional[str] = None  # Версия модели, векторизовавшей запрос
+    mixed_versions: bool = False  # Среди результатов есть векторы другой версии модели
+
+class BatchSearchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    k: int = Field(3, ge=1, le=100)
+    timeout: Optional[float] = Field(None, gt=0)  # Секунды; по умолчанию без ограничения
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+    mode: Literal["vector", "hybrid"] = "vector"
+    vector_weight: Optional[float] = Field(None, ge=0, le=1)
+    filters: Optional[SearchFilters] = None  # Общие для всех текстов
+    stream: bool = False  # Отдавать результаты построчно (NDJSON) по мере готовности
+
+class BatchSearchItem(BaseModel):
+    index: int  # Позиция текста во входном списке
+    results: Optional[List[SearchResult]] = None
+    error: Optional[str] = None
+    sentiment: Optional[SentimentResult] = None
+    model_version: Optional[str] = None
+    mixed_versions: bool = False
+
+class BatchSearchResponse(BaseModel):
+    status: str  # completed - результаты в ответе, pending - запрос передан в Celery
+    items: Optional[List[BatchSearchItem]] = None
+    task_id: Optional[str] = None
+
+def _search_response_kind(value) -> Optional[str]:
+    """Ответ /search или /search_batch: у обоих обязательно только поле status, различаются по items"""
+    if isinstance(value, BaseModel):
+        return "batch" if isinstance(value, BatchSearchResponse) else "single"
+    if isinstance(value, dict):
+        return "batch" if "items" in value else "single"
+    return None  # Не ответ поиска: подходит один из остальных вариантов result
+
+# Результат задачи, в которую передан перегруженный синхронный поиск
+TaskSearchResponse = Annotated[
+    Union[Annotated[SearchResponse, Tag("single")], Annotated[BatchSearchResponse, Tag("batch")]],
+    Discriminator(_search_response_kind)
+]
+
 class StatusResponse(BaseModel):
     status: str
-    result: Optional[Union[List[str], str]] = None  # Может быть списком или строкой ошибки
\ No newline at end of file
+    # Список текстов, списки текстов для пакетного поиска, ответ /search или /search_batch или строка ошибки
+    result: Optional[Union[List[str], List[List[str]], TaskSearchResponse, str]] = None
+
+class FindSimilarBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    k: int = Field(3, ge=1, le=100)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+    mode: Literal["vector", "hybrid"] = "vector"
+    vector_weight: Optional[float] = Field(None, ge=0, le=1)
+    filters: Optional[SearchFilters] = None
+
+class ClassifyRequest(BaseModel):
+    text: str
+
+class ClassifyBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+
+class ClassifyBatchItem(BaseModel):
+    index: int  # Позиция текста во входном списке
+    result: Optional[SentimentResult] = None
+    error: Optional[str] = None
+
+class ClassifyBatchResponse(BaseModel):
+    items: List[ClassifyBatchItem]
@@ -0,0 +1,288 @@
+# Кэш векторных представлений текстов
+
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.tasks.celery_app import REDIS_URL
+from app.services.metrics import CACHE_REQUESTS
+
+# Локальный LRU-кэш процесса: максимальное число векторов и время жизни записи (секунды, 0 - без ограничения)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+
+# Общий кэш в Redis (отключен по умолчанию) и время жизни его записей (секунды)
+EMBEDDING_CACHE_REDIS = os.getenv("EMBEDDING_CACHE_REDIS", "0") == "1"
+EMBEDDING_CACHE_REDIS_TTL = int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", "86400"))
+
+# Как часто перепроверять файлы модели на изменение (секунды)
+FINGERPRINT_CHECK_INTERVAL = 1.0
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+def get_redis():
+    """Клиент Redis из конфигурации Celery (создается при первом обращении)"""
+    global _redis_client
+
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                import redis
+                _redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis_client
+
+def normalize_text(text: str) -> str:
+    """Нормализация пробелов: токенизатор их не различает, поэтому и ключ кэша не должен"""
+    return " ".join(text.split())
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def model_fingerprint(model_path: str, variant: str = "", files: Optional[Iterable[str]] = None) -> str:
+    """Отпечаток модели по именам, размерам и времени изменения ее файлов и варианту инференса.
+
+    files - учитываемые файлы (по умолчанию все файлы каталога). Производные файлы, которые
+    создаются при загрузке (tokenizer.json, model.safetensors), в отпечаток попадать не должны:
+    иначе он меняется после первой загрузки тех же весов.
+    """
+    digest = hashlib.sha256(variant.encode("utf-8"))
+    if os.path.isdir(model_path):
+        for file_name in sorted(files if files is not None else os.listdir(model_path)):
+            file_path = os.path.join(model_path, file_name)
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                digest.update(f"{file_name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей"""
+
+    def __init__(self, max_size: int, ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class EmbeddingCache:
+    """Двухуровневый кэш векторов: LRU процесса и (опционально) общий Redis.
+
+    Ключ - отпечаток модели (с учетом бэкенда инференса variant) и хэш нормализованного
+    текста, поэтому после замены файлов модели старые записи перестают находиться,
+    а локальный кэш очищается. Методы принимают каталог модели model_path (по умолчанию
+    заданный при создании): записи разных версий модели не смешиваются.
+    В Redis векторы хранятся компактно - байтами float32.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        variant: str = "",
+        max_size: int = EMBEDDING_CACHE_SIZE,
+        ttl: float = EMBEDDING_CACHE_TTL,
+        use_redis: bool = EMBEDDING_CACHE_REDIS,
+        redis_ttl: int = EMBEDDING_CACHE_REDIS_TTL,
+    ):
+        self.model_path = model_path
+        self.variant = variant
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+        self._local = LRUCache(max_size, ttl)
+        self._fingerprints = {}  # Каталог модели -> (отпечаток, время проверки)
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    def fingerprint(self, model_path: Optional[str] = None) -> str:
+        """Текущий отпечаток модели; при его изменении локальный кэш очищается"""
+        model_path = model_path or self.model_path
+        now = time.monotonic()
+        previous, checked_at = self._fingerprints.get(model_path, (None, 0.0))
+        if previous is None or now - checked_at >= FINGERPRINT_CHECK_INTERVAL:
+            from app.services.model_registry import REQUIRED_MODEL_FILES
+
+            fingerprint = model_fingerprint(model_path, self.variant, REQUIRED_MODEL_FILES)
+            with self._lock:
+                if previous is not None and fingerprint != previous:
+                    print("Файлы модели изменились - кэш векторов сброшен")
+                    self._local.clear()
+                self._fingerprints[model_path] = (fingerprint, now)
+            return fingerprint
+        return previous
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self._stats[name] += value
+        CACHE_REQUESTS.labels("embedding", name).inc(value)
+
+    def get_local(self, text: str, model_path: Optional[str] = None) -> Optional[np.ndarray]:
+        """Поиск только в кэше процесса (без сетевых обращений)"""
+        vector = self._local.get((self.fingerprint(model_path), text_hash(text)))
+        if vector is not None:
+            self._count("local_hits")
+        return vector
+
+    def get_many(self, texts: List[str], model_path: Optional[str] = None) -> Dict[int, np.ndarray]:
+        """Поиск векторов для списка текстов, возвращает {позиция: вектор} для найденных"""
+        fingerprint = self.fingerprint(model_path)
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+
+        for position, digest in enumerate(hashes):
+            vector = self._local.get((fingerprint, digest))
+            if vector is not None:
+                found[position] = vector
+        self._count("local_hits", len(found))
+
+        missing = [position for position in range(len(texts)) if position not in found]
+        if missing and self.use_redis:
+            try:
+                values = get_redis().mget([f"emb:{fingerprint}:{hashes[position]}" for position in missing])
+                for position, value in zip(missing, values):
+                    if value is not None:
+                        vector = np.frombuffer(value, dtype=np.float32)
+                        self._local.set((fingerprint, hashes[position]), vector)
+                        found[position] = vector
+                        self._count("redis_hits")
+            except Exception as e:
+                self._count("redis_errors")
+                print(f"Ошибка чтения кэша векторов из Redis: {e}")
+
+        self._count("misses", len(texts) - len(found))
+        return found
+
+    def set_many(self, texts: List[str], vectors: np.ndarray, model_path: Optional[str] = None):
+        """Сохранение векторов в оба уровня кэша"""
+        fingerprint = self.fingerprint(model_path)
+        hashes = [text_hash(text) for text in texts]
+
+        for digest, vector in zip(hashes, vectors):
+            # Копия, чтобы запись кэша не удерживала в памяти всю матрицу батча
+            self._local.set((fingerprint, digest), np.array(vector, dtype=np.float32))
+
+        if self.use_redis:
+            try:
+                pipeline = get_redis().pipeline(transaction=False)
+                for digest, vector in zip(hashes, vectors):
+                    pipeline.set(f"emb:{fingerprint}:{digest}", np.asarray(vector, dtype=np.float32).tobytes(), ex=self.redis_ttl)
+                pipeline.execute()
+            except Exception as e:
+                self._count("redis_errors")
+                print(f"Ошибка записи кэша векторов в Redis: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["local_size"] = len(self._local)
+        stats["redis_enabled"] = self.use_redis
+        return stats
+
+# Кэш результатов поиска: число запросов и время жизни записи (секунды);
+# TTL ограничивает устаревание при записи в обход API
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+
+# Ключ счетчика поколений корпуса в Redis и пауза после ошибки подключения (секунды)
+GENERATION_KEY = "reviews:generation"
+GENERATION_RETRY_INTERVAL = 5.0
+
+class CorpusGeneration:
+    """Счетчик поколений корпуса отзывов в Redis, общий для всех процессов.
+
+    Каждая запись в таблицу reviews увеличивает счетчик, и ключи кэша результатов
+    предыдущего поколения перестают находиться. Если Redis недоступен, current()
+    возвращает None и кэш результатов не используется - это безопаснее, чем
+    рисковать устаревшими соседями.
+    """
+
+    def __init__(self):
+        self._unavailable_until = 0.0
+
+    def current(self) -> Optional[int]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            value = get_redis().get(GENERATION_KEY)
+            return int(value) if value is not None else 0
+        except Exception as e:
+            self._unavailable_until = time.monotonic() + GENERATION_RETRY_INTERVAL
+            print(f"Счетчик поколений корпуса недоступен, кэш результатов отключен: {e}")
+            return None
+
+    def bump(self):
+        # Пока Redis недоступен, кэш результатов не используется и сбрасывать нечего
+        if time.monotonic() < self._unavailable_until:
+            return
+        try:
+            get_redis().incr(GENERATION_KEY)
+        except Exception as e:
+            self._unavailable_until = time.monotonic() + GENERATION_RETRY_INTERVAL
+            print(f"Не удалось увеличить счетчик поколений корпуса: {e}")
+
+class SearchResultCache:
+    """LRU-кэш результатов поиска, ключ - поколение корпуса, хэш вектора запроса и параметры поиска"""
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL):
+        self.enabled = max_size > 0
+        self._local = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(generation: int, embedding: np.ndarray, *params) -> tuple:
+        digest = hashlib.sha256(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        return (generation, digest) + params
+
+    def get(self, key: tuple) -> Optional[list]:
+        results = self._local.get(key)
+        with self._lock:
+            self._stats["hits" if results is not None else "misses"] += 1
+        CACHE_REQUESTS.labels("result", "hits" if results is not None else "misses").inc()
+        # Копии, чтобы вызывающий код не изменил закэшированные записи
+        return [dict(row) for row in results] if results is not None else None
+
+    def set(self, key: tuple, results: list):
+        self._local.set(key, [dict(row) for row in results])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = len(self._local)
+        stats["enabled"] = self.enabled
+        return stats
+
+corpus_generation = CorpusGeneration()
+result_cache = SearchResultCache()
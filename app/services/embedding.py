@@ -0,0 +1,744 @@
+# Сервис векторизации текстов с динамическим микробатчингом
+
+import os
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import groupby
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import DistilBertTokenizerFast
+
+from app.models.review import SENTIMENT_LABELS, VECTOR_DIM
+from app.services.cache import EmbeddingCache
+from app.services.encoders import create_encoder, ENCODER_BACKEND, MODEL_SHARED_WEIGHTS, SentimentHead
+from app.services.metrics import EMBEDDING_BATCH_SIZE, MODEL_LOAD_SECONDS, STAGE_SECONDS, stage
+from app.services.profiling import profile_section
+from app.services.model_registry import LEGACY_MODEL_PATH, current_version, model_files_ready
+
+# Каталог модели без версий; текущая версия определяется указателем (app/services/model_registry.py)
+MODEL_PATH = LEGACY_MODEL_PATH
+
+# Сериализованный быстрый (Rust) токенизатор; без него токенизатор строится из vocab.txt
+# при каждой загрузке (scripts/convert_tokenizer.py сохраняет его заранее)
+TOKENIZER_FILE = "tokenizer.json"
+
+# Максимальная длина последовательности в токенах: более длинные отзывы обрезаются.
+# Меньшее значение ускоряет инференс ценой качества векторов длинных отзывов
+# (замер компромисса - scripts/eval_seq_length.py)
+MAX_SEQ_LENGTH = int(os.getenv("MAX_SEQ_LENGTH", "512"))
+
+# Группировка батча по длине: тексты сортируются по числу токенов и делятся на части,
+# в каждой из которых (число текстов * длина самого длинного) не превышает бюджет;
+# 0 - весь батч одним проходом с паддингом до самого длинного текста
+EMBEDDING_BUCKET_TOKENS = int(os.getenv("EMBEDDING_BUCKET_TOKENS", "8192"))
+
+# Векторизация отзывов длиннее MAX_SEQ_LENGTH:
+#   cls - CLS-вектор начала отзыва, остаток обрезается;
+#   chunk-mean / chunk-max - отзыв делится на перекрывающиеся окна, все окна батча проходят
+#     через модель вместе, CLS-векторы окон усредняются / берется поэлементный максимум;
+#   chunk-tokens - среднее скрытых состояний всех токенов всех окон (только бэкенды torch).
+# Смена стратегии меняет векторы: сохраненные отзывы нужно векторизовать заново
+EMBEDDING_STRATEGY = os.getenv("EMBEDDING_STRATEGY", "cls")
+EMBEDDING_STRATEGIES = ("cls", "chunk-mean", "chunk-max", "chunk-tokens")
+
+# Перекрытие соседних окон в токенах и максимум окон на отзыв: из более длинных отзывов
+# берутся окна, равномерно распределенные по тексту, поэтому худшая задержка ограничена
+EMBEDDING_CHUNK_STRIDE = int(os.getenv("EMBEDDING_CHUNK_STRIDE", "64"))
+EMBEDDING_MAX_CHUNKS = int(os.getenv("EMBEDDING_MAX_CHUNKS", "8"))
+
+# Параметры микробатчинга: максимальный размер батча и максимальное время ожидания
+# накопления батча (в миллисекундах)
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+
+# Ограничение параллелизма: число потоков, выполняющих прямые проходы модели,
+# и максимальное число запросов, ожидающих в очереди
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "256"))
+
+# Рекомендуемая пауза перед повтором запроса при переполнении очереди (секунды)
+EMBEDDING_RETRY_AFTER = int(os.getenv("EMBEDDING_RETRY_AFTER", "1"))
+
+# Загрузка весов в родительском процессе до fork (Celery prefork, gunicorn --preload):
+# дочерние процессы наследуют страницы весов по принципу copy-on-write
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "0") == "1"
+
+# Потоков PyTorch на процесс (0 - по числу ядер); при нескольких воркерах на узле
+# ограничение предотвращает конкуренцию потоков за ядра
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
+# Как часто проверять указатель текущей версии модели (секунды, 0 - только по запросу /model/reload)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "10"))
+
+class LoadedModel(NamedTuple):
+    """Загруженная версия модели: энкодер и токенизатор заменяются только вместе"""
+
+    version: str
+    path: str
+    encoder: object
+    tokenizer: DistilBertTokenizerFast
+    load_seconds: float
+
+# Текущая модель процесса. Ссылка заменяется целиком одной операцией присваивания:
+# батч, начатый на старой версии, дорабатывает на ней, следующие идут на новой
+active_model = None
+_model_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_failed_version = None
+# Классификационные головы для логитов по сохраненным векторам (по каталогу модели)
+_sentiment_heads = {}
+# Быстрый токенизатор меняет настройки обрезки внутри вызова и не допускает
+# одновременного использования из нескольких потоков
+_tokenizer_lock = threading.Lock()
+
+def embedding_variant() -> str:
+    """Параметры инференса, от которых зависит вектор текста (часть ключа кэша)"""
+    # logits - запись кэша хранит вектор вместе с логитами тональности
+    variant = f"{ENCODER_BACKEND}:{MAX_SEQ_LENGTH}:{EMBEDDING_STRATEGY}:logits"
+    if EMBEDDING_STRATEGY != "cls":
+        variant += f":{EMBEDDING_CHUNK_STRIDE}:{EMBEDDING_MAX_CHUNKS}"
+    return variant
+
+# Кэш векторов перед моделью (вектор детерминирован для текста, версии модели и параметров инференса).
+# Запись - строка из VECTOR_DIM чисел вектора и логитов тональности (по числу SENTIMENT_LABELS),
+# ключ включает отпечаток каталога версии, которая ее посчитала
+embedding_cache = EmbeddingCache(MODEL_PATH, variant=embedding_variant())
+
+class EmbedderSaturated(Exception):
+    """Очередь векторизации переполнена, запрос нужно повторить позже"""
+
+class Encoded(NamedTuple):
+    """Результат векторизации с логитами тональности и версией посчитавшей их модели"""
+
+    vector: np.ndarray
+    logits: np.ndarray
+    model_version: str
+
+def split_encoded(chunk: Encoded) -> List[Encoded]:
+    """Encoded части батча (матрицы векторов и логитов) - по одному Encoded на текст"""
+    return [Encoded(vector, logits, chunk.model_version) for vector, logits in zip(chunk.vector, chunk.logits)]
+
+def current_model_path() -> str:
+    """Каталог модели, которая обслуживает запросы (до загрузки - текущей по указателю)"""
+    model = active_model
+    return model.path if model is not None else current_version()[1]
+
+def model_version() -> Optional[str]:
+    """Версия загруженной модели процесса"""
+    model = active_model
+    return model.version if model is not None else None
+
+def check_model_ready(model_path: Optional[str] = None):
+    """Проверка готовности модели (по умолчанию - обслуживающей запросы или текущей по указателю)"""
+    return model_files_ready(model_path or current_model_path())
+
+def is_model_loaded():
+    """Загружены ли энкодер и токенизатор в текущем процессе"""
+    return active_model is not None
+
+def process_memory() -> dict:
+    """Память текущего процесса в МБ (Linux).
+
+    rss - резидентная память, pss - резидентная с долей общих страниц (их размер делится
+    между процессами, которые их используют; сумма pss воркеров - реальный расход узла),
+    shared_clean - неизмененные общие страницы, например веса модели через mmap.
+    """
+    stats = {}
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean"):
+                    stats[f"{key.lower()}_mb"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return stats
+
+def configure_threads():
+    """Применение TORCH_NUM_THREADS в текущем процессе (повторно - в дочернем после fork)"""
+    if TORCH_NUM_THREADS:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+
+def model_stats() -> dict:
+    """Сведения о загрузке модели в текущем процессе для /health и логов воркеров"""
+    model = active_model
+    return {
+        "pid": os.getpid(),
+        "version": model.version if model is not None else None,
+        "path": model.path if model is not None else None,
+        "backend": ENCODER_BACKEND,
+        "shared_weights": MODEL_SHARED_WEIGHTS,
+        "load_seconds": model.load_seconds if model is not None else None,
+        **process_memory()
+    }
+
+def load_tokenizer(model_path: str = MODEL_PATH) -> DistilBertTokenizerFast:
+    """Загрузка быстрого токенизатора.
+
+    Если tokenizer.json еще нет, токенизатор строится из vocab.txt, а результат
+    сохраняется рядом с моделью (через временный файл), чтобы следующие загрузки
+    не повторяли преобразование.
+    """
+    fast_tokenizer = DistilBertTokenizerFast.from_pretrained(model_path, local_files_only=True)
+    target = os.path.join(model_path, TOKENIZER_FILE)
+    if not os.path.exists(target):
+        temporary = f"{target}.{os.getpid()}.tmp"
+        try:
+            fast_tokenizer.backend_tokenizer.save(temporary)
+            os.replace(temporary, target)
+            print(f"Быстрый токенизатор сохранен: {target}")
+        except OSError as e:
+            print(f"Не удалось сохранить {target}: {e}")
+    return fast_tokenizer
+
+def _load_version(version: str, model_path: str) -> LoadedModel:
+    """Загрузка энкодера выбранного бэкенда и токенизатора одной версии модели"""
+    if not check_model_ready(model_path):
+        raise FileNotFoundError(f"Дообученная модель не готова по пути {model_path}. Модель все еще обучается или произошла ошибка.")
+
+    print(f"🤖 Загрузка модели {version} (бэкенд {ENCODER_BACKEND}) и токенизатора...")
+    started = time.perf_counter()
+    configure_threads()
+    loaded_encoder = create_encoder(model_path, ENCODER_BACKEND)
+    if EMBEDDING_STRATEGY not in EMBEDDING_STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия векторизации: {EMBEDDING_STRATEGY}. "
+                         f"Допустимые значения: {', '.join(EMBEDDING_STRATEGIES)}")
+    if _window_pooling(EMBEDDING_STRATEGY) not in loaded_encoder.poolings:
+        raise ValueError(f"Стратегия {EMBEDDING_STRATEGY} недоступна для бэкенда {ENCODER_BACKEND}")
+    loaded_tokenizer = load_tokenizer(model_path)
+    load_seconds = round(time.perf_counter() - started, 3)
+    memory = process_memory()
+    print(f"Модель {version} и токенизатор успешно загружены за {load_seconds} с "
+          f"(pid {os.getpid()}, RSS {memory.get('rss_mb')} МБ, PSS {memory.get('pss_mb')} МБ)")
+    return LoadedModel(version, model_path, loaded_encoder, loaded_tokenizer, load_seconds)
+
+def current_model() -> LoadedModel:
+    """Модель, обслуживающая запросы; при первом обращении загружается текущая версия"""
+    global active_model
+
+    model = active_model
+    if model is not None:
+        return model
+
+    with _model_lock:
+        if active_model is None:
+            active_model = _load_version(*current_version())
+            _observe_model_load(active_model)
+        return active_model
+
+def _observe_model_load(model: LoadedModel):
+    """Время загрузки модели в метриках: одна серия на обслуживающую версию"""
+    MODEL_LOAD_SECONDS.clear()
+    MODEL_LOAD_SECONDS.labels(model.version).set(model.load_seconds)
+
+def load_model():
+    """Загрузка энкодера и токенизатора текущей версии, если они еще не загружены"""
+    model = current_model()
+    return model.encoder, model.tokenizer
+
+def reload_model() -> Optional[str]:
+    """Переход на новую версию, если указатель current сменился.
+
+    Новая версия загружается и прогревается, пока старая продолжает обслуживать
+    запросы, затем ссылка на модель заменяется. Возвращает версию после перехода
+    или None, если переход не нужен. При ошибке загрузки старая версия остается,
+    а та же версия не загружается повторно до следующей смены указателя.
+    """
+    global active_model, _failed_version
+
+    with _reload_lock:
+        version, path = current_version()
+        if active_model is None or version == active_model.version or version == _failed_version:
+            return None
+
+        try:
+            model = _load_version(version, path)
+            encode_inputs(tokenize_batch(["warm up"], model=model))
+        except Exception as e:
+            _failed_version = version
+            print(f"❌ Не удалось загрузить модель {version}, продолжает работать {active_model.version}: {e}")
+            return None
+
+        previous = active_model.version
+        active_model = model
+        _failed_version = None
+        _observe_model_load(model)
+        print(f"🔄 Модель переключена: {previous} -> {version}")
+        return version
+
+class ModelWatcher:
+    """Фоновый поток процесса, проверяющий указатель текущей версии каждые interval секунд"""
+
+    def __init__(self, interval: float = MODEL_RELOAD_INTERVAL):
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Запуск потока (повторно - в дочернем процессе после fork)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="model-watcher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                reload_model()
+            except Exception as e:
+                print(f"Ошибка проверки версии модели: {e}")
+
+model_watcher = ModelWatcher()
+
+def warm_up():
+    """Загрузка модели и пробный прямой проход, чтобы первый запрос не платил за инициализацию"""
+    load_model()
+    encode_batch(["warm up"])
+
+def vector_logits(vectors: np.ndarray, model_path: Optional[str] = None) -> np.ndarray:
+    """Логиты тональности по уже сохраненным векторам (классификационная голова на numpy).
+
+    Для стратегии cls совпадают с логитами прямого прохода; для стратегий с окнами
+    голова применяется к объединенному вектору и дает приближение. Векторы должны
+    быть посчитаны той же версией модели (по умолчанию - текущей).
+    """
+    model_path = model_path or current_model_path()
+    head = _sentiment_heads.get(model_path)
+    if head is None:
+        with _model_lock:
+            head = _sentiment_heads.setdefault(model_path, SentimentHead(model_path))
+    return head.logits(np.asarray(vectors, dtype=np.float32).reshape(-1, VECTOR_DIM))
+
+def describe_sentiment(logits: np.ndarray) -> List[dict]:
+    """Метка, вероятность положительного класса (softmax) и логиты для каждой строки логитов"""
+    logits = np.asarray(logits, dtype=np.float32).reshape(-1, len(SENTIMENT_LABELS))
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probabilities = shifted / shifted.sum(axis=1, keepdims=True)
+    return [
+        {
+            "label": SENTIMENT_LABELS[int(row.argmax())],
+            "score": float(probability[SENTIMENT_LABELS.index("positive")]),
+            "logits": [float(value) for value in row]
+        }
+        for row, probability in zip(logits, probabilities)
+    ]
+
+def sentiment_columns(logits: np.ndarray) -> List[dict]:
+    """Значения столбцов sentiment_label и sentiment_score для сохранения отзывов"""
+    return [
+        {"sentiment_label": sentiment["label"], "sentiment_score": sentiment["score"]}
+        for sentiment in describe_sentiment(logits)
+    ]
+
+class TokenizedBatch(NamedTuple):
+    """Токенизированный батч: части с входами модели и сведения для сборки векторов.
+
+    Строки частей - окна текстов (при стратегии cls - одно окно на текст);
+    owners - номер текста для каждого окна, weights - вес окна при усреднении,
+    model - версия модели, токенизатором которой получен батч (ее же энкодер его обработает).
+    """
+
+    buckets: List[Tuple[np.ndarray, dict]]
+    owners: np.ndarray
+    weights: np.ndarray
+    count: int
+    strategy: str
+    model: LoadedModel
+
+def _window_pooling(strategy: str) -> str:
+    return "tokens" if strategy == "chunk-tokens" else "cls"
+
+def _limit_chunks(owners: List[int], max_chunks: int) -> List[int]:
+    """Номера окон, оставленных для каждого текста: не больше max_chunks, равномерно по тексту"""
+    selected = []
+    start = 0
+    for _, group in groupby(owners):
+        count = len(list(group))
+        if count <= max_chunks:
+            selected.extend(range(start, start + count))
+        else:
+            selected.extend(start + np.unique(np.linspace(0, count - 1, max_chunks).round().astype(int)))
+        start += count
+    return selected
+
+def _bucket_positions(lengths: List[int], bucket_tokens: int) -> List[List[int]]:
+    """Позиции текстов, сгруппированные по длине в пределах бюджета токенов"""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    if bucket_tokens <= 0:
+        return [order]
+
+    buckets = [[]]
+    for position in order:
+        # Длина растет, поэтому паддинг части определяется последним добавленным текстом
+        if buckets[-1] and (len(buckets[-1]) + 1) * lengths[position] > bucket_tokens:
+            buckets.append([])
+        buckets[-1].append(position)
+    return buckets
+
+def tokenize_batch(
+    texts: List[str],
+    max_length: int = MAX_SEQ_LENGTH,
+    bucket_tokens: int = EMBEDDING_BUCKET_TOKENS,
+    strategy: str = EMBEDDING_STRATEGY,
+    model: Optional[LoadedModel] = None,
+) -> TokenizedBatch:
+    """Токенизация списка текстов с делением длинных текстов на окна и группировкой по длине.
+
+    Части батча содержат позиции строк (окон) и входы модели, дополненные паддингом
+    до самого длинного окна части. model - версия модели (по умолчанию текущая).
+    """
+    with stage("tokenize"):
+        model = model or current_model()
+        batch_tokenizer = model.tokenizer
+        with _tokenizer_lock:
+            if strategy == "cls":
+                encoded = batch_tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+                owners = list(range(len(texts)))
+            else:
+                windows = batch_tokenizer(
+                    texts, truncation=True, max_length=max_length, return_overflowing_tokens=True,
+                    stride=min(EMBEDDING_CHUNK_STRIDE, max_length // 2)
+                )
+                selected = _limit_chunks(windows["overflow_to_sample_mapping"], EMBEDDING_MAX_CHUNKS)
+                encoded = [windows["input_ids"][window] for window in selected]
+                owners = [windows["overflow_to_sample_mapping"][window] for window in selected]
+
+        lengths = [len(ids) for ids in encoded]
+        buckets = []
+        for positions in _bucket_positions(lengths, bucket_tokens):
+            width = max(lengths[position] for position in positions)
+            input_ids = np.full((len(positions), width), batch_tokenizer.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(positions), width), dtype=np.int64)
+            for row, position in enumerate(positions):
+                input_ids[row, :lengths[position]] = encoded[position]
+                attention_mask[row, :lengths[position]] = 1
+            buckets.append((
+                np.asarray(positions),
+                {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask)}
+            ))
+
+        # chunk-tokens усредняет все токены, поэтому окно весит столько, сколько в нем токенов
+        weights = np.asarray(lengths if strategy == "chunk-tokens" else [1] * len(lengths), dtype=np.float32)
+        return TokenizedBatch(buckets, np.asarray(owners, dtype=np.int64), weights, len(texts), strategy, model)
+
+def encode_inputs(batch: TokenizedBatch, with_logits: bool = False):
+    """Прямой проход модели по каждой части токенизированного батча.
+
+    Возвращает по одному вектору на текст в исходном порядке; векторы окон
+    длинных текстов объединяются согласно стратегии батча. При with_logits - пару
+    (векторы, логиты тональности): логиты считаются в том же прямом проходе
+    и для длинных текстов усредняются по окнам.
+    """
+    batch_encoder = batch.model.encoder
+    pooling = _window_pooling(batch.strategy)
+    rows = None
+    window_logits = None
+    with stage("infer"):
+        for positions, inputs in batch.buckets:
+            bucket_vectors, bucket_logits = batch_encoder.encode_with_logits(inputs, pooling, with_logits)
+            if rows is None:
+                rows = np.empty((len(batch.owners), bucket_vectors.shape[1]), dtype=np.float32)
+            rows[positions] = bucket_vectors
+            if with_logits:
+                if window_logits is None:
+                    window_logits = np.empty((len(batch.owners), bucket_logits.shape[1]), dtype=np.float32)
+                window_logits[positions] = bucket_logits
+
+    vectors = _pool_windows(batch, rows)
+    if not with_logits:
+        return vectors
+    if batch.strategy == "cls":
+        return vectors, window_logits
+    logits = np.zeros((batch.count, window_logits.shape[1]), dtype=np.float32)
+    np.add.at(logits, batch.owners, window_logits)
+    return vectors, logits / np.bincount(batch.owners, minlength=batch.count)[:, None].astype(np.float32)
+
+def _pool_windows(batch: TokenizedBatch, rows: np.ndarray) -> np.ndarray:
+    """Объединение векторов окон в векторы текстов согласно стратегии батча"""
+    if batch.strategy == "cls":
+        return rows
+
+    if batch.strategy == "chunk-max":
+        vectors = np.full((batch.count, rows.shape[1]), -np.inf, dtype=np.float32)
+        np.maximum.at(vectors, batch.owners, rows)
+        return vectors
+
+    vectors = np.zeros((batch.count, rows.shape[1]), dtype=np.float32)
+    np.add.at(vectors, batch.owners, rows * batch.weights[:, None])
+    return vectors / np.bincount(batch.owners, batch.weights, minlength=batch.count)[:, None].astype(np.float32)
+
+def encode_batch(texts: List[str], with_logits: bool = False, model: Optional[LoadedModel] = None):
+    """Векторизация списка текстов.
+
+    Тексты группируются по длине, каждая часть проходит через модель отдельно
+    с паддингом до самого длинного текста части; маска внимания исключает паддинг,
+    поэтому CLS-вектор каждого текста не зависит от соседей по батчу.
+    Возвращает матрицу float32 размера (len(texts), 768), при with_logits - еще
+    и матрицу логитов тональности (len(texts), 2).
+    """
+    return encode_inputs(tokenize_batch(texts, model=model), with_logits)
+
+def _split_row(rows: np.ndarray, with_logits: bool, version: str):
+    """Вектор (или Encoded) из строки кэша/батчера: VECTOR_DIM чисел вектора и логиты"""
+    if with_logits:
+        return Encoded(rows[..., :VECTOR_DIM], rows[..., VECTOR_DIM:], version)
+    return rows[..., :VECTOR_DIM]
+
+class EmbeddingBatcher:
+    """Очередь запросов на векторизацию с динамической группировкой в батчи.
+
+    Каждый вызов submit() кладет текст в очередь и сразу возвращает Future.
+    Прямой проход всегда дает и логиты тональности; with_logits=True разрешает
+    Future значением Encoded (вектор, логиты и версия модели) вместо одного вектора.
+    Фоновые потоки (не больше workers) забирают первый запрос из очереди, затем до
+    max_wait_ms добирают остальные (суммарно не больше max_batch_size текстов),
+    выполняют один прямой проход на весь батч и разрешают Future каждого запроса.
+    Очередь ограничена queue_size: при переполнении неблокирующая постановка
+    завершается исключением EmbedderSaturated. Запрос с профилем (профилируемый
+    запрос API или задача) проходит ту же очередь, но выполняется отдельным батчем
+    без кэша векторов под профайлерами - профиль содержит только его.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+        workers: int = EMBEDDING_WORKERS,
+        queue_size: int = EMBEDDING_QUEUE_SIZE,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _is_running(self):
+        return self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads)
+
+    def _ensure_started(self):
+        """Запуск фоновых потоков (повторно — в дочернем процессе после fork)"""
+        if self._is_running():
+            return
+
+        with self._lock:
+            if self._is_running():
+                return
+
+            if self._pid != os.getpid() or self._queue is None:
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._threads = []
+                self._pid = os.getpid()
+
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f"embedding-batcher-{len(self._threads)}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def qsize(self) -> int:
+        """Число запросов, ожидающих векторизации"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _enqueue(
+        self, texts: List[str], single: bool, block: bool, timeout: Optional[float], with_logits: bool,
+        profile=None
+    ) -> Future:
+        future = Future()
+        model = active_model
+        if single and model is not None and profile is None:
+            # Попадание в локальный кэш не требует очереди и фонового потока
+            row = embedding_cache.get_local(texts[0], model.path)
+            if row is not None:
+                future.set_result(_split_row(row, with_logits, model.version))
+                return future
+
+        self._ensure_started()
+        try:
+            self._queue.put(
+                (texts, future, single, with_logits, time.perf_counter(), profile), block=block, timeout=timeout
+            )
+        except queue.Full:
+            raise EmbedderSaturated(f"Очередь векторизации переполнена ({self.queue_size} запросов)")
+        return future
+
+    def submit(
+        self, text: str, block: bool = False, timeout: Optional[float] = None, with_logits: bool = False,
+        profile=None
+    ) -> Future:
+        """Постановка текста в очередь на векторизацию, Future разрешается вектором.
+
+        При block=False и переполненной очереди выбрасывает EmbedderSaturated,
+        при block=True ждет освобождения места (не дольше timeout). profile - профиль
+        запроса (app.services.profiling), в который пишется векторизация текста.
+        """
+        return self._enqueue([text], True, block, timeout, with_logits, profile)
+
+    def submit_many(
+        self, texts: List[str], block: bool = False, timeout: Optional[float] = None, with_logits: bool = False
+    ) -> List[Future]:
+        """Постановка списка текстов частями по max_batch_size.
+
+        Каждая часть занимает одно место в очереди и обрабатывается целиком в одном
+        прямом проходе, Future части разрешается матрицей векторов. Если очередь
+        переполнилась на середине, уже поставленные части отменяются.
+        """
+        futures = []
+        try:
+            for start in range(0, len(texts), self.max_batch_size):
+                futures.append(self._enqueue(texts[start:start + self.max_batch_size], False, block, timeout, with_logits))
+        except EmbedderSaturated:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def embed(self, text: str, timeout: Optional[float] = None, with_logits: bool = False, profile=None):
+        """Синхронное получение вектора (для Celery и скриптов), ожидает места в очереди"""
+        return self.submit(text, block=True, timeout=timeout, with_logits=with_logits, profile=profile).result(timeout)
+
+    def embed_many(self, texts: List[str], timeout: Optional[float] = None, with_logits: bool = False):
+        """Синхронная векторизация списка текстов батчами (для Celery), ожидает места в очереди"""
+        futures = self.submit_many(texts, block=True, timeout=timeout, with_logits=with_logits)
+        chunks = [future.result(timeout) for future in futures]
+        if with_logits:
+            # Части могут быть посчитаны разными версиями модели - Encoded для каждого текста
+            return [encoded for chunk in chunks for encoded in split_encoded(chunk)]
+        return np.concatenate(chunks)
+
+    async def aembed(self, text: str, with_logits: bool = False, profile=None):
+        """Асинхронное получение вектора без блокировки цикла событий (для FastAPI).
+
+        Не ждет места в очереди: при переполнении сразу выбрасывает EmbedderSaturated.
+        """
+        return await asyncio.wrap_future(self.submit(text, with_logits=with_logits, profile=profile))
+
+    async def aembed_many(self, texts: List[str], with_logits: bool = False) -> list:
+        """Асинхронная векторизация списка текстов.
+
+        Возвращает для каждого текста вектор (при with_logits - Encoded) или исключение,
+        возникшее при обработке его части, чтобы вызывающий код мог сообщить об ошибках
+        поэлементно.
+        """
+        futures = self.submit_many(texts, with_logits=with_logits)
+        chunks = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+
+        results = []
+        for start, chunk in zip(range(0, len(texts), self.max_batch_size), chunks):
+            size = min(self.max_batch_size, len(texts) - start)
+            if isinstance(chunk, BaseException):
+                results.extend([chunk] * size)
+            else:
+                results.extend(split_encoded(chunk) if with_logits else chunk)
+        return results
+
+    def _collect_batch(self, carry):
+        """Ожидание первого запроса и добор батча в пределах max_wait_ms.
+
+        Запрос, не поместившийся в батч по числу текстов, возвращается как carry
+        и открывает следующий батч. Запрос с профилем всегда составляет батч один.
+        """
+        batch = [carry if carry is not None else self._queue.get()]
+        if batch[0][5] is not None:
+            return batch, None
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    job = self._queue.get(timeout=remaining)
+                else:
+                    # Время ожидания истекло — забираем только то, что уже в очереди
+                    job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if job[5] is not None or size + len(job[0]) > self.max_batch_size:
+                return batch, job
+            batch.append(job)
+            size += len(job[0])
+
+        return batch, None
+
+    def _encode_cached(self, texts: List[str]) -> Tuple[np.ndarray, str]:
+        """Векторизация батча: найденные в кэше тексты не проходят через модель.
+
+        Весь батч обрабатывается одной версией модели. Возвращает строки из вектора
+        и логитов тональности (как в кэше) и версию модели.
+        """
+        model = current_model()
+        cached = embedding_cache.get_many(texts, model.path)
+        missing = [position for position in range(len(texts)) if position not in cached]
+        if not missing:
+            return np.stack([cached[position] for position in range(len(texts))]), model.version
+
+        computed = np.hstack(encode_batch([texts[position] for position in missing], with_logits=True, model=model))
+        embedding_cache.set_many([texts[position] for position in missing], computed, model.path)
+        if not cached:
+            return computed, model.version
+
+        vectors = np.empty((len(texts), computed.shape[1]), dtype=np.float32)
+        vectors[missing] = computed
+        for position, vector in cached.items():
+            vectors[position] = vector
+        return vectors, model.version
+
+    def _encode_profiled(self, texts: List[str], profile) -> Tuple[np.ndarray, str]:
+        """Векторизация батча профилируемого запроса: без кэша, под профайлерами в потоке батчера"""
+        model = current_model()
+        with profile_section("embedding", profile):
+            return np.hstack(encode_batch(texts, with_logits=True, model=model)), model.version
+
+    def _run(self):
+        """Основной цикл фонового потока"""
+        carry = None
+        while True:
+            batch, carry = self._collect_batch(carry)
+
+            # Пропускаем запросы, которые были отменены, пока ждали в очереди
+            batch = [job for job in batch if job[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            dequeued = time.perf_counter()
+            for job in batch:
+                STAGE_SECONDS.labels("embedding_queue_wait").observe(dequeued - job[4])
+            texts = [text for job_texts, _, _, _, _, _ in batch for text in job_texts]
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            profile = batch[0][5]
+            try:
+                if profile is not None:
+                    rows, version = self._encode_profiled(texts, profile)
+                else:
+                    rows, version = self._encode_cached(texts)
+            except Exception as e:
+                print(f"Ошибка векторизации батча из {len(texts)} текстов: {e}")
+                for _, future, _, _, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for job_texts, future, single, with_logits, _, _ in batch:
+                job_rows = rows[offset:offset + len(job_texts)]
+                offset += len(job_texts)
+                future.set_result(_split_row(job_rows[0] if single else job_rows, with_logits, version))
+
+# Общий экземпляр для FastAPI и Celery
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,225 @@
+# Бэкенды инференса энкодера DistilBERT
+
+import os
+import json
+import struct
+
+import numpy as np
+import torch
+from transformers import DistilBertConfig, DistilBertForSequenceClassification
+from transformers.modeling_utils import no_init_weights
+
+# Бэкенд инференса: torch (fp32), torch-int8 (динамическая квантизация PyTorch),
+# onnx (ONNX Runtime fp32) или onnx-int8 (ONNX Runtime с квантизованными весами)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+# Число потоков ONNX Runtime внутри одного прямого прохода (0 - по числу ядер)
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+
+# Веса torch-бэкенда из model.safetensors через mmap (MAP_PRIVATE): страницы весов лежат
+# в page cache и общие для всех процессов узла (API, воркеры Celery, populate_db),
+# а не копируются в память каждого процесса. Файл создается из pytorch_model.bin автоматически
+MODEL_SHARED_WEIGHTS = os.getenv("MODEL_SHARED_WEIGHTS", "0") == "1"
+SAFETENSORS_FILE = "model.safetensors"
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model-int8.onnx"}
+
+def onnx_path(model_path: str, backend: str = "onnx") -> str:
+    """Путь к экспортированной ONNX-модели внутри директории модели"""
+    return os.path.join(model_path, ONNX_SUBDIR, ONNX_FILES[backend])
+
+class ClsEncoder(torch.nn.Module):
+    """Обертка для экспорта: только энкодер DistilBERT и CLS-вектор последнего слоя"""
+
+    def __init__(self, model: DistilBertForSequenceClassification):
+        super().__init__()
+        self.distilbert = model.distilbert
+
+    def forward(self, input_ids, attention_mask):
+        return self.distilbert(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state[:, 0, :]
+
+def ensure_safetensors(model_path: str) -> str:
+    """Путь к model.safetensors; при отсутствии файл создается из pytorch_model.bin"""
+    path = os.path.join(model_path, SAFETENSORS_FILE)
+    if not os.path.exists(path):
+        from safetensors.torch import save_file
+
+        print(f"Конвертация весов в {SAFETENSORS_FILE}...")
+        state = torch.load(os.path.join(model_path, "pytorch_model.bin"), map_location="cpu")
+        # Временный файл и атомарная замена: несколько процессов могут конвертировать одновременно
+        temporary = f"{path}.{os.getpid()}.tmp"
+        save_file({name: tensor.contiguous() for name, tensor in state.items()}, temporary, metadata={"format": "pt"})
+        os.replace(temporary, path)
+    return path
+
+def mmap_state_dict(path: str) -> dict:
+    """Тензоры safetensors-файла как представления одного отображения файла в память (без копирования)"""
+    with open(path, "rb") as file:
+        header_size = struct.unpack("<Q", file.read(8))[0]
+        header = json.loads(file.read(header_size))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(path, False, os.path.getsize(path))
+    data_start = 8 + header_size
+    state = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        element_size = torch.empty((), dtype=dtype).element_size()
+        offset = data_start + info["data_offsets"][0]
+        if offset % element_size:
+            raise ValueError(f"Тензор {name} в {path} не выровнен по размеру элемента")
+        shape = tuple(info["shape"])
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(storage, offset // element_size, shape, torch.empty(shape, device="meta").stride())
+        state[name] = tensor
+    return state
+
+def load_shared_model(model_path: str) -> DistilBertForSequenceClassification:
+    """Модель, параметры которой ссылаются на отображенный в память model.safetensors"""
+    config = DistilBertConfig.from_pretrained(model_path, local_files_only=True)
+    with no_init_weights():
+        model = DistilBertForSequenceClassification(config)
+
+    state = mmap_state_dict(ensure_safetensors(model_path))
+    missing = set(name for name, _ in model.named_parameters()) - set(state)
+    if missing:
+        raise ValueError(f"В {SAFETENSORS_FILE} нет параметров: {', '.join(sorted(missing))}")
+
+    # Параметры заменяются представлениями файла; прежние (неинициализированные) освобождаются
+    for name, tensor in state.items():
+        module_name, _, attribute = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attribute in module._parameters:
+            module._parameters[attribute] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attribute in module._buffers:
+            module._buffers[attribute] = tensor
+    return model.eval()
+
+class SentimentHead:
+    """Классификационная голова дообученной модели (pre_classifier + classifier) на numpy.
+
+    Веса читаются из model.safetensors; голова применяется к CLS-векторам, уже
+    посчитанным энкодером (ONNX-граф возвращает только CLS-вектор), и к сохраненным
+    векторам старых строк без повторного прохода энкодера
+    """
+
+    def __init__(self, model_path: str):
+        from safetensors import safe_open
+
+        with safe_open(ensure_safetensors(model_path), framework="np") as weights:
+            self.pre_weight = weights.get_tensor("pre_classifier.weight").astype(np.float32)
+            self.pre_bias = weights.get_tensor("pre_classifier.bias").astype(np.float32)
+            self.weight = weights.get_tensor("classifier.weight").astype(np.float32)
+            self.bias = weights.get_tensor("classifier.bias").astype(np.float32)
+
+    def logits(self, vectors: np.ndarray) -> np.ndarray:
+        hidden = np.maximum(vectors @ self.pre_weight.T + self.pre_bias, 0)
+        return hidden @ self.weight.T + self.bias
+
+class TorchEncoder:
+    """PyTorch в режиме eager, веса fp32"""
+
+    name = "torch"
+    # cls - CLS-вектор последнего слоя, tokens - среднее скрытых состояний токенов без паддинга
+    poolings = ("cls", "tokens")
+
+    def __init__(self, model: DistilBertForSequenceClassification):
+        self.model = model
+
+    def encode(self, inputs, pooling: str = "cls") -> np.ndarray:
+        return self.encode_with_logits(inputs, pooling, logits=False)[0]
+
+    def encode_with_logits(self, inputs, pooling: str = "cls", logits: bool = True):
+        """Векторы и логиты тональности из одного прямого прохода (logits=False - только векторы).
+
+        Логиты считает классификационная голова модели по CLS-состоянию последнего слоя,
+        как в DistilBertForSequenceClassification.forward.
+        """
+        with torch.no_grad():
+            outputs = self.model.distilbert(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+            hidden = outputs.last_hidden_state
+            cls = hidden[:, 0, :]
+            if pooling == "tokens":
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            else:
+                pooled = cls
+            classes = None
+            if logits:
+                classes = self.model.classifier(torch.relu(self.model.pre_classifier(cls)))
+                classes = classes.numpy().astype(np.float32, copy=False)
+            return pooled.numpy().astype(np.float32, copy=False), classes
+
+class QuantizedTorchEncoder(TorchEncoder):
+    """PyTorch с динамической int8-квантизацией линейных слоев"""
+
+    name = "torch-int8"
+
+    def __init__(self, model: DistilBertForSequenceClassification):
+        super().__init__(torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8))
+
+class OnnxEncoder:
+    """ONNX Runtime на CPU (модель экспортируется scripts/export_onnx.py)"""
+
+    # Экспортированный граф возвращает только CLS-вектор
+    poolings = ("cls",)
+
+    def __init__(self, path: str, name: str = "onnx", model_path: str = None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("Для бэкенда ONNX необходим пакет onnxruntime (pip install onnxruntime)")
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX-модель не найдена по пути {path}. Выполните python scripts/export_onnx.py")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        self.name = name
+        self.model_path = model_path or os.path.dirname(os.path.dirname(path))
+        self.head = None
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, inputs, pooling: str = "cls") -> np.ndarray:
+        if pooling not in self.poolings:
+            raise ValueError(f"Бэкенд {self.name} поддерживает только пулинг: {', '.join(self.poolings)}")
+        feed = {
+            "input_ids": inputs["input_ids"].numpy().astype(np.int64, copy=False),
+            "attention_mask": inputs["attention_mask"].numpy().astype(np.int64, copy=False),
+        }
+        return self.session.run(None, feed)[0].astype(np.float32, copy=False)
+
+    def encode_with_logits(self, inputs, pooling: str = "cls", logits: bool = True):
+        """Векторы и логиты тональности: голова на numpy применяется к CLS-выходу графа"""
+        vectors = self.encode(inputs, pooling)
+        if not logits:
+            return vectors, None
+        if self.head is None:
+            self.head = SentimentHead(self.model_path)
+        return vectors, self.head.logits(vectors).astype(np.float32, copy=False)
+
+def create_encoder(model_path: str, backend: str = ENCODER_BACKEND):
+    """Создание энкодера выбранного бэкенда для модели из model_path"""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд энкодера: {backend}. Допустимые значения: {', '.join(ENCODER_BACKENDS)}")
+
+    if backend in ONNX_FILES:
+        return OnnxEncoder(onnx_path(model_path, backend), backend, model_path)
+
+    if backend == "torch" and MODEL_SHARED_WEIGHTS:
+        return TorchEncoder(load_shared_model(model_path))
+
+    model = DistilBertForSequenceClassification.from_pretrained(model_path, local_files_only=True)
+    model.eval()
+    if backend == "torch-int8":
+        return QuantizedTorchEncoder(model)
+    return TorchEncoder(model)
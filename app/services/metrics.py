@@ -0,0 +1,138 @@
+# Метрики Prometheus и request id: этапы обработки запроса, батчи, кэши, модель и пулы соединений
+
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    start_http_server
+)
+
+# Каталог файлов метрик для нескольких процессов (prefork-пул Celery, несколько воркеров uvicorn).
+# Без него каждый процесс отдает только свои метрики. Каталог очищается скриптом запуска: файлы
+# процессов прошлого запуска иначе попадут в сумму
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+# Порт HTTP-сервера метрик воркера Celery
+CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", "9808"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Этапы обработки запроса (значения метки stage):
+# queue_wait - ожидание задачи в брокере Celery, embedding_queue_wait - ожидание в очереди векторизации,
+# tokenize, infer - токенизация и прямой проход батча, db_query - запрос к PostgreSQL,
+# index_search - поиск во векторном индексе в памяти, serialize - от готового результата до ответа
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram(
+    "imdb_stage_seconds", "Длительность этапа обработки запроса", ["stage"], buckets=STAGE_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "imdb_http_request_seconds", "Длительность HTTP-запроса к API", ["method", "route", "status"],
+    buckets=STAGE_BUCKETS
+)
+CELERY_TASK_SECONDS = Histogram(
+    "imdb_celery_task_seconds", "Длительность выполнения задачи Celery", ["task", "state"], buckets=STAGE_BUCKETS
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "imdb_embedding_batch_size", "Текстов в батче векторизации", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+CACHE_REQUESTS = Counter("imdb_cache_requests_total", "Обращения к кэшам по результату", ["cache", "result"])
+CACHE_HIT_RATIO = Gauge(
+    "imdb_cache_hit_ratio", "Доля попаданий в кэш с запуска процесса", ["cache"], multiprocess_mode="liveall"
+)
+EMBEDDING_QUEUE_SIZE = Gauge(
+    "imdb_embedding_queue_size", "Запросов в очереди векторизации", multiprocess_mode="livesum"
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "imdb_model_load_seconds", "Время загрузки модели, обслуживающей запросы", ["version"],
+    multiprocess_mode="liveall"
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "imdb_db_pool_connections", "Соединения пула: in_use, idle и capacity (pool_size + max_overflow)",
+    ["engine", "state"], multiprocess_mode="livesum"
+)
+
+# Состояние текущего запроса API или задачи Celery: request id и момент готовности результата.
+# Изменяемый словарь, а не отдельные значения: изменения из дочерних задач asyncio видны middleware
+_request_state: ContextVar[Optional[dict]] = ContextVar("request_state", default=None)
+
+def begin_request(request_id: Optional[str] = None) -> dict:
+    """Начало обработки запроса или задачи: request id из заголовка или новый"""
+    state = {"request_id": request_id or uuid.uuid4().hex, "result_ready_at": None}
+    _request_state.set(state)
+    return state
+
+def current_request() -> Optional[dict]:
+    """Состояние текущего запроса или задачи (None вне запроса)"""
+    return _request_state.get()
+
+def current_request_id() -> Optional[str]:
+    state = _request_state.get()
+    return state["request_id"] if state is not None else None
+
+def result_ready(result):
+    """Отметка готовности результата обработчика или задачи: дальше остается только сериализация"""
+    state = _request_state.get()
+    if state is not None:
+        state["result_ready_at"] = time.perf_counter()
+    return result
+
+def observe_serialization(state: Optional[dict]):
+    if state is not None and state["result_ready_at"] is not None:
+        STAGE_SECONDS.labels("serialize").observe(time.perf_counter() - state["result_ready_at"])
+
+@contextmanager
+def stage(name: str):
+    """Замер длительности этапа в imdb_stage_seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+def refresh_gauges():
+    """Значения, которые читаются из объектов процесса: очередь векторизации, кэши и пулы соединений"""
+    from app.dependencies import DB_MAX_OVERFLOW, async_engine, sync_engine
+    from app.services.cache import result_cache
+    from app.services.embedding import embedding_batcher, embedding_cache
+
+    EMBEDDING_QUEUE_SIZE.set(embedding_batcher.qsize())
+
+    stats = embedding_cache.stats()
+    hits = stats["local_hits"] + stats["redis_hits"]
+    CACHE_HIT_RATIO.labels("embedding").set(hits / max(1, hits + stats["misses"]))
+    stats = result_cache.stats()
+    CACHE_HIT_RATIO.labels("result").set(stats["hits"] / max(1, stats["hits"] + stats["misses"]))
+
+    for name, pool in (("async", async_engine.sync_engine.pool), ("sync", sync_engine.pool)):
+        DB_POOL_CONNECTIONS.labels(name, "in_use").set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels(name, "idle").set(pool.checkedin())
+        DB_POOL_CONNECTIONS.labels(name, "capacity").set(pool.size() + DB_MAX_OVERFLOW)
+
+def _registry():
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Метрики в текстовом формате Prometheus и их Content-Type (для /metrics)"""
+    refresh_gauges()
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+def start_metrics_server(port: int = CELERY_METRICS_PORT):
+    """HTTP-сервер метрик процесса без FastAPI (главный процесс воркера Celery)"""
+    start_http_server(port, registry=_registry())
+    print(f"Метрики Prometheus воркера: http://0.0.0.0:{port}/metrics")
+
+def mark_process_dead(pid: int):
+    """Удаление метрик live-режима завершенного дочернего процесса"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,101 @@
+# Версии дообученной модели: каталоги версий и атомарный указатель на текущую
+
+import os
+import re
+import shutil
+from typing import List, Optional, Tuple
+
+from app.services.cache import model_fingerprint
+
+# Каталог версий модели: <каталог>/<версия>/ с файлами модели и файл current с именем
+# текущей версии. Пока current нет, используется LEGACY_MODEL_PATH - каталог, в который
+# сохраняет модель ml/train.py
+MODEL_REPOSITORY = os.getenv("MODEL_REPOSITORY", "./model_versions")
+LEGACY_MODEL_PATH = "./fine_tuned_model"
+CURRENT_FILE = "current"
+
+# Файлы, без которых модель не считается готовой
+REQUIRED_MODEL_FILES = (
+    "config.json",
+    "pytorch_model.bin",
+    "special_tokens_map.json",
+    "tokenizer_config.json",
+    "vocab.txt",
+)
+
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+
+def model_files_ready(model_path: str) -> bool:
+    """Есть ли в каталоге все непустые файлы модели"""
+    if not os.path.isdir(model_path):
+        return False
+    for file_name in REQUIRED_MODEL_FILES:
+        file_path = os.path.join(model_path, file_name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            return False
+    return True
+
+def version_path(version: str, repository: str = MODEL_REPOSITORY) -> str:
+    if not VERSION_PATTERN.match(version):
+        raise ValueError(f"Некорректное имя версии модели: {version}")
+    return os.path.join(repository, version)
+
+def legacy_version() -> str:
+    """Версия модели без каталога версий: по отпечатку файлов модели в LEGACY_MODEL_PATH"""
+    return f"legacy-{model_fingerprint(LEGACY_MODEL_PATH, files=REQUIRED_MODEL_FILES)[:12]}"
+
+def current_version(repository: str = MODEL_REPOSITORY) -> Tuple[str, str]:
+    """(версия, каталог) текущей модели по указателю current"""
+    try:
+        with open(os.path.join(repository, CURRENT_FILE), encoding="utf-8") as pointer:
+            version = pointer.read().strip()
+    except FileNotFoundError:
+        return legacy_version(), LEGACY_MODEL_PATH
+    return version, version_path(version, repository)
+
+def list_versions(repository: str = MODEL_REPOSITORY) -> List[str]:
+    """Опубликованные версии (каталоги с готовыми файлами модели)"""
+    if not os.path.isdir(repository):
+        return []
+    return sorted(
+        name for name in os.listdir(repository)
+        if VERSION_PATTERN.match(name) and model_files_ready(os.path.join(repository, name))
+    )
+
+def activate(version: str, repository: str = MODEL_REPOSITORY):
+    """Атомарная смена текущей версии: новый указатель записывается во временный файл и заменяет старый"""
+    if not model_files_ready(version_path(version, repository)):
+        raise FileNotFoundError(f"Версия модели {version} не найдена или неполна в {repository}")
+    target = os.path.join(repository, CURRENT_FILE)
+    temporary = f"{target}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as pointer:
+        pointer.write(version)
+        pointer.flush()
+        os.fsync(pointer.fileno())
+    os.replace(temporary, target)
+
+def publish(
+    source: str,
+    version: Optional[str] = None,
+    repository: str = MODEL_REPOSITORY,
+    make_current: bool = True
+) -> str:
+    """Копирование модели из source в новый каталог версии и (по умолчанию) переключение на нее.
+
+    Каталог копируется под временным именем и переименовывается целиком, поэтому
+    процессы никогда не видят версию с частью файлов. Опубликованная версия не меняется.
+    """
+    if not model_files_ready(source):
+        raise FileNotFoundError(f"В {source} нет готовой модели")
+    version = version or f"v-{model_fingerprint(source, files=REQUIRED_MODEL_FILES)[:12]}"
+    target = version_path(version, repository)
+    if os.path.exists(target):
+        raise FileExistsError(f"Версия модели {version} уже опубликована")
+
+    os.makedirs(repository, exist_ok=True)
+    temporary = os.path.join(repository, f".{version}.{os.getpid()}.tmp")
+    shutil.copytree(source, temporary)
+    os.rename(temporary, target)
+    if make_current:
+        activate(version, repository)
+    return version
@@ -0,0 +1,178 @@
+# Профилирование отдельных запросов: cProfile, профайлер PyTorch и EXPLAIN (ANALYZE, BUFFERS) поиска
+
+import os
+import re
+import json
+import time
+import pstats
+import random
+import shutil
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from torch.profiler import ProfilerActivity, profile as torch_profile
+
+from app.services.metrics import current_request
+
+# Каталог профилей: по каталогу на запрос или задачу
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Доля запросов и задач, профилируемых без заголовка (0 - только по заголовку X-Profile)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Включение профилирования заголовком X-Profile: 1. По умолчанию выключено: иначе любой клиент
+# может включить профайлеры и EXPLAIN ANALYZE на рабочих запросах
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "0") == "1"
+# Сколько последних профилей хранить; более старые удаляются при сохранении нового
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "100"))
+# Строк в текстовых отчетах cProfile и PyTorch
+PROFILE_TOP_ROWS = int(os.getenv("PROFILE_TOP_ROWS", "40"))
+
+PROFILE_HEADER = "X-Profile"
+
+# cProfile и профайлер PyTorch не допускают одновременных сессий в процессе:
+# участок запроса, начавшийся во время другого профилирования, выполняется без профайлеров
+_profiler_lock = threading.Lock()
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (ANALYZE, BUFFERS) для запроса SQLAlchemy с теми же параметрами"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (ANALYZE, BUFFERS) " + compiler.process(element.statement, **kw)
+
+class RequestProfile:
+    """Отчеты профилирования одного запроса или задачи (каталог в PROFILE_DIR)"""
+
+    def __init__(self, request_id: str, reason: str):
+        # request id приходит из заголовка: в имени каталога остаются только безопасные символы
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", request_id)[:64]
+        self.name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}_{safe_id}"
+        self.path = os.path.join(PROFILE_DIR, self.name)
+        self.request_id = request_id
+        self.reason = reason
+        self.sections = {}
+        self.explains = 0
+        self.notes = []
+
+    def file(self, filename: str) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, filename)
+
+    def add_section(self, name: str, elapsed: float, profiler: cProfile.Profile, torch_result=None):
+        """Отчеты участка: name.prof (pstats, snakeviz), name.txt и для PyTorch - таблица операторов и трасса"""
+        self.sections[name] = round(elapsed, 4)
+        profiler.dump_stats(self.file(f"{name}.prof"))
+        with open(self.file(f"{name}.txt"), "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP_ROWS)
+        # При бэкенде ONNX Runtime операторов PyTorch нет - отчеты не нужны
+        if torch_result is not None and len(torch_result.key_averages()):
+            with open(self.file(f"{name}.torch.txt"), "w", encoding="utf-8") as f:
+                f.write(torch_result.key_averages().table(sort_by="self_cpu_time_total", row_limit=PROFILE_TOP_ROWS))
+            torch_result.export_chrome_trace(self.file(f"{name}.trace.json"))
+
+    def add_explain(self, statement, plan_rows):
+        self.explains += 1
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        with open(self.file(f"explain_{self.explains}.txt"), "w", encoding="utf-8") as f:
+            f.write(sql + "\n\n" + "\n".join(row[0] for row in plan_rows) + "\n")
+
+def start_profile(header_value: Optional[str] = None, forced: bool = False) -> Optional[RequestProfile]:
+    """Профиль текущего запроса, если профилирование запрошено заголовком, задачей API или выборкой"""
+    state = current_request()
+    if state is None:
+        return None
+    if forced:
+        reason = "task"
+    elif PROFILE_HEADER_ENABLED and (header_value or "").lower() in ("1", "true", "yes"):
+        reason = "header"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        reason = "sample"
+    else:
+        return None
+    state["profile"] = RequestProfile(state["request_id"], reason)
+    return state["profile"]
+
+def active_profile() -> Optional[RequestProfile]:
+    """Профиль текущего запроса или задачи (None, если запрос не профилируется)"""
+    state = current_request()
+    return state.get("profile") if state is not None else None
+
+@contextmanager
+def profile_section(name: str, profile: Optional[RequestProfile] = None):
+    """cProfile и профайлер PyTorch вокруг участка профилируемого запроса (в текущем потоке).
+
+    profile - профиль запроса, если участок выполняется вне его контекста (поток батчера векторизации).
+    """
+    profile = profile or active_profile()
+    if profile is None:
+        yield
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        profile.notes.append(f"{name}: без профайлеров - в процессе профилируется другой запрос")
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    torch_result = None
+    started = time.perf_counter()
+    try:
+        with torch_profile(activities=[ProfilerActivity.CPU], record_shapes=True) as torch_result:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+    finally:
+        try:
+            profile.add_section(name, time.perf_counter() - started, profiler, torch_result)
+        except Exception as e:
+            print(f"Не удалось сохранить профиль {name} [{profile.request_id}]: {e}")
+        finally:
+            _profiler_lock.release()
+
+def explain_sync(session, statement, params: dict):
+    """EXPLAIN (ANALYZE, BUFFERS) поискового запроса профилируемого запроса через синхронную сессию"""
+    profile = active_profile()
+    if profile is not None:
+        profile.add_explain(statement, session.execute(Explain(statement), params).all())
+
+async def explain(session, statement, params: dict):
+    """EXPLAIN (ANALYZE, BUFFERS) поискового запроса профилируемого запроса через асинхронную сессию"""
+    profile = active_profile()
+    if profile is not None:
+        profile.add_explain(statement, (await session.execute(Explain(statement), params)).all())
+
+def save_profile(profile: RequestProfile, **meta):
+    """Запись meta.json профиля и удаление самых старых профилей сверх PROFILE_MAX_COUNT"""
+    try:
+        with open(profile.file("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "request_id": profile.request_id,
+                "reason": profile.reason,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "pid": os.getpid(),
+                "sections_s": profile.sections,
+                "explains": profile.explains,
+                "notes": profile.notes,
+                **meta,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"🔍 Профиль запроса [{profile.request_id}] сохранен: {profile.path}")
+    except OSError as e:
+        print(f"Не удалось сохранить профиль [{profile.request_id}]: {e}")
+        return
+
+    # Имена каталогов начинаются с времени создания, поэтому сортировка по имени - по возрасту.
+    # Профили пишут несколько процессов: каталог мог быть удален параллельно
+    names = sorted(os.listdir(PROFILE_DIR))
+    for name in names[:max(0, len(names) - PROFILE_MAX_COUNT)]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, name), ignore_errors=True)
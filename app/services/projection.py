@@ -0,0 +1,151 @@
+# Проекция векторов в пространство меньшей размерности (PCA или случайная ортогональная)
+
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from app.models.review import PROJECTION_DIM, VECTOR_DIM
+from app.services.model_registry import current_version
+
+# Файл проекции (артефакт scripts/project_vectors.py fit); пустое значение - проекция отключена.
+# Имя файла без каталога ищется среди проекций активной версии модели. При включенной
+# проекции новые отзывы сохраняются и со столбцом vector_reduced
+PROJECTION_PATH = os.getenv("PROJECTION_PATH", "")
+
+# Как часто сверять активную версию модели (секунды): проекция другой модели не применяется
+MODEL_CHECK_INTERVAL = 1.0
+
+PROJECTION_METHODS = ("pca", "random")
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class Projection:
+    """Линейная проекция x -> (x / |x| - mean) @ components.
+
+    Векторы нормируются до проекции, поэтому косинусное расстояние в новом
+    пространстве приближает косинусное расстояние исходных векторов.
+    Версия - имя файла артефакта; она сохраняется вместе с каждым вектором,
+    чтобы миграция могла найти строки, спроецированные другой версией.
+    model_version - версия модели, векторы которой проецируются.
+    """
+
+    def __init__(
+        self, mean: np.ndarray, components: np.ndarray, method: str, version: str = "", model_version: str = ""
+    ):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.method = method
+        self.version = version
+        self.model_version = model_version
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[1]
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """Проекция одного вектора или матрицы векторов (по строкам)"""
+        vectors = _unit_rows(np.asarray(vectors, dtype=np.float32))
+        return ((vectors - self.mean) @ self.components).astype(np.float32, copy=False)
+
+    @classmethod
+    def fit_pca(cls, sample: np.ndarray, dim: int) -> "Projection":
+        """Главные компоненты нормированной выборки векторов корпуса"""
+        sample = _unit_rows(np.asarray(sample, dtype=np.float32))
+        if len(sample) < dim:
+            raise ValueError(f"Для PCA в {dim} измерений нужно не меньше {dim} векторов, получено {len(sample)}")
+        mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        return cls(mean, vt[:dim].T, "pca")
+
+    @classmethod
+    def fit_random(cls, dim: int, source_dim: int = VECTOR_DIM, seed: int = 0) -> "Projection":
+        """Случайная ортогональная проекция (не зависит от данных)"""
+        gaussian = np.random.default_rng(seed).standard_normal((source_dim, dim))
+        components, _ = np.linalg.qr(gaussian)
+        return cls(np.zeros(source_dim, dtype=np.float32), components, "random")
+
+    def save(self, directory: Optional[str] = None) -> str:
+        """Сохранение новой версии артефакта (по умолчанию среди проекций активной модели), возвращает путь"""
+        directory = directory or projections_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.version = f"{self.method}-{self.dim}-{time.strftime('%Y%m%d%H%M%S')}"
+        path = os.path.join(directory, f"{self.version}.npz")
+        np.savez(
+            path, mean=self.mean, components=self.components, method=self.method, model_version=self.model_version
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path) as data:
+            version = os.path.splitext(os.path.basename(path))[0]
+            # Артефакты без версии модели сохранены до реестра моделей
+            model_version = str(data["model_version"]) if "model_version" in data.files else ""
+            return cls(data["mean"], data["components"], str(data["method"]), version, model_version)
+
+def projections_dir(model_path: Optional[str] = None) -> str:
+    """Каталог версий проекции в каталоге модели (по умолчанию активной версии из реестра)"""
+    return os.path.join(model_path or current_version()[1], "projections")
+
+def projection_path(path: str = PROJECTION_PATH, model_path: Optional[str] = None) -> str:
+    """Файл проекции path; имя без каталога - среди проекций модели model_path"""
+    if os.path.dirname(path):
+        return path
+    return os.path.join(projections_dir(model_path), path)
+
+def load_projection(model_version: str, model_path: str, path: str = PROJECTION_PATH) -> Projection:
+    """Проекция из path для модели model_version (ошибка, если она обучена для другой)"""
+    projection = Projection.load(projection_path(path, model_path))
+    if projection.dim != PROJECTION_DIM:
+        raise ValueError(
+            f"Размерность проекции {projection.version} ({projection.dim}) "
+            f"не совпадает с PROJECTION_DIM ({PROJECTION_DIM})"
+        )
+    if projection.model_version != model_version:
+        raise ValueError(
+            f"Проекция {projection.version} обучена на векторах модели "
+            f"{projection.model_version or 'неизвестной версии'}, а активна {model_version}: "
+            f"обучите проекцию для нее (scripts/project_vectors.py fit)"
+        )
+    return projection
+
+_projection = None
+_checked_at = 0.0
+_projection_lock = threading.Lock()
+
+def get_projection() -> Optional[Projection]:
+    """Проекция из PROJECTION_PATH для активной версии модели или None, если проекция отключена.
+
+    Раз в MODEL_CHECK_INTERVAL секунд сверяется указатель реестра моделей: после активации
+    другой версии проекция загружается заново, а обученная для прежней модели не применяется.
+    """
+    global _projection, _checked_at
+
+    if not PROJECTION_PATH:
+        return None
+    if _projection is None or time.monotonic() - _checked_at >= MODEL_CHECK_INTERVAL:
+        with _projection_lock:
+            if _projection is None or time.monotonic() - _checked_at >= MODEL_CHECK_INTERVAL:
+                model_version, model_path = current_version()
+                if _projection is None or _projection.model_version != model_version:
+                    _projection = None
+                    _projection = load_projection(model_version, model_path, PROJECTION_PATH)
+                    print(f"Проекция векторов загружена: {_projection.version} (модель {model_version})")
+                _checked_at = time.monotonic()
+    return _projection
+
+def projected_columns(embeddings: np.ndarray) -> dict:
+    """Значения столбцов vector_reduced и projection_version для вставки.
+
+    embeddings - один вектор или матрица; при выключенной проекции возвращает пустой словарь.
+    """
+    projection = get_projection()
+    if projection is None:
+        return {}
+    return {"vector_reduced": projection.apply(embeddings), "projection_version": projection.version}
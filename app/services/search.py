@@ -0,0 +1,640 @@
+# Поиск похожих отзывов в pgvector или в векторном индексе процесса
+
+import os
+import json
+import base64
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import (
+    DateTime, Float, Integer, String, Text, and_, bindparam, cast, column, func, literal, literal_column, or_,
+    select, text, true
+)
+from sqlalchemy.dialects.postgresql import ARRAY, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.review import (
+    Review, NativeVector, PROJECTION_DIM, SENTIMENT_LABELS, TEXT_SEARCH_CONFIG, VECTOR_DIM, VECTOR_INDEX_TYPE,
+    VECTOR_STORAGE, compact_distance
+)
+from app.services.projection import get_projection
+from app.services.cache import corpus_generation, result_cache
+from app.services.metrics import stage
+from app.services.profiling import active_profile, explain, explain_sync
+from app.services.vector_index import (
+    SEARCH_BACKEND, search_in_memory, search_in_memory_sync, search_in_memory_many, search_in_memory_many_sync
+)
+
+def _optional_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# Параметры точности ANN-поиска по умолчанию (None - значение сервера PostgreSQL):
+# hnsw.ef_search - размер списка кандидатов HNSW, ivfflat.probes - число просматриваемых кластеров
+HNSW_EF_SEARCH = _optional_int("HNSW_EF_SEARCH")
+IVFFLAT_PROBES = _optional_int("IVFFLAT_PROBES")
+
+# Значение hnsw.ef_search на сервере по умолчанию
+HNSW_DEFAULT_EF_SEARCH = 40
+
+# Для компактного представления (VECTOR_STORAGE halfvec или binary): во сколько раз больше
+# кандидатов, чем k, отбирается по компактному индексу перед точным переранжированием
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "10"))
+
+# Гибридный поиск (векторный + полнотекстовый): сколько кандидатов дает каждый из двух
+# списков, константа reciprocal rank fusion и вес векторного списка по умолчанию (0..1)
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.5"))
+
+# Нормализация ts_rank_cd: деление на 1 + логарифм длины документа - как нормализация
+# длины в BM25, длинные отзывы не получают преимущества только за счет объема
+TEXT_RANK_NORMALIZATION = 1
+
+# Итеративное сканирование индекса (pgvector >= 0.8) для поиска с фильтрами и постраничного
+# поиска: если после фильтра строк меньше нужного, индекс продолжает выдачу, а не
+# возвращает неполный список. Для HNSW - strict_order или relaxed_order, для IVFFlat
+# всегда relaxed_order; off - не включать (для pgvector старее 0.8)
+SEARCH_ITERATIVE_SCAN = os.getenv("SEARCH_ITERATIVE_SCAN", "strict_order")
+
+# Фильтры по метаданным: имя фильтра -> условие на столбец reviews и тип параметра.
+# sentiment подставляется в SQL литералом (значение из SENTIMENT_LABELS), чтобы планировщик
+# мог выбрать частичный индекс VECTOR_PARTIAL_INDEXES; остальные передаются параметрами
+FILTERS = {
+    "source": (lambda value: Review.source == value, String),
+    "min_length": (lambda value: Review.text_length >= value, Integer),
+    "max_length": (lambda value: Review.text_length <= value, Integer),
+    "created_after": (lambda value: Review.created_at >= value, DateTime(timezone=True)),
+    "created_before": (lambda value: Review.created_at < value, DateTime(timezone=True)),
+}
+
+_set_local = text("SELECT set_config(:name, :value, true)")
+
+def candidates_count(k: int, storage: str = VECTOR_STORAGE) -> int:
+    """Сколько строк должен вернуть ANN-индекс, чтобы после переранжирования осталось k"""
+    return k if storage == "full" else k * max(1, VECTOR_RERANK_FACTOR)
+
+def hybrid_candidates(k: int) -> int:
+    """Размер каждого из списков кандидатов гибридного поиска"""
+    return max(k, HYBRID_CANDIDATES)
+
+def search_settings(
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    storage: str = VECTOR_STORAGE,
+    iterative: bool = False
+) -> dict:
+    """Настройки ANN-поиска для текущей транзакции.
+
+    HNSW возвращает не больше ef_search строк, поэтому ef_search не опускается ниже
+    числа кандидатов (k, умноженного на VECTOR_RERANK_FACTOR для компактного представления).
+    iterative - поиск с фильтрами или курсором, включается итеративное сканирование.
+    """
+    ef_search = ef_search or HNSW_EF_SEARCH
+    probes = probes or IVFFLAT_PROBES
+    k = candidates_count(k, storage)
+    if storage != "full":
+        ef_search = ef_search or HNSW_DEFAULT_EF_SEARCH
+
+    settings = {}
+    if ef_search:
+        settings["hnsw.ef_search"] = str(max(ef_search, k))
+    if probes:
+        settings["ivfflat.probes"] = str(probes)
+    if iterative and SEARCH_ITERATIVE_SCAN != "off":
+        if VECTOR_INDEX_TYPE == "hnsw":
+            settings["hnsw.iterative_scan"] = SEARCH_ITERATIVE_SCAN
+        elif VECTOR_INDEX_TYPE == "ivfflat":
+            settings["ivfflat.iterative_scan"] = "relaxed_order"
+    return settings
+
+def filter_signature(filters: Optional[dict]) -> tuple:
+    """Хешируемое описание набора фильтров для кэша построенных запросов.
+
+    Значение sentiment входит в описание (оно подставляется в SQL), остальные - только именем.
+    """
+    signature = []
+    for name, value in sorted((filters or {}).items()):
+        if value is None:
+            continue
+        if name == "sentiment":
+            if value not in SENTIMENT_LABELS:
+                raise ValueError(f"Неизвестная тональность: {value}. Допустимые значения: {', '.join(SENTIMENT_LABELS)}")
+            signature.append((name, value))
+        elif name in FILTERS:
+            signature.append((name, None))
+        else:
+            raise ValueError(f"Неизвестный фильтр: {name}")
+    return tuple(signature)
+
+def _filter_conditions(signature: tuple) -> list:
+    """Условия WHERE на столбцы reviews для описания фильтров"""
+    conditions = []
+    for name, value in signature:
+        if name == "sentiment":
+            conditions.append(Review.sentiment_label == literal_column(f"'{value}'"))
+        else:
+            condition, type_ = FILTERS[name]
+            conditions.append(condition(bindparam(f"filter_{name}", type_=type_)))
+    return conditions
+
+def _filter_params(filters: Optional[dict]) -> dict:
+    """Значения параметров фильтров (кроме sentiment, он уже в тексте запроса)"""
+    return {
+        f"filter_{name}": value
+        for name, value in (filters or {}).items()
+        if value is not None and name in FILTERS
+    }
+
+def encode_cursor(row: dict) -> str:
+    """Курсор следующей страницы по последней строке текущей: (расстояние, id)"""
+    payload = json.dumps([row["distance"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """(расстояние, id) последней строки предыдущей страницы; ValueError для некорректного курсора"""
+    try:
+        distance, review_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(distance), int(review_id)
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный курсор")
+
+def version_check(model_version, results) -> dict:
+    """Версия модели запроса и признак результатов, чьи векторы посчитаны другой версией"""
+    return {
+        "model_version": model_version,
+        "mixed_versions": any(row.get("model_version") != model_version for row in results)
+    }
+
+def _result_cache_key(embedding: np.ndarray, k: int, ef_search: Optional[int], probes: Optional[int], *params):
+    """Ключ кэша результатов для текущего поколения корпуса (None - кэш не используется)"""
+    if not result_cache.enabled:
+        return None
+    generation = corpus_generation.current()
+    if generation is None:
+        return None
+    return result_cache.key(generation, embedding, k, ef_search, probes, *params)
+
+def _projection_for():
+    """Проекция для представления reduced (ошибка, если она не настроена)"""
+    projection = get_projection()
+    if projection is None:
+        raise ValueError("VECTOR_STORAGE=reduced требует файла проекции PROJECTION_PATH")
+    return projection
+
+def _nearest(
+    query_vector,
+    storage: str,
+    reduced_vector=None,
+    limit: str = "k",
+    filters: tuple = (),
+    paginated: bool = False
+):
+    """Ближайшие к query_vector отзывы (id, text, model_version, distance), число строк - параметр limit.
+
+    Фильтры (описание из filter_signature) и условие курсора (paginated: строки дальше
+    after_distance, при равном расстоянии - с id больше after_id) применяются в том же
+    SELECT, что сканирует ANN-индекс, чтобы индекс продолжал выдачу до limit подходящих строк.
+    При равных расстояниях страницы упорядочиваются по id (инкрементальная сортировка поверх индекса).
+
+    Для компактного представления кандидаты (их число - параметр candidates) отбираются
+    по индексу на compact_distance (для reduced - по столбцу vector_reduced и
+    спроецированному запросу reduced_vector), а затем переранжируются по точному
+    косинусному расстоянию полных векторов.
+    Подзапросы явно коррелируют со всем, кроме reviews: внутри LATERAL (пакетный и
+    гибридный поиск) вектор запроса - столбец внешнего запроса.
+    """
+    exact_distance = Review.vector.cosine_distance(query_vector)
+    conditions = _filter_conditions(filters)
+    if paginated:
+        after_distance = bindparam("after_distance", type_=Float)
+        conditions.append(or_(
+            exact_distance > after_distance,
+            and_(exact_distance == after_distance, Review.id > bindparam("after_id", type_=Integer))
+        ))
+
+    if storage == "full":
+        distance = exact_distance.label("distance")
+        return (
+            select(Review.id, Review.text, Review.model_version, distance)
+            .where(*conditions)
+            .order_by(distance, *([Review.id] if paginated else []))
+            .limit(bindparam(limit))
+            .correlate_except(Review)
+        )
+
+    if storage == "reduced":
+        coarse_distance = Review.vector_reduced.cosine_distance(reduced_vector)
+    else:
+        coarse_distance = compact_distance(Review.vector, query_vector, storage)
+    candidates = (
+        select(Review.id, Review.text, Review.model_version, Review.vector)
+        .where(*conditions)
+        .order_by(coarse_distance)
+        .limit(bindparam("candidates"))
+        .correlate_except(Review)
+        .subquery("candidates")
+    )
+    distance = candidates.c.vector.cosine_distance(query_vector).label("distance")
+    return (
+        select(candidates.c.id, candidates.c.text, candidates.c.model_version, distance)
+        .order_by(distance, *([candidates.c.id] if paginated else []))
+        .limit(bindparam(limit))
+        .correlate_except(candidates)
+    )
+
+def _hybrid(query_vector, query_text, storage: str, reduced_vector=None, filters: tuple = ()):
+    """Гибридный поиск: векторные и полнотекстовые кандидаты, объединенные reciprocal rank fusion.
+
+    Каждый список дает до hybrid_candidates строк: векторный - как _nearest, полнотекстовый -
+    совпадения websearch_to_tsquery(query_text) по GIN-индексу столбца text_tsv, упорядоченные
+    по ts_rank_cd. Оценка строки - vector_weight / (HYBRID_RRF_K + ранг в векторном списке)
+    + (1 - vector_weight) / (HYBRID_RRF_K + ранг в полнотекстовом); отсутствие в списке дает 0.
+    Фильтры применяются в обоих списках.
+    Возвращает k строк (id, text, model_version, distance, score), distance - точное косинусное расстояние.
+    """
+    vector_leg = _nearest(
+        query_vector, storage, reduced_vector, limit="hybrid_candidates", filters=filters
+    ).subquery("vector_leg")
+    vector_ranked = select(
+        vector_leg.c.id,
+        func.row_number().over(order_by=vector_leg.c.distance).label("rank")
+    ).subquery("vector_ranked")
+
+    tsquery = func.websearch_to_tsquery(cast(literal(TEXT_SEARCH_CONFIG), REGCONFIG), query_text)
+    text_rank = func.ts_rank_cd(Review.text_tsv, tsquery, TEXT_RANK_NORMALIZATION).label("text_rank")
+    text_leg = (
+        select(Review.id, text_rank)
+        .where(Review.text_tsv.op("@@")(tsquery), *_filter_conditions(filters))
+        .order_by(text_rank.desc())
+        .limit(bindparam("hybrid_candidates"))
+        .correlate_except(Review)
+        .subquery("text_leg")
+    )
+    text_ranked = select(
+        text_leg.c.id,
+        func.row_number().over(order_by=text_leg.c.text_rank.desc()).label("rank")
+    ).subquery("text_ranked")
+
+    weight = bindparam("vector_weight", type_=Float)
+    rrf_k = literal(float(HYBRID_RRF_K), Float)
+    score = (
+        func.coalesce(weight / (rrf_k + vector_ranked.c.rank), 0.0)
+        + func.coalesce((1.0 - weight) / (rrf_k + text_ranked.c.rank), 0.0)
+    ).label("score")
+    fused = vector_ranked.join(text_ranked, vector_ranked.c.id == text_ranked.c.id, full=True)
+    distance = Review.vector.cosine_distance(query_vector).label("distance")
+    return (
+        select(Review.id, Review.text, Review.model_version, distance, score)
+        .select_from(fused.join(Review, Review.id == func.coalesce(vector_ranked.c.id, text_ranked.c.id)))
+        .order_by(score.desc(), distance)
+        .limit(bindparam("k"))
+    )
+
+@lru_cache(maxsize=256)
+def similar_reviews_query(
+    storage: str = VECTOR_STORAGE,
+    hybrid: bool = False,
+    filters: tuple = (),
+    paginated: bool = False
+):
+    """Запрос k ближайших отзывов по косинусному расстоянию (параметры - similar_reviews_params).
+
+    Запрос строится один раз для каждого представления, а вектор и k передаются при
+    выполнении: SQLAlchemy берет уже скомпилированный SQL из кэша, а asyncpg повторно
+    использует подготовленный на соединении оператор и передает вектор в бинарном виде.
+    При hybrid=True - гибридный поиск с текстом запроса query_text (см. _hybrid);
+    filters - описание фильтров из filter_signature, paginated - продолжение после курсора
+    (только векторный поиск). Для каждого сочетания строится свой запрос.
+    """
+    # Явное приведение типа: для binary_quantize параметр иначе неоднозначен
+    query_vector = cast(bindparam("embedding", type_=NativeVector(VECTOR_DIM)), NativeVector(VECTOR_DIM))
+    reduced_vector = None
+    if storage == "reduced":
+        reduced_vector = cast(
+            bindparam("reduced_embedding", type_=NativeVector(PROJECTION_DIM)), NativeVector(PROJECTION_DIM)
+        )
+    if hybrid:
+        return _hybrid(query_vector, bindparam("query_text", type_=Text), storage, reduced_vector, filters)
+    return _nearest(query_vector, storage, reduced_vector, filters=filters, paginated=paginated)
+
+def _limit_params(k: int, storage: str, vector_weight: Optional[float], hybrid: bool) -> dict:
+    """Число строк результата и кандидатов; для гибридного поиска - и вес векторного списка"""
+    params = {"k": k}
+    if hybrid:
+        params["hybrid_candidates"] = hybrid_candidates(k)
+        params["vector_weight"] = HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight
+    if storage != "full":
+        params["candidates"] = candidates_count(params.get("hybrid_candidates", k), storage)
+    return params
+
+def similar_reviews_params(
+    embedding: np.ndarray,
+    k: int,
+    storage: str = VECTOR_STORAGE,
+    query_text: Optional[str] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None,
+    after: Optional[Tuple[float, int]] = None
+) -> dict:
+    """Параметры similar_reviews_query для одного вектора.
+
+    query_text - для гибридного поиска, filters - значения фильтров,
+    after - (расстояние, id) последней строки предыдущей страницы.
+    """
+    params = {
+        "embedding": embedding,
+        **_limit_params(k, storage, vector_weight, query_text is not None),
+        **_filter_params(filters)
+    }
+    if query_text is not None:
+        params["query_text"] = query_text
+    if after is not None:
+        params["after_distance"], params["after_id"] = after
+    if storage == "reduced":
+        params["reduced_embedding"] = _projection_for().apply(embedding)
+    return params
+
+def _apply_settings_sync(session: Session, k: int, ef_search, probes, hybrid: bool, iterative: bool = False):
+    k = hybrid_candidates(k) if hybrid else k
+    for name, value in search_settings(k, ef_search, probes, iterative=iterative).items():
+        session.execute(_set_local, {"name": name, "value": value})
+
+async def _apply_settings(session: AsyncSession, k: int, ef_search, probes, hybrid: bool, iterative: bool = False):
+    k = hybrid_candidates(k) if hybrid else k
+    for name, value in search_settings(k, ef_search, probes, iterative=iterative).items():
+        await session.execute(_set_local, {"name": name, "value": value})
+
+def search_similar_sync(
+    session: Session,
+    embedding: np.ndarray,
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    query_text: Optional[str] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None,
+    after: Optional[Tuple[float, int]] = None
+) -> List[dict]:
+    """Поиск ближайших отзывов через синхронную сессию (Celery).
+
+    С query_text выполняется гибридный поиск (векторный + полнотекстовый) с весом
+    векторного списка vector_weight; filters - фильтры по метаданным, after - курсор
+    (расстояние, id) последней строки предыдущей страницы. Гибридный поиск, фильтры
+    и курсор всегда выполняются в PostgreSQL.
+    """
+    hybrid = query_text is not None
+    signature = filter_signature(filters)
+    in_postgres = hybrid or bool(signature) or after is not None
+    cache_key = _result_cache_key(
+        embedding, k, ef_search, probes, query_text, vector_weight, tuple(sorted(_filter_params(filters).items())),
+        signature, after
+    )
+    # Профилируемый запрос проходит весь путь до базы, а не берет результат из кэша
+    if cache_key is not None and active_profile() is None:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    in_memory = SEARCH_BACKEND == "numpy" and not in_postgres
+    with stage("index_search" if in_memory else "db_query"):
+        if in_memory:
+            results = search_in_memory_sync(session, embedding, k)
+        else:
+            _apply_settings_sync(session, k, ef_search, probes, hybrid, iterative=bool(signature) or after is not None)
+            params = similar_reviews_params(
+                embedding, k, query_text=query_text, vector_weight=vector_weight, filters=filters, after=after
+            )
+            query = similar_reviews_query(hybrid=hybrid, filters=signature, paginated=after is not None)
+            explain_sync(session, query, params)
+            rows = session.execute(query, params).all()
+            results = [dict(row._mapping) for row in rows]
+    if cache_key is not None:
+        result_cache.set(cache_key, results)
+    return results
+
+async def search_similar(
+    session: AsyncSession,
+    embedding: np.ndarray,
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    query_text: Optional[str] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None,
+    after: Optional[Tuple[float, int]] = None
+) -> List[dict]:
+    """Поиск ближайших отзывов через асинхронную сессию (FastAPI).
+
+    С query_text выполняется гибридный поиск (векторный + полнотекстовый) с весом
+    векторного списка vector_weight; filters - фильтры по метаданным, after - курсор
+    (расстояние, id) последней строки предыдущей страницы. Гибридный поиск, фильтры
+    и курсор всегда выполняются в PostgreSQL.
+    """
+    hybrid = query_text is not None
+    signature = filter_signature(filters)
+    in_postgres = hybrid or bool(signature) or after is not None
+    cache_key = _result_cache_key(
+        embedding, k, ef_search, probes, query_text, vector_weight, tuple(sorted(_filter_params(filters).items())),
+        signature, after
+    )
+    # Профилируемый запрос проходит весь путь до базы, а не берет результат из кэша
+    if cache_key is not None and active_profile() is None:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    in_memory = SEARCH_BACKEND == "numpy" and not in_postgres
+    with stage("index_search" if in_memory else "db_query"):
+        if in_memory:
+            results = await search_in_memory(session, embedding, k)
+        else:
+            await _apply_settings(session, k, ef_search, probes, hybrid, iterative=bool(signature) or after is not None)
+            params = similar_reviews_params(
+                embedding, k, query_text=query_text, vector_weight=vector_weight, filters=filters, after=after
+            )
+            query = similar_reviews_query(hybrid=hybrid, filters=signature, paginated=after is not None)
+            await explain(session, query, params)
+            rows = (await session.execute(query, params)).all()
+            results = [dict(row._mapping) for row in rows]
+    if cache_key is not None:
+        result_cache.set(cache_key, results)
+    return results
+
+def _vector_array(name: str, dim: int):
+    """Параметр-массив векторов vector(dim)[] (numpy-массивы передаются драйверу как есть)"""
+    array_type = ARRAY(NativeVector(dim), dimensions=1)
+    return cast(bindparam(name, type_=array_type), array_type)
+
+@lru_cache(maxsize=256)
+def similar_reviews_batch_query(storage: str = VECTOR_STORAGE, hybrid: bool = False, filters: tuple = ()):
+    """Запрос k ближайших отзывов сразу для нескольких векторов за один проход к БД.
+
+    Векторы передаются параметром embeddings - массивом vector[] (для reduced еще и
+    reduced_embeddings - спроецированные векторы, для гибридного поиска - query_texts,
+    см. batch_query_params). Через asyncpg элементы кодируются бинарным кодеком pgvector,
+    как и в одиночном запросе, без текстовых литералов. Для каждого вектора LATERAL-подзапрос
+    выполняет обычный (или гибридный) поиск по индексу; фильтры общие для всех векторов.
+    Возвращает строки (position, id, text, model_version, distance[, score]), position - номер вектора с нуля.
+    """
+    arrays = [_vector_array("embeddings", VECTOR_DIM)]
+    names = [column("embedding", NativeVector(VECTOR_DIM))]
+    if storage == "reduced":
+        arrays.append(_vector_array("reduced_embeddings", PROJECTION_DIM))
+        names.append(column("reduced_embedding", NativeVector(PROJECTION_DIM)))
+    if hybrid:
+        arrays.append(cast(bindparam("query_texts"), ARRAY(Text)))
+        names.append(column("query_text", Text))
+    queries = func.unnest(*arrays).table_valued(*names, with_ordinality="ord").render_derived("q")
+
+    reduced_vector = queries.c.reduced_embedding if storage == "reduced" else None
+    query_vector = queries.c.embedding
+    if hybrid:
+        neighbours = _hybrid(query_vector, queries.c.query_text, storage, reduced_vector, filters).lateral("r")
+        columns = [neighbours.c.distance, neighbours.c.score]
+        order = neighbours.c.score.desc()
+    else:
+        neighbours = _nearest(query_vector, storage, reduced_vector, filters=filters).lateral("r")
+        columns = [neighbours.c.distance]
+        order = neighbours.c.distance
+    return (
+        select(
+            (queries.c.ord - 1).label("position"), neighbours.c.id, neighbours.c.text, neighbours.c.model_version,
+            *columns
+        )
+        .select_from(queries.join(neighbours, true()))
+        .order_by(queries.c.ord, order)
+    )
+
+def batch_query_params(
+    embeddings: List[np.ndarray],
+    k: int,
+    storage: str = VECTOR_STORAGE,
+    query_texts: Optional[List[str]] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None
+) -> dict:
+    """Параметры similar_reviews_batch_query для списка векторов (query_texts - для гибридного поиска)"""
+    params = {
+        "embeddings": [np.asarray(embedding, dtype=np.float32) for embedding in embeddings],
+        **_limit_params(k, storage, vector_weight, query_texts is not None),
+        **_filter_params(filters)
+    }
+    if query_texts is not None:
+        params["query_texts"] = list(query_texts)
+    if storage == "reduced":
+        reduced = _projection_for().apply(np.stack(embeddings))
+        params["reduced_embeddings"] = list(reduced)
+    return params
+
+def _cached_many(
+    embeddings: List[np.ndarray],
+    k: int,
+    ef_search: Optional[int],
+    probes: Optional[int],
+    query_texts: Optional[List[str]],
+    vector_weight: Optional[float],
+    filters: Optional[dict]
+):
+    """Результаты из кэша для каждого вектора (None - промах) и ключи для сохранения"""
+    texts = query_texts if query_texts is not None else [None] * len(embeddings)
+    filter_key = (tuple(sorted(_filter_params(filters).items())), filter_signature(filters))
+    keys = [
+        _result_cache_key(embedding, k, ef_search, probes, query_text, vector_weight, *filter_key, None)
+        for embedding, query_text in zip(embeddings, texts)
+    ]
+    results = [result_cache.get(key) if key is not None else None for key in keys]
+    return results, keys
+
+def _store_many(results: List[Optional[List[dict]]], keys, missing: List[int], found: List[List[dict]]):
+    for position, rows in zip(missing, found):
+        results[position] = rows
+        if keys[position] is not None:
+            result_cache.set(keys[position], rows)
+    return results
+
+def _group_batch_rows(rows, size: int) -> List[List[dict]]:
+    grouped = [[] for _ in range(size)]
+    for row in rows:
+        result = dict(row._mapping)
+        grouped[result.pop("position")].append(result)
+    return grouped
+
+def search_similar_many_sync(
+    session: Session,
+    embeddings: List[np.ndarray],
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    query_texts: Optional[List[str]] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None
+) -> List[List[dict]]:
+    """Поиск ближайших отзывов для списка векторов одним запросом (Celery).
+
+    С query_texts (текст для каждого вектора) выполняется гибридный поиск;
+    filters - фильтры по метаданным, общие для всех векторов.
+    """
+    hybrid = query_texts is not None
+    signature = filter_signature(filters)
+    results, keys = _cached_many(embeddings, k, ef_search, probes, query_texts, vector_weight, filters)
+    missing = [position for position, cached in enumerate(results) if cached is None]
+    if not missing:
+        return results
+
+    in_memory = SEARCH_BACKEND == "numpy" and not hybrid and not signature
+    with stage("index_search" if in_memory else "db_query"):
+        if in_memory:
+            found = search_in_memory_many_sync(session, [embeddings[position] for position in missing], k)
+        else:
+            _apply_settings_sync(session, k, ef_search, probes, hybrid, iterative=bool(signature))
+            params = batch_query_params(
+                [embeddings[position] for position in missing], k,
+                query_texts=[query_texts[position] for position in missing] if hybrid else None,
+                vector_weight=vector_weight,
+                filters=filters
+            )
+            rows = session.execute(similar_reviews_batch_query(hybrid=hybrid, filters=signature), params).all()
+            found = _group_batch_rows(rows, len(missing))
+    return _store_many(results, keys, missing, found)
+
+async def search_similar_many(
+    session: AsyncSession,
+    embeddings: List[np.ndarray],
+    k: int,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    query_texts: Optional[List[str]] = None,
+    vector_weight: Optional[float] = None,
+    filters: Optional[dict] = None
+) -> List[List[dict]]:
+    """Поиск ближайших отзывов для списка векторов одним запросом (FastAPI).
+
+    С query_texts (текст для каждого вектора) выполняется гибридный поиск;
+    filters - фильтры по метаданным, общие для всех векторов.
+    """
+    hybrid = query_texts is not None
+    signature = filter_signature(filters)
+    results, keys = _cached_many(embeddings, k, ef_search, probes, query_texts, vector_weight, filters)
+    missing = [position for position, cached in enumerate(results) if cached is None]
+    if not missing:
+        return results
+
+    in_memory = SEARCH_BACKEND == "numpy" and not hybrid and not signature
+    with stage("index_search" if in_memory else "db_query"):
+        if in_memory:
+            found = await search_in_memory_many(session, [embeddings[position] for position in missing], k)
+        else:
+            await _apply_settings(session, k, ef_search, probes, hybrid, iterative=bool(signature))
+            params = batch_query_params(
+                [embeddings[position] for position in missing], k,
+                query_texts=[query_texts[position] for position in missing] if hybrid else None,
+                vector_weight=vector_weight,
+                filters=filters
+            )
+            rows = (await session.execute(similar_reviews_batch_query(hybrid=hybrid, filters=signature), params)).all()
+            found = _group_batch_rows(rows, len(missing))
+    return _store_many(results, keys, missing, found)
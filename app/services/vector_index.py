@@ -0,0 +1,289 @@
+# Векторный индекс в памяти процесса (NumPy) как альтернатива поиску в pgvector
+
+import os
+import json
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.review import Review
+from app.models.corpus import vectors_version_query
+from app.services.cache import corpus_generation
+
+# Бэкенд поиска: pgvector (запрос в PostgreSQL) или numpy (матрица в памяти процесса)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "pgvector")
+
+# Путь снимка индекса без расширения (<путь>.ids.npy и <путь>.vectors.npy); снимок
+# открывается через mmap, поэтому несколько процессов разделяют одни страницы памяти
+VECTOR_INDEX_SNAPSHOT = os.getenv("VECTOR_INDEX_SNAPSHOT", "")
+
+# Как часто проверять новые отзывы, если счетчик поколений корпуса недоступен (секунды)
+VECTOR_INDEX_REFRESH_INTERVAL = float(os.getenv("VECTOR_INDEX_REFRESH_INTERVAL", "5"))
+
+# Размер порции строк при загрузке из БД
+LOAD_CHUNK_SIZE = 10000
+
+# Число запросов в одном матричном произведении при пакетном поиске (ограничивает
+# временную матрицу сходств размером QUERY_CHUNK_SIZE x число векторов)
+QUERY_CHUNK_SIZE = 64
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """Нормировка строк на единичную длину: косинусное сходство сводится к скалярному произведению"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+class InMemoryVectorIndex:
+    """Точный поиск ближайших соседей по нормированной матрице float32.
+
+    Матрица состоит из базового сегмента (снимок, открытый через mmap, или загруженный
+    из БД) и сегмента новых строк, который дозагружается по id > последнего известного.
+    Поиск - одно матрично-векторное произведение и argpartition, поэтому результаты
+    совпадают с точным поиском pgvector по косинусному расстоянию.
+
+    Дозагрузка по id не видит векторы, пересчитанные на месте (scripts/reembed.py), поэтому
+    индекс помнит версию векторов корпуса - запись corpus_state, которую reembed.py пишет в
+    транзакции переключения. При ее смене индекс и снимок другой версии отбрасываются и
+    векторы загружаются заново.
+    """
+
+    def __init__(self, snapshot_path: str = VECTOR_INDEX_SNAPSHOT, refresh_interval: float = VECTOR_INDEX_REFRESH_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self._base_ids = np.empty(0, dtype=np.int64)
+        self._base = None
+        self._delta_ids = []
+        self._delta = []
+        self._max_id = 0
+        self._loaded = False
+        self._vectors_version = None
+        self._generation = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        # Дозагрузка выполняется одним потоком или одной корутиной за раз: иначе двое, увидевших
+        # незагруженный индекс, открыли бы снимок поверх чужих новых строк и добавили их второй раз
+        self._refresh_lock = threading.Lock()
+        self._async_refresh_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._base_ids) + sum(len(ids) for ids in self._delta_ids)
+
+    def _load_snapshot(self, vectors_version: Optional[str]):
+        """Открытие снимка через mmap, если он есть и снят с векторов той же версии модели"""
+        if not self.snapshot_path or not os.path.exists(f"{self.snapshot_path}.vectors.npy"):
+            return
+        try:
+            with open(f"{self.snapshot_path}.meta.json", encoding="utf-8") as f:
+                snapshot_version = json.load(f)["vectors_version"]
+        except (OSError, ValueError, KeyError):
+            snapshot_version = None
+        if snapshot_version != vectors_version:
+            print(f"Снимок векторного индекса снят с векторов другой версии модели ({snapshot_version}, "
+                  f"в БД {vectors_version}) - векторы загружаются из БД, пересоздайте снимок")
+            return
+        self._base_ids = np.load(f"{self.snapshot_path}.ids.npy")
+        self._base = np.load(f"{self.snapshot_path}.vectors.npy", mmap_mode="r")
+        if len(self._base_ids):
+            self._max_id = int(self._base_ids.max())
+        print(f"Снимок векторного индекса открыт: {len(self._base_ids)} векторов")
+
+    def _append(self, rows):
+        """Добавление строк (id, vector), пропуская уже известные id"""
+        with self._lock:
+            rows = [row for row in rows if row[0] > self._max_id]
+            if not rows:
+                return 0
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            matrix = _normalize(np.stack([np.asarray(row[1], dtype=np.float32) for row in rows]))
+            self._delta_ids.append(ids)
+            self._delta.append(matrix)
+            self._max_id = int(ids.max())
+            return len(rows)
+
+    def _reloaded(self, vectors_version: Optional[str]) -> Optional["InMemoryVectorIndex"]:
+        """Новый пустой индекс, если векторы корпуса пересчитаны другой моделью (иначе None)"""
+        if not self._loaded or vectors_version == self._vectors_version:
+            return None
+        print(f"Векторы корпуса пересчитаны ({self._vectors_version} -> {vectors_version}) - "
+              f"индекс в памяти загружается заново")
+        return InMemoryVectorIndex(self.snapshot_path, self.refresh_interval)
+
+    def _replace(self, fresh: "InMemoryVectorIndex"):
+        """Замена векторов заново загруженным индексом: до замены поиск идет по старым векторам"""
+        with self._lock:
+            self._base_ids, self._base = fresh._base_ids, fresh._base
+            self._delta_ids, self._delta = fresh._delta_ids, fresh._delta
+            self._max_id = fresh._max_id
+            self._vectors_version = fresh._vectors_version
+            self._generation, self._refreshed_at = fresh._generation, fresh._refreshed_at
+
+    def _start_loading(self, vectors_version: Optional[str]):
+        if not self._loaded:
+            self._load_snapshot(vectors_version)
+        self._vectors_version = vectors_version
+
+    def _needs_refresh(self) -> bool:
+        """Нужна ли дозагрузка: изменилось поколение корпуса или истек интервал проверки"""
+        if not self._loaded:
+            return True
+        generation = corpus_generation.current()
+        if generation is not None:
+            return generation != self._generation
+        return time.monotonic() - self._refreshed_at >= self.refresh_interval
+
+    def _new_rows_query(self, after_id: int):
+        return (
+            select(Review.id, Review.vector)
+            .where(Review.id > after_id, Review.vector.isnot(None))
+            .order_by(Review.id)
+            .limit(LOAD_CHUNK_SIZE)
+        )
+
+    def _mark_refreshed(self, generation):
+        self._generation = generation
+        self._refreshed_at = time.monotonic()
+        self._loaded = True
+
+    def refresh_sync(self, session: Session):
+        """Дозагрузка новых строк через синхронную сессию"""
+        if not self._needs_refresh():
+            return
+        with self._refresh_lock:
+            # Пока ждали блокировку, индекс мог дозагрузить другой поток
+            if self._needs_refresh():
+                self._load_sync(session)
+
+    def _load_sync(self, session: Session):
+        generation = corpus_generation.current()
+        vectors_version = session.execute(vectors_version_query()).scalar()
+        fresh = self._reloaded(vectors_version)
+        if fresh is not None:
+            fresh._load_sync(session)
+            self._replace(fresh)
+            return
+        self._start_loading(vectors_version)
+        while True:
+            rows = session.execute(self._new_rows_query(self._max_id)).all()
+            self._append(rows)
+            if len(rows) < LOAD_CHUNK_SIZE:
+                break
+        self._mark_refreshed(generation)
+
+    async def refresh(self, session: AsyncSession):
+        """Дозагрузка новых строк через асинхронную сессию"""
+        if not self._needs_refresh():
+            return
+        async with self._async_refresh_lock:
+            if self._needs_refresh():
+                await self._load(session)
+
+    async def _load(self, session: AsyncSession):
+        generation = corpus_generation.current()
+        vectors_version = (await session.execute(vectors_version_query())).scalar()
+        fresh = self._reloaded(vectors_version)
+        if fresh is not None:
+            await fresh._load(session)
+            self._replace(fresh)
+            return
+        self._start_loading(vectors_version)
+        while True:
+            rows = (await session.execute(self._new_rows_query(self._max_id))).all()
+            self._append(rows)
+            if len(rows) < LOAD_CHUNK_SIZE:
+                break
+        self._mark_refreshed(generation)
+
+    def _segments(self):
+        with self._lock:
+            segments = ([self._base] if self._base is not None else []) + list(self._delta)
+            id_segments = ([self._base_ids] if self._base is not None else []) + list(self._delta_ids)
+        return segments, id_segments
+
+    def nearest(self, embedding: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """k ближайших (id, косинусное расстояние) в порядке возрастания расстояния"""
+        return self.nearest_many([embedding], k)[0]
+
+    def nearest_many(self, embeddings: List[np.ndarray], k: int) -> List[List[Tuple[int, float]]]:
+        """k ближайших для каждого из векторов: матричное произведение порциями по QUERY_CHUNK_SIZE"""
+        segments, id_segments = self._segments()
+        if not segments:
+            return [[] for _ in embeddings]
+        ids = np.concatenate(id_segments)
+        k = min(k, len(ids))
+
+        queries = _normalize(np.stack([np.asarray(embedding, dtype=np.float32) for embedding in embeddings]))
+        results = []
+        for start in range(0, len(queries), QUERY_CHUNK_SIZE):
+            chunk = queries[start:start + QUERY_CHUNK_SIZE].T
+            scores = np.concatenate([segment @ chunk for segment in segments])
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            for column in range(chunk.shape[1]):
+                candidates = top[:, column]
+                column_scores = scores[candidates, column]
+                order = candidates[np.argsort(-column_scores, kind="stable")]
+                results.append([(int(ids[position]), float(1.0 - scores[position, column])) for position in order])
+        return results
+
+    def save_snapshot(self, path: str):
+        """Сохранение всех векторов в снимок (атомарная замена файлов) с версией модели векторов"""
+        segments, id_segments = self._segments()
+        matrix = np.concatenate(segments) if segments else np.empty((0, 768), dtype=np.float32)
+        ids = np.concatenate(id_segments) if id_segments else np.empty(0, dtype=np.int64)
+
+        for suffix, data in (("ids", ids), ("vectors", matrix)):
+            temporary = f"{path}.{suffix}.tmp.npy"
+            np.save(temporary, data)
+            os.replace(temporary, f"{path}.{suffix}.npy")
+        temporary = f"{path}.meta.tmp.json"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"vectors_version": self._vectors_version}, f)
+        os.replace(temporary, f"{path}.meta.json")
+
+def _texts_query(ranked_many: List[List[Tuple[int, float]]]):
+    """Запрос текстов (и версий модели) всех найденных отзывов одним обращением по первичному ключу"""
+    ids = {review_id for ranked in ranked_many for review_id, _ in ranked}
+    return select(Review.id, Review.text, Review.model_version).where(Review.id.in_(ids)) if ids else None
+
+def _with_texts(ranked_many: List[List[Tuple[int, float]]], rows) -> List[List[dict]]:
+    found = {row.id: row for row in rows}
+    return [
+        [
+            {
+                "id": review_id, "text": found[review_id].text,
+                "model_version": found[review_id].model_version, "distance": distance
+            }
+            for review_id, distance in ranked if review_id in found
+        ]
+        for ranked in ranked_many
+    ]
+
+def search_in_memory_many_sync(session: Session, embeddings: List[np.ndarray], k: int) -> List[List[dict]]:
+    """Поиск по индексу в памяти, тексты найденных отзывов читаются из БД по первичному ключу"""
+    vector_index.refresh_sync(session)
+    ranked_many = vector_index.nearest_many(embeddings, k)
+    query = _texts_query(ranked_many)
+    rows = session.execute(query).all() if query is not None else []
+    return _with_texts(ranked_many, rows)
+
+async def search_in_memory_many(session: AsyncSession, embeddings: List[np.ndarray], k: int) -> List[List[dict]]:
+    """Асинхронный вариант search_in_memory_many_sync"""
+    await vector_index.refresh(session)
+    ranked_many = vector_index.nearest_many(embeddings, k)
+    query = _texts_query(ranked_many)
+    rows = (await session.execute(query)).all() if query is not None else []
+    return _with_texts(ranked_many, rows)
+
+def search_in_memory_sync(session: Session, embedding: np.ndarray, k: int) -> List[dict]:
+    return search_in_memory_many_sync(session, [embedding], k)[0]
+
+async def search_in_memory(session: AsyncSession, embedding: np.ndarray, k: int) -> List[dict]:
+    return (await search_in_memory_many(session, [embedding], k))[0]
+
+# Общий индекс процесса
+vector_index = InMemoryVectorIndex()
@@ -1,6 +1,12 @@
 # Конфигурация Celery
 import os
+import time
+import uuid
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, task_success, worker_init, worker_process_init,
+    worker_process_shutdown
+)
 
 # Получение URL Redis из переменной окружения или использование значения по умолчанию
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -22,4 +28,92 @@ celery_app.conf.update(
     enable_utc=True,
     worker_prefetch_multiplier=1,
     task_acks_late=True,
-)
\ No newline at end of file
+)
+
+def _runs_in_child_process(pool_cls) -> bool:
+    """Отправляет ли пул worker_process_init: prefork - в каждом дочернем процессе, solo - при создании.
+
+    Пулы threads, gevent и eventlet выполняют задачи в главном процессе без этого сигнала.
+    """
+    from celery.concurrency import get_implementation
+    from celery.concurrency.prefork import TaskPool as PreforkPool
+    from celery.concurrency.solo import TaskPool as SoloPool
+
+    return issubclass(get_implementation(pool_cls), (PreforkPool, SoloPool))
+
+@worker_init.connect
+def preload_model(sender=None, **kwargs):
+    """Загрузка модели в главном процессе воркера до создания дочерних (MODEL_PRELOAD=1).
+
+    Выполняется только загрузка весов без прямого прохода: пул потоков PyTorch,
+    созданный до fork, может зависнуть в дочернем процессе. Если задачи выполняются
+    в главном процессе (--pool=threads), он же настраивается как процесс воркера.
+    """
+    from app.services.embedding import MODEL_PRELOAD, check_model_ready, load_model
+    from app.services.metrics import start_metrics_server
+
+    start_metrics_server()
+    if sender is not None and not _runs_in_child_process(sender.pool_cls):
+        report_worker_process()
+    if MODEL_PRELOAD and check_model_ready():
+        load_model()
+
+@worker_process_init.connect
+def report_worker_process(**kwargs):
+    """Настройка потоков, отслеживание текущей версии модели и отчет о памяти процесса, выполняющего задачи"""
+    from app.services.embedding import configure_threads, model_stats, model_watcher
+
+    configure_threads()
+    model_watcher.start()
+    print(f"Процесс воркера запущен: {model_stats()}")
+
+@worker_process_shutdown.connect
+def remove_process_metrics(pid=None, **kwargs):
+    from app.services.metrics import mark_process_dead
+
+    mark_process_dead(pid or os.getpid())
+
+@before_task_publish.connect
+def attach_request_id(headers=None, **kwargs):
+    """request id запроса API, время публикации и признак профилирования в заголовках сообщения задачи"""
+    from app.services.metrics import current_request_id
+    from app.services.profiling import active_profile
+
+    headers["request_id"] = current_request_id() or uuid.uuid4().hex
+    headers["published_at"] = time.time()
+    headers["profile"] = active_profile() is not None
+
+@task_prerun.connect
+def start_task_metrics(task=None, **kwargs):
+    """request id из заголовков сообщения, время ожидания задачи в брокере и начало профилирования"""
+    from app.services.metrics import STAGE_SECONDS, begin_request
+    from app.services.profiling import start_profile
+
+    state = begin_request(getattr(task.request, "request_id", None))
+    start_profile(forced=bool(getattr(task.request, "profile", False)))
+    state["started_at"] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is not None:
+        STAGE_SECONDS.labels("queue_wait").observe(max(0.0, time.time() - published_at))
+
+@task_success.connect
+def observe_task_result(**kwargs):
+    """Сигнал отправляется после записи результата в бэкенд: это конец этапа сериализации"""
+    from app.services.metrics import current_request, observe_serialization
+
+    observe_serialization(current_request())
+
+@task_postrun.connect
+def finish_task_metrics(task=None, state=None, **kwargs):
+    from app.services.metrics import CELERY_TASK_SECONDS, current_request, refresh_gauges
+    from app.services.profiling import save_profile
+
+    request = current_request()
+    if request is None or "started_at" not in request:
+        return
+    elapsed = time.perf_counter() - request["started_at"]
+    CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(elapsed)
+    refresh_gauges()
+    print(f"Задача {task.name} [{request['request_id']}]: {state} за {elapsed:.3f} с")
+    if request.get("profile") is not None:
+        save_profile(request["profile"], task=task.name, state=state, duration_s=round(elapsed, 4))
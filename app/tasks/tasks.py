@@ -1,61 +1,98 @@
 # Задачи для асинхронной обработки
 
-import os
 from app.tasks.celery_app import celery_app
-from app.models.review import Review
 from app.dependencies import SessionLocal
-from transformers import DistilBertForSequenceClassification, DistilBertTokenizer
-from sqlalchemy import text as sql_text
-import torch
+from app.services.embedding import describe_sentiment, embedding_batcher
+from app.services.search import (
+    decode_cursor, encode_cursor, search_similar_sync, search_similar_many_sync, version_check
+)
+from app.schemas.review import SearchFilters
+from app.services.metrics import current_request_id, result_ready
+from app.services.profiling import active_profile, profile_section
 
-# Глобальные переменные для модели и токенизатора
-model = None
-tokenizer = None
+def _filters(filters: dict = None):
+    """Фильтры из JSON-аргумента задачи (даты приходят строками ISO 8601)"""
+    return SearchFilters(**filters).model_dump(exclude_none=True) if filters else None
 
-def load_model():
-    """Загрузка модели и токенизатора, если они еще не загружены"""
-    global model, tokenizer
-    
-    if model is None or tokenizer is None:
-        model_path = './fine_tuned_model'
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Дообученная модель не найдена по пути {model_path}. Пожалуйста, сначала обучите модель.")
+@celery_app.task
+def find_similar_reviews(
+    input_text: str, k: int = 3, ef_search: int = None, probes: int = None,
+    mode: str = "vector", vector_weight: float = None, filters: dict = None, cursor: str = None,
+    search_response: bool = False
+):
+    """Поиск k похожих отзывов по входному тексту (mode=hybrid - с полнотекстовым поиском).
+
+    filters - фильтры по метаданным, cursor - курсор страницы из /search. Результат - тексты
+    отзывов (/find_similar) или при search_response=True тот же ответ, что у /search в процессе
+    API. Ошибка не подменяется пустым результатом: задача завершается FAILURE.
+    """
+    try:
+        # Генерация вектора для входного текста (модель загружается при первом обращении,
+        # параллельные задачи пула потоков объединяются в общий батч; профилируемая задача
+        # - X-Profile запроса API или PROFILE_SAMPLE_RATE - векторизуется отдельным батчем под профайлерами)
+        encoded = embedding_batcher.embed(input_text, with_logits=True, profile=active_profile())
+        
+        # Поиск похожих отзывов в базе данных
+        with profile_section("search"), SessionLocal() as session:
+            similar_reviews = search_similar_sync(
+                session, encoded.vector, k, ef_search, probes,
+                query_text=input_text if mode == "hybrid" else None, vector_weight=vector_weight,
+                filters=_filters(filters), after=decode_cursor(cursor) if cursor else None
+            )
         
-        print("Загрузка модели и токенизатора...")
-        model = DistilBertForSequenceClassification.from_pretrained(model_path, local_files_only=True)
-        tokenizer = DistilBertTokenizer.from_pretrained(model_path, local_files_only=True)
-        model.eval()
-        print("Модель и токенизатор успешно загружены!")
+        if not search_response:
+            # Возврат списка текстов похожих отзывов
+            return result_ready([review["text"] for review in similar_reviews])
+        next_cursor = None
+        if mode == "vector" and len(similar_reviews) == k:
+            next_cursor = encode_cursor(similar_reviews[-1])
+        return result_ready({
+            "status": "completed",
+            "results": similar_reviews,
+            "next_cursor": next_cursor,
+            "sentiment": describe_sentiment(encoded.logits)[0],
+            **version_check(encoded.model_version, similar_reviews)
+        })
+        
+    except Exception as e:
+        print(f"Ошибка в задаче find_similar_reviews [{current_request_id()}]: {str(e)}")
+        raise
 
 @celery_app.task
-def find_similar_reviews(input_text: str):
-    """Поиск похожих отзывов по входному тексту"""
+def find_similar_reviews_batch(
+    input_texts: list, k: int = 3, ef_search: int = None, probes: int = None,
+    mode: str = "vector", vector_weight: float = None, filters: dict = None, search_response: bool = False
+):
+    """Поиск k похожих отзывов сразу для списка текстов: батчевая векторизация и один запрос к БД.
+
+    Результат - списки текстов (/find_similar_batch) или при search_response=True тот же ответ,
+    что у /search_batch в процессе API.
+    """
     try:
-        # Загрузка модели, если она еще не загружена
-        load_model()
+        encoded = embedding_batcher.embed_many(input_texts, with_logits=True)
         
-        # Генерация вектора для входного текста
-        with torch.no_grad():
-            inputs = tokenizer(input_text, return_tensors="pt", truncation=True, max_length=512)
-            outputs = model.distilbert(**inputs)
-            embedding = outputs.last_hidden_state[:, 0, :].detach().numpy().tolist()[0]
-        
-        # Поиск похожих отзывов в базе данных
         with SessionLocal() as session:
-            # Использование правильного синтаксиса для pgvector
-            # Преобразуем список в строку формата PostgreSQL array
-            embedding_str = '[' + ','.join(map(str, embedding)) + ']'
-            
-            query = session.query(Review).order_by(
-                sql_text('vector <=> :embedding')
-            ).params(embedding=embedding_str).limit(3)
-            
-            similar_reviews = query.all()
+            similar_reviews = search_similar_many_sync(
+                session, [item.vector for item in encoded], k, ef_search, probes,
+                query_texts=input_texts if mode == "hybrid" else None, vector_weight=vector_weight,
+                filters=_filters(filters)
+            )
         
-        # Возврат списка текстов похожих отзывов
-        return [review.text for review in similar_reviews]
+        if not search_response:
+            # Для каждого входного текста - список текстов похожих отзывов
+            return result_ready([[review["text"] for review in reviews] for reviews in similar_reviews])
+        return result_ready({
+            "status": "completed",
+            "items": [
+                {
+                    "index": index, "results": reviews, "error": None,
+                    "sentiment": describe_sentiment(item.logits)[0],
+                    **version_check(item.model_version, reviews)
+                }
+                for index, (item, reviews) in enumerate(zip(encoded, similar_reviews))
+            ]
+        })
         
     except Exception as e:
-        print(f"Ошибка в задаче find_similar_reviews: {str(e)}")
-        # Возвращаем пустой список в случае ошибки, чтобы соответствовать схеме
-        return []
\ No newline at end of file
+        print(f"Ошибка в задаче find_similar_reviews_batch [{current_request_id()}]: {str(e)}")
+        raise
@@ -0,0 +1,87 @@
+# Бенчмарки API в процессе: скорость add_review и задержки поиска напрямую и через Celery
+
+import asyncio
+import time
+from typing import List
+import httpx
+from benchmarks.common import latency_summary
+from app.main import app
+from app.tasks.celery_app import celery_app
+
+def api_client() -> httpx.AsyncClient:
+    """Клиент FastAPI-приложения без сети: маршруты, валидация и сериализация - как у сервера"""
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300)
+
+async def _timed_requests(texts: List[str], concurrency: int, request) -> dict:
+    """Выполнение request(text) не более чем по concurrency одновременно: задержки и запросы в секунду"""
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    errors = 0
+
+    async def run(text: str):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            if not await request(text):
+                errors += 1
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(text) for text in texts))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests_per_s": round(len(texts) / elapsed, 2),
+        "errors": errors,
+        **latency_summary(timings),
+    }
+
+async def bench_add_review(client: httpx.AsyncClient, texts: List[str], concurrency: int) -> dict:
+    """POST /add_review по одному отзыву"""
+    async def request(text: str) -> bool:
+        response = await client.post("/add_review", json={"text": text, "source": "bench"})
+        return response.status_code == 200
+    return await _timed_requests(texts, concurrency, request)
+
+async def bench_add_reviews(client: httpx.AsyncClient, texts: List[str], batch_size: int) -> dict:
+    """POST /add_reviews пакетами batch_size: отзывы в секунду"""
+    timings = []
+    for start in range(0, len(texts), batch_size):
+        started = time.perf_counter()
+        response = await client.post(
+            "/add_reviews", json=[{"text": text, "source": "bench"} for text in texts[start:start + batch_size]]
+        )
+        response.raise_for_status()
+        timings.append(time.perf_counter() - started)
+    return {
+        "batch_size": batch_size,
+        "reviews_per_s": round(len(texts) / sum(timings), 2),
+        **latency_summary(timings),
+    }
+
+async def bench_search_direct(client: httpx.AsyncClient, queries: List[str], k: int, concurrency: int) -> dict:
+    """POST /search: векторизация в процессе API и поиск через асинхронную сессию"""
+    async def request(text: str) -> bool:
+        response = await client.post("/search", json={"text": text, "k": k})
+        return response.status_code == 200 and response.json()["status"] == "completed"
+    return await _timed_requests(queries, concurrency, request)
+
+async def bench_search_celery(
+    client: httpx.AsyncClient, queries: List[str], k: int, concurrency: int, poll_interval: float = 0.005
+) -> dict:
+    """POST /find_similar и опрос /status до результата: полный путь через брокер и воркер Celery"""
+    workers = await asyncio.to_thread(celery_app.control.ping, timeout=1.0)
+    if not workers:
+        return {"skipped": "нет запущенных воркеров Celery (DATABASE_URL воркера должен указывать на базу бенчмарков)"}
+
+    async def request(text: str) -> bool:
+        response = await client.post("/find_similar", json={"text": text, "k": k})
+        if response.status_code != 200:
+            return False
+        task_id = response.json()["task_id"]
+        while True:
+            status = (await client.get(f"/status/{task_id}")).json()["status"]
+            if status != "pending":
+                return status == "completed"
+            await asyncio.sleep(poll_interval)
+    return {"workers": len(workers), **await _timed_requests(queries, concurrency, request)}
@@ -0,0 +1,25 @@
+# Общие функции бенчмарков: размеры корпуса и сводка задержек
+
+from typing import Iterable
+import numpy as np
+
+# Стандартные размеры синтетического корпуса
+CORPUS_SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+def parse_rows(value: str) -> int:
+    """Размер корпуса: 1k, 100k, 1m или число строк"""
+    return CORPUS_SIZES.get(value.lower()) or int(value)
+
+def latency_summary(seconds: Iterable[float]) -> dict:
+    """Среднее, перцентили и максимум задержек (миллисекунды)"""
+    ms = np.asarray(list(seconds), dtype=np.float64) * 1000
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
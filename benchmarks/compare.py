@@ -0,0 +1,77 @@
+# Сравнение двух результатов benchmarks/run.py: изменения метрик и регрессии сверх порога
+
+import argparse
+import json
+import sys
+
+# Направление метрики по суффиксу имени: для скоростей и полноты больше - лучше, для времени - меньше
+HIGHER_IS_BETTER = ("_per_s", "recall", "recall_min", "speedup")
+LOWER_IS_BETTER = ("_ms", "_s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков двух коммитов")
+    parser.add_argument("baseline", help="JSON базового прогона")
+    parser.add_argument("candidate", help="JSON проверяемого прогона")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Допустимое ухудшение метрики (доля), при превышении - код выхода 1")
+    return parser.parse_args()
+
+def flatten(value, prefix=""):
+    """Числовые метрики вложенного результата: путь через точку -> значение.
+
+    Элементы списков (сетка recall) именуются по параметрам, а не по позиции.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, list):
+        for position, item in enumerate(value):
+            name = ",".join(
+                f"{key}={item[key]}" for key in ("ef_search", "probes") if isinstance(item, dict) and item.get(key)
+            )
+            yield from flatten(item, f"{prefix}[{name or position}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, float(value)
+
+def direction(metric: str) -> int:
+    """1 - рост метрики лучше, -1 - хуже, 0 - не оценивается (счетчики, параметры)"""
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def main():
+    args = parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    if baseline["environment"] != candidate["environment"] or baseline["corpus_rows"] != candidate["corpus_rows"]:
+        print("⚠️ Окружение или размер корпуса прогонов различаются - сравнение может быть некорректным")
+
+    before = dict(flatten(baseline["results"]))
+    after = dict(flatten(candidate["results"]))
+    regressions = []
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for metric in sorted(before.keys() & after.keys()):
+        sign = direction(metric)
+        if not sign or not before[metric]:
+            continue
+        change = (after[metric] - before[metric]) / abs(before[metric])
+        marker = ""
+        if change * sign < -args.threshold:
+            marker = " ❌"
+            regressions.append(metric)
+        elif change * sign > args.threshold:
+            marker = " ✅"
+        print(f"   {metric}: {before[metric]:g} -> {after[metric]:g} ({change:+.1%}){marker}")
+
+    if regressions:
+        print(f"Регрессии сверх {args.threshold:.0%}: {len(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
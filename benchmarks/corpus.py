@@ -0,0 +1,164 @@
+# Синтетический корпус отзывов для бенчмарков: тексты, векторы и загрузка в базу бенчмарков
+
+import argparse
+import csv
+import io
+import time
+from typing import Iterator, List, Tuple
+import numpy as np
+from pgvector.utils import to_db
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.engine import make_url
+from benchmarks import BENCH_DATABASE_URL
+from benchmarks.common import parse_rows
+from app.models.review import Base, Review, SENTIMENT_LABELS, VECTOR_DIM
+from app.dependencies import sync_engine
+from app.services.cache import corpus_generation
+
+NEUTRAL_WORDS = (
+    "the", "a", "movie", "film", "story", "plot", "actor", "actress", "scene", "director", "script", "ending",
+    "character", "characters", "cast", "camera", "music", "score", "was", "is", "and", "but", "with", "of",
+    "in", "this", "that", "it", "really", "quite", "very", "first", "last", "time", "watch", "watched",
+    "saw", "seen", "performance", "dialogue", "sequel", "original", "hour", "minutes", "audience", "theater",
+    "screen", "role", "lead", "drama", "comedy", "horror", "thriller", "romance", "action", "effects", "book",
+    "version", "series", "episode", "cinema", "they", "he", "she", "his", "her", "from", "about", "after",
+)
+POSITIVE_WORDS = (
+    "great", "excellent", "wonderful", "brilliant", "moving", "beautiful", "superb", "enjoyed", "loved",
+    "masterpiece", "funny", "touching", "clever", "memorable", "perfect", "charming", "recommend", "best",
+)
+NEGATIVE_WORDS = (
+    "boring", "awful", "terrible", "dull", "waste", "poor", "worst", "stupid", "bad", "predictable",
+    "disappointing", "mess", "annoying", "weak", "pointless", "hated", "cheap", "forgettable",
+)
+
+# Число кластеров синтетических векторов: без них ANN-индекс на равномерном шуме
+# ведет себя заметно хуже, чем на векторах реальных отзывов
+VECTOR_CLUSTERS = 256
+
+def synthetic_reviews(count: int, seed: int = 0) -> Tuple[List[str], np.ndarray]:
+    """Тексты и метки тональности (0/1) count отзывов.
+
+    Длина в словах логнормальная с медианой ~170 слов и длинным хвостом, как у отзывов IMDB;
+    доля слов тональности - 15%.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(np.log(170), 0.7, count).astype(int), 10, 2000)
+    labels = rng.integers(0, 2, count)
+    neutral = np.array(NEUTRAL_WORDS)
+    tones = (np.array(NEGATIVE_WORDS), np.array(POSITIVE_WORDS))
+
+    texts = []
+    for length, label in zip(lengths, labels):
+        words = np.where(rng.random(length) < 0.15, rng.choice(tones[label], length), rng.choice(neutral, length))
+        sentences = [" ".join(words[start:start + 12]).capitalize() + "." for start in range(0, length, 12)]
+        texts.append(" ".join(sentences))
+    return texts, labels
+
+def synthetic_vectors(labels: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Нормированные векторы VECTOR_DIM вокруг VECTOR_CLUSTERS центров (центры одинаковы при любом seed)"""
+    centers = np.random.default_rng(12345).normal(size=(VECTOR_CLUSTERS, VECTOR_DIM)).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    # Кластеры разделены по тональности, как и векторы дообученного классификатора
+    half = VECTOR_CLUSTERS // 2
+    assigned = rng.integers(0, half, len(labels)) + labels * half
+    vectors = centers[assigned] + rng.normal(scale=0.6, size=(len(labels), VECTOR_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def corpus_chunks(rows: int, chunk_size: int, seed: int = 0) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """Корпус частями по chunk_size строк: детерминирован при одинаковых rows, chunk_size и seed"""
+    for number, start in enumerate(range(0, rows, chunk_size)):
+        yield synthetic_reviews(min(chunk_size, rows - start), seed=seed * 1_000_003 + number)
+
+def ensure_database():
+    """Создание базы бенчмарков, если ее нет (через служебную базу postgres)"""
+    url = make_url(BENCH_DATABASE_URL)
+    engine = create_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as conn:
+            exists = conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": url.database}).first()
+            if not exists:
+                conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+                print(f"База бенчмарков {url.database} создана")
+    finally:
+        engine.dispose()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Загрузка синтетического корпуса в базу бенчмарков (BENCH_DATABASE_URL)")
+    parser.add_argument("--rows", default="1k", help="Размер корпуса: 1k, 100k, 1m или число строк")
+    parser.add_argument("--vectors", choices=["synthetic", "model"], default="synthetic",
+                        help="synthetic - кластеризованные случайные векторы, model - векторы текущей модели (медленно)")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Строк в одной команде COPY")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--maintenance-work-mem", default="1GB",
+                        help="Память для построения индексов (maintenance_work_mem)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    rows = parse_rows(args.rows)
+    ensure_database()
+
+    with sync_engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(sync_engine)
+
+    # Индексы строятся после загрузки: так быстрее, чем поддерживать их при каждой вставке
+    with sync_engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {Review.__tablename__} RESTART IDENTITY"))
+        for index in Review.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    if args.vectors == "model":
+        from app.services.embedding import current_model, encode_batch, sentiment_columns
+        model = current_model()
+
+    print(f"Загрузка {rows} синтетических отзывов ({args.vectors} векторы)...")
+    started = time.time()
+    loaded = 0
+    connection = sync_engine.raw_connection()
+    try:
+        for number, (texts, labels) in enumerate(corpus_chunks(rows, args.chunk_size, args.seed)):
+            if args.vectors == "model":
+                vectors, logits = encode_batch(texts, with_logits=True, model=model)
+                sentiments = [(row["sentiment_label"], row["sentiment_score"]) for row in sentiment_columns(logits)]
+                version = model.version
+            else:
+                vectors = synthetic_vectors(labels, seed=args.seed * 1_000_003 + number)
+                sentiments = [(SENTIMENT_LABELS[label], 0.25 + 0.5 * label) for label in labels]
+                version = "synthetic"
+
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                [text_, to_db(vector), label, score, len(text_), "bench", version]
+                for text_, vector, (label, score) in zip(texts, vectors, sentiments)
+            )
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {Review.__tablename__} (text, vector, sentiment_label, sentiment_score, text_length, "
+                    "source, model_version) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+            connection.commit()
+            loaded += len(texts)
+            elapsed = time.time() - started
+            print(f"   {loaded}/{rows} ({loaded / max(elapsed, 1e-9):.0f} строк/с)")
+    finally:
+        connection.close()
+
+    print("Построение индексов...")
+    index_started = time.time()
+    with sync_engine.begin() as conn:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, true)"), {"value": args.maintenance_work_mem})
+        for index in Review.__table__.indexes:
+            index.create(conn)
+        conn.execute(text(f"ANALYZE {Review.__tablename__}"))
+        total = conn.execute(select(func.count()).select_from(Review)).scalar()
+
+    corpus_generation.bump()
+    print(f"✅ Корпус загружен: {total} строк, загрузка {time.time() - started:.0f} с, "
+          f"индексы {time.time() - index_started:.0f} с")
+
+if __name__ == "__main__":
+    main()
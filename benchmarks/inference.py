@@ -0,0 +1,52 @@
+# Бенчмарки векторизации: пропускная способность токенизатора, одиночный и батчевый прямой проход
+
+import time
+from typing import List
+from benchmarks.common import latency_summary
+from app.services.embedding import (
+    EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_STRATEGY, MAX_SEQ_LENGTH, current_model, encode_inputs, tokenize_batch
+)
+
+def _batches(texts: List[str], batch_size: int):
+    return [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+def bench_tokenizer(texts: List[str], batch_size: int = EMBEDDING_MAX_BATCH_SIZE, repeat: int = 3) -> dict:
+    """Тексты и токены в секунду при токенизации батчами (лучший из repeat проходов)"""
+    model = current_model()
+    best = float("inf")
+    tokens = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        batches = [tokenize_batch(batch, model=model) for batch in _batches(texts, batch_size)]
+        best = min(best, time.perf_counter() - started)
+        tokens = sum(int(inputs["attention_mask"].sum()) for batch in batches for _, inputs in batch.buckets)
+    return {
+        "texts": len(texts),
+        "batch_size": batch_size,
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "strategy": EMBEDDING_STRATEGY,
+        "texts_per_s": round(len(texts) / best, 1),
+        "tokens_per_s": round(tokens / best, 1),
+    }
+
+def bench_forward(texts: List[str], batch_size: int = EMBEDDING_MAX_BATCH_SIZE) -> dict:
+    """Прямые проходы по одному тексту и батчами batch_size на заранее токенизированных входах"""
+    model = current_model()
+    # Прогрев: первые проходы включают инициализацию пулов потоков и аллокаторов
+    encode_inputs(tokenize_batch(texts[:batch_size], model=model))
+
+    results = {}
+    for name, size in (("single", 1), ("batched", batch_size)):
+        batches = [tokenize_batch(batch, model=model) for batch in _batches(texts, size)]
+        timings = []
+        for batch in batches:
+            started = time.perf_counter()
+            encode_inputs(batch)
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            "batch_size": size,
+            "texts_per_s": round(len(texts) / sum(timings), 1),
+            **latency_summary(timings),
+        }
+    results["batched_speedup"] = round(results["batched"]["texts_per_s"] / results["single"]["texts_per_s"], 2)
+    return results
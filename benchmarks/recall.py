@@ -0,0 +1,47 @@
+# Бенчмарк полноты: recall@k и задержка ANN-поиска для набора параметров относительно точного перебора
+
+from argparse import Namespace
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import func, select
+from benchmarks.common import latency_summary
+from app.models.review import Review, VECTOR_INDEX_TYPE, VECTOR_STORAGE
+from app.dependencies import SessionLocal
+from scripts.eval_recall import ann_ids, exact_ids
+
+def bench_recall(
+    k: int,
+    samples: int,
+    ef_search: Optional[List[int]] = None,
+    probes: Optional[List[int]] = None,
+    storage: str = VECTOR_STORAGE
+) -> dict:
+    """recall@k для каждого значения ef_search (HNSW) или probes (IVFFlat) на векторах случайных отзывов"""
+    if VECTOR_INDEX_TYPE == "hnsw":
+        grid = [{"ef_search": value, "probes": None} for value in ef_search or [None]]
+    else:
+        grid = [{"ef_search": None, "probes": value} for value in probes or [None]]
+
+    with SessionLocal() as session:
+        queries = session.execute(select(Review.vector).order_by(func.random()).limit(samples)).scalars().all()
+        session.rollback()
+        if not queries:
+            return {"skipped": "таблица reviews пуста"}
+
+        expected = [set(exact_ids(session, embedding, k)) for embedding in queries]
+        results = []
+        for params in grid:
+            args = Namespace(k=k, storage=storage, **params)
+            recalls = []
+            timings = []
+            for embedding, exact in zip(queries, expected):
+                found, elapsed = ann_ids(session, embedding, args)
+                recalls.append(len(exact & set(found)) / max(1, len(exact)))
+                timings.append(elapsed)
+            results.append({
+                **params,
+                "recall": round(float(np.mean(recalls)), 4),
+                "recall_min": round(float(np.min(recalls)), 4),
+                **latency_summary(timings),
+            })
+    return {"index_type": VECTOR_INDEX_TYPE, "storage": storage, "k": k, "samples": len(queries), "grid": results}
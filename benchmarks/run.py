@@ -0,0 +1,149 @@
+# Запуск бенчмарков и сохранение результатов в JSON для сравнения между коммитами
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from sqlalchemy import func, select
+from benchmarks.corpus import synthetic_reviews
+from app.models.review import Review, VECTOR_INDEX_TYPE, VECTOR_STORAGE, HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS
+from app.dependencies import SessionLocal
+from app.services.embedding import (
+    EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_STRATEGY, ENCODER_BACKEND, MAX_SEQ_LENGTH, TORCH_NUM_THREADS, model_version,
+    warm_up
+)
+from app.services.vector_index import SEARCH_BACKEND
+
+SUITES = ("tokenizer", "forward", "insert", "search", "recall")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки векторизации, вставки и поиска (результат - JSON)")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--output", help="Файл результата (по умолчанию benchmarks/results/<коммит>.json)")
+    parser.add_argument("--texts", type=int, default=512, help="Текстов для бенчмарков токенизатора и модели")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_MAX_BATCH_SIZE)
+    parser.add_argument("--inserts", type=int, default=200, help="Отзывов для бенчмарка вставки")
+    parser.add_argument("--queries", type=int, default=200, help="Запросов для бенчмарка поиска")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8],
+                        help="Число одновременных запросов вставки и поиска")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--recall-samples", type=int, default=100)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[20, 40, 100, 200],
+                        help="Значения hnsw.ef_search для recall@k")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 5, 10, 20],
+                        help="Значения ivfflat.probes для recall@k")
+    parser.add_argument("--seed", type=int, default=1, help="Seed текстов бенчмарка (корпус загружен с другим)")
+    return parser.parse_args()
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def environment() -> dict:
+    """Настройки, от которых зависят результаты: без них сравнение прогонов бессмысленно"""
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpu_count": os.cpu_count(),
+        "torch_threads": TORCH_NUM_THREADS or torch.get_num_threads(),
+        "encoder_backend": ENCODER_BACKEND,
+        "model_version": model_version(),
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "embedding_strategy": EMBEDDING_STRATEGY,
+        "search_backend": SEARCH_BACKEND,
+        "vector_index_type": VECTOR_INDEX_TYPE,
+        "vector_storage": VECTOR_STORAGE,
+        "hnsw_m": HNSW_M,
+        "hnsw_ef_construction": HNSW_EF_CONSTRUCTION,
+        "ivfflat_lists": IVFFLAT_LISTS,
+    }
+
+def corpus_rows() -> int:
+    with SessionLocal() as session:
+        return session.execute(select(func.count()).select_from(Review)).scalar()
+
+async def api_suites(args, texts, queries, suites) -> dict:
+    from benchmarks.api import (
+        api_client, bench_add_review, bench_add_reviews, bench_search_celery, bench_search_direct
+    )
+
+    results = {}
+    async with api_client() as client:
+        if "insert" in suites:
+            results["insert"] = {
+                "add_review": {
+                    f"c{concurrency}": await bench_add_review(client, texts[:args.inserts], concurrency)
+                    for concurrency in args.concurrency
+                },
+                "add_reviews": await bench_add_reviews(client, texts[:args.inserts], args.batch_size),
+            }
+        if "search" in suites:
+            results["search"] = {"direct": {}, "celery": {}}
+            for concurrency in args.concurrency:
+                results["search"]["direct"][f"c{concurrency}"] = await bench_search_direct(
+                    client, queries, args.k, concurrency
+                )
+                results["search"]["celery"][f"c{concurrency}"] = await bench_search_celery(
+                    client, queries, args.k, concurrency
+                )
+    return results
+
+def main():
+    args = parse_args()
+    suites = set(args.suites)
+
+    # Тексты бенчмарка не совпадают с корпусом: кэши векторов и результатов не дают попаданий
+    texts, _ = synthetic_reviews(max(args.texts, args.inserts), seed=args.seed)
+    queries, _ = synthetic_reviews(args.queries, seed=args.seed + 1)
+
+    # Размер корпуса до бенчмарка вставки, который добавляет в него строки
+    rows = corpus_rows() if suites & {"insert", "search", "recall"} else None
+
+    started = time.time()
+    warm_up()
+    results = {"model_load_s": round(time.time() - started, 3)}
+
+    if "tokenizer" in suites:
+        from benchmarks.inference import bench_tokenizer
+        print("Токенизатор...")
+        results["tokenizer"] = bench_tokenizer(texts[:args.texts], args.batch_size)
+    if "forward" in suites:
+        from benchmarks.inference import bench_forward
+        print("Прямой проход модели...")
+        results["forward"] = bench_forward(texts[:args.texts], args.batch_size)
+    if suites & {"insert", "search"}:
+        print("Вставка и поиск через API...")
+        results.update(asyncio.run(api_suites(args, texts, queries, suites)))
+    if "recall" in suites:
+        from benchmarks.recall import bench_recall
+        print("Полнота ANN-поиска...")
+        results["recall"] = bench_recall(args.k, args.recall_samples, args.ef_search, args.probes)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "duration_s": round(time.time() - started, 1),
+        "corpus_rows": rows,
+        "environment": environment(),
+        "results": results,
+    }
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Результаты сохранены: {output}")
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,12 @@ import os
 import time
 import torch
 from datasets import load_dataset
-from transformers import DistilBertTokenizer, DistilBertForSequenceClassification, Trainer, TrainingArguments
+from transformers import (
+    DataCollatorWithPadding, DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer, TrainingArguments
+)
+
+# Максимальная длина отзыва при обучении; паддинг - динамический, до самого длинного отзыва в батче
+TRAIN_MAX_SEQ_LENGTH = 256
 
 def check_model_exists():
     """Проверка существования полной обученной модели"""
@@ -45,7 +50,7 @@ def check_model_exists():
             model_path, 
             local_files_only=True
         )
-        tokenizer = DistilBertTokenizer.from_pretrained(
+        tokenizer = DistilBertTokenizerFast.from_pretrained(
             model_path, 
             local_files_only=True
         )
@@ -139,16 +144,16 @@ def main():
     # Инициализация токенизатора
     print("🔧 Инициализация токенизатора...")
     try:
-        tokenizer = DistilBertTokenizer.from_pretrained('distilbert-base-uncased')
+        tokenizer = DistilBertTokenizerFast.from_pretrained('distilbert-base-uncased')
         print("Токенизатор успешно загружен")
     except Exception as e:
         print(f"Ошибка загрузки токенизатора: {e}")
         remove_training_marker()
         raise e
     
-    # Функция токенизации
+    # Функция токенизации (без паддинга: его добавляет DataCollatorWithPadding для каждого батча)
     def tokenize_function(examples):
-        return tokenizer(examples["text"], padding="max_length", truncation=True, max_length=256)
+        return tokenizer(examples["text"], truncation=True, max_length=TRAIN_MAX_SEQ_LENGTH)
     
     # Токенизация датасетов
     print("Токенизация датасетов...")
@@ -192,6 +197,7 @@ def main():
         push_to_hub=False,
         dataloader_pin_memory=False,
         remove_unused_columns=True,
+        group_by_length=True,  # батчи из отзывов близкой длины - меньше паддинга
         load_best_model_at_end=False,
         disable_tqdm=False,
     )
@@ -203,6 +209,7 @@ def main():
         args=training_args,
         train_dataset=train_tokenized,
         eval_dataset=eval_tokenized,
+        data_collator=DataCollatorWithPadding(tokenizer),
     )
     
     # Дообучение модели на IMDB датасете
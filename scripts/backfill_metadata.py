@@ -0,0 +1,76 @@
+# Заполнение метаданных (тональность, длина текста, источник) у отзывов, добавленных до их появления
+
+import argparse
+import time
+import numpy as np
+from sqlalchemy import bindparam, func, or_, select, update
+from app.models.review import Review
+from app.dependencies import SessionLocal
+from app.services.cache import corpus_generation
+from app.services.embedding import check_model_ready, sentiment_columns, vector_logits
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Заполнение sentiment_label, sentiment_score, text_length и source у старых строк reviews"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--source", default="legacy", help="Источник для строк без source")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not check_model_ready():
+        print("Дообученная модель не найдена - тональность определить нечем")
+        return
+
+    statement = (
+        update(Review.__table__)
+        .where(Review.__table__.c.id == bindparam("row_id"))
+        .values(
+            sentiment_label=bindparam("label"),
+            sentiment_score=bindparam("score"),
+            text_length=func.length(Review.__table__.c.text),
+            source=func.coalesce(Review.__table__.c.source, args.source)
+        )
+    )
+    incomplete = or_(
+        Review.sentiment_label.is_(None), Review.sentiment_score.is_(None),
+        Review.text_length.is_(None), Review.source.is_(None)
+    )
+
+    with SessionLocal() as session:
+        pending = session.execute(select(func.count()).select_from(Review).where(incomplete)).scalar()
+        print(f"Строк без метаданных: {pending}")
+
+        # Обход по первичному ключу короткими транзакциями, как в project_vectors.py apply
+        last_id = 0
+        done = 0
+        started = time.time()
+        while True:
+            rows = session.execute(
+                select(Review.id, Review.vector)
+                .where(Review.id > last_id, Review.vector.isnot(None), incomplete)
+                .order_by(Review.id)
+                .limit(args.batch_size)
+            ).all()
+            if not rows:
+                break
+
+            # Логиты по сохраненным векторам: повторный проход энкодера по текстам не нужен
+            logits = vector_logits(np.stack([np.asarray(row.vector, dtype=np.float32) for row in rows]))
+            session.execute(statement, [
+                {"row_id": row.id, "label": sentiment["sentiment_label"], "score": sentiment["sentiment_score"]}
+                for row, sentiment in zip(rows, sentiment_columns(logits))
+            ])
+            session.commit()
+
+            last_id = rows[-1].id
+            done += len(rows)
+            elapsed = time.time() - started
+            print(f"   {done}/{pending} ({done / max(elapsed, 1e-9):.0f} строк/с)")
+
+    corpus_generation.bump()
+    print("✅ Метаданные заполнены")
+
+if __name__ == "__main__":
+    main()
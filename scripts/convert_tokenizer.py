@@ -0,0 +1,60 @@
+# Преобразование токенизатора сохраненной модели в быстрый (Rust) формат tokenizer.json
+
+import os
+import sys
+import time
+import argparse
+from transformers import DistilBertTokenizer
+from app.services.embedding import MODEL_PATH, MAX_SEQ_LENGTH, TOKENIZER_FILE, check_model_ready, load_tokenizer
+from scripts.export_onnx import SAMPLE_TEXTS
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сохранение tokenizer.json и сверка с медленным токенизатором")
+    parser.add_argument("--model-path", default=MODEL_PATH, help="Каталог модели")
+    parser.add_argument("--texts-file", help="Файл с текстами для сверки (по одному на строку)")
+    parser.add_argument("--repeat", type=int, default=20, help="Число повторов при замере скорости")
+    parser.add_argument("--force", action="store_true", help="Пересоздать tokenizer.json, даже если он уже есть")
+    return parser.parse_args()
+
+def measure(tokenizer, texts, repeat):
+    """Медианное время токенизации всего списка текстов (секунды)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tokenizer(texts, truncation=True, max_length=MAX_SEQ_LENGTH)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[len(timings) // 2]
+
+def main():
+    args = parse_args()
+    if args.model_path == MODEL_PATH and not check_model_ready(MODEL_PATH):
+        print(f"Дообученная модель не найдена по пути {MODEL_PATH}")
+        sys.exit(1)
+
+    target = os.path.join(args.model_path, TOKENIZER_FILE)
+    if args.force and os.path.exists(target):
+        os.remove(target)
+    fast = load_tokenizer(args.model_path)
+    slow = DistilBertTokenizer.from_pretrained(args.model_path, local_files_only=True)
+
+    texts = SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    # Быстрый токенизатор должен давать те же идентификаторы, иначе векторы изменятся
+    expected = slow(texts, truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+    actual = fast(texts, truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+    mismatched = [position for position, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    if mismatched:
+        print(f"❌ Токены расходятся с медленным токенизатором в {len(mismatched)} из {len(texts)} текстах")
+        sys.exit(1)
+
+    slow_time = measure(slow, texts, args.repeat)
+    fast_time = measure(fast, texts, args.repeat)
+    print(f"✅ {target}: токены совпадают на {len(texts)} текстах")
+    print(f"   токенизация: медленный {slow_time * 1000:.2f} мс, быстрый {fast_time * 1000:.2f} мс "
+          f"({slow_time / max(fast_time, 1e-9):.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Оценка полноты (recall@k) ANN-поиска относительно точного перебора
+
+import argparse
+import time
+import numpy as np
+from sqlalchemy import func, select, text
+from app.models.review import Review, VECTOR_INDEX_NAME, VECTOR_STORAGE, VECTOR_STORAGES
+from app.dependencies import SessionLocal
+from app.services.search import search_settings, similar_reviews_query, similar_reviews_params
+
+set_local = text("SELECT set_config(:name, :value, true)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сравнение ANN-поиска с точным перебором на случайных векторах корпуса")
+    parser.add_argument("--storage", choices=VECTOR_STORAGES, default=VECTOR_STORAGE,
+                        help="Представление векторов, по которому построен индекс")
+    parser.add_argument("--k", type=int, default=10, help="Число соседей")
+    parser.add_argument("--samples", type=int, default=100, help="Число запросов (векторы случайных отзывов)")
+    parser.add_argument("--ef-search", type=int, default=None, help="hnsw.ef_search для ANN-поиска")
+    parser.add_argument("--probes", type=int, default=None, help="ivfflat.probes для ANN-поиска")
+    return parser.parse_args()
+
+def exact_ids(session, embedding, k):
+    """Точный результат: последовательный перебор без индекса"""
+    session.execute(set_local, {"name": "enable_indexscan", "value": "off"})
+    ids = [row.id for row in session.execute(
+        similar_reviews_query("full"), similar_reviews_params(embedding, k, "full")
+    )]
+    session.rollback()
+    return ids
+
+def ann_ids(session, embedding, args):
+    for name, value in search_settings(args.k, args.ef_search, args.probes, storage=args.storage).items():
+        session.execute(set_local, {"name": name, "value": value})
+    started = time.perf_counter()
+    ids = [row.id for row in session.execute(
+        similar_reviews_query(args.storage), similar_reviews_params(embedding, args.k, args.storage)
+    )]
+    elapsed = time.perf_counter() - started
+    session.rollback()
+    return ids, elapsed
+
+def main():
+    args = parse_args()
+
+    with SessionLocal() as session:
+        queries = session.execute(select(Review.vector).order_by(func.random()).limit(args.samples)).scalars().all()
+        table_size, index_size = session.execute(
+            text("SELECT pg_table_size('reviews'), pg_relation_size(to_regclass(:index))"),
+            {"index": VECTOR_INDEX_NAME}
+        ).one()
+        session.rollback()
+
+        recalls = []
+        latencies = []
+        for embedding in queries:
+            expected = set(exact_ids(session, embedding, args.k))
+            found, elapsed = ann_ids(session, embedding, args)
+            recalls.append(len(expected & set(found)) / max(1, len(expected)))
+            latencies.append(elapsed * 1000)
+
+    if not recalls:
+        print("Таблица reviews пуста - оценивать нечего")
+        return
+
+    print(f"📊 Представление: {args.storage}, k={args.k}, запросов: {len(recalls)}")
+    print(f"   recall@{args.k}: среднее {np.mean(recalls):.4f}, минимум {np.min(recalls):.4f}")
+    print(f"   задержка ANN: p50 {np.percentile(latencies, 50):.1f} мс, p95 {np.percentile(latencies, 95):.1f} мс")
+    print(f"   размер таблицы: {table_size / 2**20:.1f} МБ, индекса {VECTOR_INDEX_NAME}: {(index_size or 0) / 2**20:.1f} МБ")
+
+if __name__ == "__main__":
+    main()
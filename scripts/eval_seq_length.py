@@ -0,0 +1,97 @@
+# Компромисс между максимальной длиной последовательности, задержкой и качеством векторов
+
+import sys
+import time
+import argparse
+import numpy as np
+from sqlalchemy import func, select
+from app.services.embedding import (
+    EMBEDDING_BUCKET_TOKENS, EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_STRATEGIES, EMBEDDING_STRATEGY, MAX_SEQ_LENGTH,
+    check_model_ready, encode_inputs, load_model, tokenize_batch
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Задержка и качество векторов в зависимости от MAX_SEQ_LENGTH")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[64, 128, 256, 384, 512],
+                        help="Проверяемые максимальные длины; эталон - наибольшая")
+    parser.add_argument("--samples", type=int, default=500, help="Число случайных отзывов из таблицы reviews")
+    parser.add_argument("--texts-file", help="Файл с текстами вместо таблицы reviews (по одному на строку)")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_MAX_BATCH_SIZE, help="Размер батча")
+    parser.add_argument("--bucket-tokens", type=int, default=EMBEDDING_BUCKET_TOKENS,
+                        help="Бюджет токенов части батча (0 - без группировки по длине)")
+    parser.add_argument("--strategy", choices=EMBEDDING_STRATEGIES, default=EMBEDDING_STRATEGY,
+                        help="Стратегия векторизации длинных отзывов (эталон - cls с наибольшей длиной)")
+    parser.add_argument("--k", type=int, default=10, help="Число соседей для recall@k внутри выборки")
+    return parser.parse_args()
+
+def load_texts(args):
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()][:args.samples]
+
+    from app.dependencies import SessionLocal
+    from app.models.review import Review
+
+    with SessionLocal() as session:
+        return session.execute(select(Review.text).order_by(func.random()).limit(args.samples)).scalars().all()
+
+def embed(texts, max_length, batch_size, bucket_tokens, strategy="cls"):
+    """Векторы текстов батчами и суммарное время токенизации и прямых проходов (секунды)"""
+    chunks = []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        batch = tokenize_batch(texts[start:start + batch_size], max_length, bucket_tokens, strategy)
+        chunks.append(encode_inputs(batch))
+    return np.concatenate(chunks), time.perf_counter() - started
+
+def neighbours(vectors, k):
+    """k ближайших по косинусу текстов выборки для каждого текста (без него самого)"""
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = unit @ unit.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+def main():
+    args = parse_args()
+    if not check_model_ready():
+        print("Дообученная модель не найдена")
+        sys.exit(1)
+
+    texts = load_texts(args)
+    if len(texts) <= args.k:
+        print("Недостаточно текстов для оценки")
+        sys.exit(1)
+
+    _, tokenizer = load_model()
+    token_counts = np.array([len(ids) for ids in tokenizer(texts, truncation=False)["input_ids"]])
+    # Прогрев, чтобы первая длина не платила за инициализацию
+    embed(texts[:args.batch_size], min(args.lengths), args.batch_size, args.bucket_tokens)
+
+    lengths = sorted(args.lengths)
+    reference, _ = embed(texts, lengths[-1], args.batch_size, args.bucket_tokens)
+    reference_neighbours = neighbours(reference, args.k)
+
+    print(f"📊 {len(texts)} текстов, токенов на текст: медиана {np.median(token_counts):.0f}, "
+          f"p95 {np.percentile(token_counts, 95):.0f}; эталон cls, max_length={lengths[-1]}; "
+          f"стратегия {args.strategy}")
+    print(f"{'max_length':>10}{'обрезано':>10}{'мс/текст':>10}{'мин. cos':>10}{'сред. cos':>10}{'recall@' + str(args.k):>11}")
+    for length in lengths:
+        vectors, elapsed = embed(texts, length, args.batch_size, args.bucket_tokens, args.strategy)
+        similarity = np.sum(vectors * reference, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        found = neighbours(vectors, args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(reference_neighbours, found)])
+        truncated = np.mean(token_counts > length) * 100
+        marker = "  <- MAX_SEQ_LENGTH" if length == MAX_SEQ_LENGTH else ""
+        print(f"{length:>10}{truncated:>9.1f}%{elapsed / len(texts) * 1000:>10.2f}"
+              f"{similarity.min():>10.4f}{similarity.mean():>10.4f}{recall:>11.4f}{marker}")
+
+    # Эффект группировки по длине при текущей максимальной длине
+    _, plain = embed(texts, MAX_SEQ_LENGTH, args.batch_size, 0)
+    _, bucketed = embed(texts, MAX_SEQ_LENGTH, args.batch_size, args.bucket_tokens or EMBEDDING_BUCKET_TOKENS)
+    print(f"\nГруппировка по длине (max_length={MAX_SEQ_LENGTH}): без нее {plain / len(texts) * 1000:.2f} мс/текст, "
+          f"с ней {bucketed / len(texts) * 1000:.2f} мс/текст ({plain / max(bucketed, 1e-9):.2f}x)")
+
+if __name__ == "__main__":
+    main()
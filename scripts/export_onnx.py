@@ -0,0 +1,125 @@
+# Экспорт энкодера в ONNX, int8-квантизация и проверка согласованности с эталонными fp32-векторами
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+from transformers import DistilBertForSequenceClassification
+from app.services.embedding import MODEL_PATH, MAX_SEQ_LENGTH, check_model_ready, load_tokenizer
+from app.services.encoders import ClsEncoder, TorchEncoder, create_encoder, onnx_path
+
+# Тексты для проверки по умолчанию: короткие и длинные отзывы разной тональности
+SAMPLE_TEXTS = [
+    "I loved this film!",
+    "Terrible plot, wooden acting and a painfully long runtime.",
+    "An absolute masterpiece. The cinematography alone is worth the ticket price.",
+    "Not great, not terrible. Watchable once if you have nothing better to do.",
+    "The first half drags, but the ending completely changes how you see the story. "
+    "The lead actress carries every scene and the score is haunting. " * 8,
+    "Worst movie I have seen this year.",
+    "A charming family comedy with a surprisingly clever script.",
+    "The special effects look cheap and the dialogue is laughable, yet somehow I enjoyed it.",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Экспорт энкодера в ONNX и проверка бэкендов инференса")
+    parser.add_argument("--int8", action="store_true", help="Дополнительно сохранить int8-квантизованную ONNX-модель")
+    parser.add_argument("--opset", type=int, default=14, help="Версия opset ONNX")
+    parser.add_argument("--validate-only", action="store_true", help="Только проверить уже экспортированные модели")
+    parser.add_argument("--texts-file", help="Файл с текстами для проверки (по одному на строку)")
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="Минимально допустимое косинусное сходство с fp32-векторами")
+    parser.add_argument("--repeat", type=int, default=5, help="Число повторов при замере задержки")
+    return parser.parse_args()
+
+def export_onnx(model, tokenizer, path, opset):
+    """Экспорт энкодера с динамическими размерами батча и длины последовательности"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dummy = tokenizer(["export sample text"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            ClsEncoder(model).eval(),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "embedding": {0: "batch"},
+            },
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    print(f"ONNX-модель сохранена: {path} ({os.path.getsize(path) / 2**20:.1f} МБ)")
+
+def quantize_onnx(source, target):
+    """Динамическая int8-квантизация весов ONNX-модели"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    print(f"int8 ONNX-модель сохранена: {target} ({os.path.getsize(target) / 2**20:.1f} МБ)")
+
+def measure(encoder, inputs, repeat):
+    """Векторы и медианная задержка прямого прохода по батчу"""
+    vectors = encoder.encode(inputs)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encoder.encode(inputs)
+        timings.append(time.perf_counter() - started)
+    return vectors, float(np.median(timings))
+
+def cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+def main():
+    args = parse_args()
+    if not check_model_ready(MODEL_PATH):
+        print(f"Дообученная модель не найдена по пути {MODEL_PATH}")
+        sys.exit(1)
+
+    model = DistilBertForSequenceClassification.from_pretrained(MODEL_PATH, local_files_only=True)
+    tokenizer = load_tokenizer(MODEL_PATH)
+    model.eval()
+
+    if not args.validate_only:
+        export_onnx(model, tokenizer, onnx_path(MODEL_PATH, "onnx"), args.opset)
+        if args.int8:
+            quantize_onnx(onnx_path(MODEL_PATH, "onnx"), onnx_path(MODEL_PATH, "onnx-int8"))
+
+    texts = SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=MAX_SEQ_LENGTH)
+
+    # Эталон - PyTorch fp32
+    reference, reference_latency = measure(TorchEncoder(model), inputs, args.repeat)
+    print(f"\nПроверка на {len(texts)} текстах (эталон torch fp32: {reference_latency * 1000:.1f} мс на батч)")
+    print(f"{'бэкенд':<12} {'мин. cos':>10} {'сред. cos':>10} {'мс/батч':>10} {'ускорение':>10}")
+
+    failed = False
+    for backend in ("torch-int8", "onnx", "onnx-int8"):
+        if backend.startswith("onnx") and not os.path.exists(onnx_path(MODEL_PATH, backend)):
+            continue
+        try:
+            encoder = create_encoder(MODEL_PATH, backend)
+        except Exception as e:
+            print(f"{backend:<12} недоступен: {e}")
+            continue
+        vectors, latency = measure(encoder, inputs, args.repeat)
+        similarity = cosine(reference, vectors)
+        ok = similarity.min() >= args.min_cosine
+        failed = failed or not ok
+        print(f"{backend:<12} {similarity.min():>10.5f} {similarity.mean():>10.5f} "
+              f"{latency * 1000:>10.1f} {reference_latency / latency:>9.2f}x{'' if ok else '  НИЖЕ ПОРОГА'}")
+
+    if failed:
+        print(f"\nСходство с fp32 ниже порога {args.min_cosine} - такой бэкенд не рекомендуется")
+        sys.exit(1)
+    print("\nВсе бэкенды согласованы с fp32-векторами")
+
+if __name__ == "__main__":
+    main()
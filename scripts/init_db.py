@@ -1,7 +1,11 @@
 import asyncio
 import time
 from sqlalchemy import text
-from app.models.review import Base
+from sqlalchemy.schema import CreateColumn
+from app.models.review import Base, Review, VECTOR_INDEX_TYPE, VECTOR_STORAGE
+# Импорт моделей регистрирует таблицы ingest_checkpoints и corpus_state в Base.metadata
+import app.models.corpus  # noqa: F401
+import app.models.ingest  # noqa: F401
 from app.dependencies import async_engine
 
 async def create_tables():
@@ -34,6 +38,23 @@ async def create_tables():
                 # Создаем таблицы
                 await conn.run_sync(Base.metadata.create_all)
                 print("Таблицы базы данных успешно созданы!")
+                
+                # create_all не изменяет существующие таблицы - добавляем новые необязательные столбцы
+                for column in Review.__table__.columns:
+                    if column.primary_key or not column.nullable:
+                        continue
+                    # Описание столбца целиком: для генерируемых (text_tsv) - с выражением GENERATED ALWAYS AS.
+                    # Добавление генерируемого столбца перезаписывает таблицу и может занять время
+                    column_spec = CreateColumn(column).compile(dialect=conn.dialect)
+                    await conn.execute(text(
+                        f"ALTER TABLE {Review.__tablename__} ADD COLUMN IF NOT EXISTS {column_spec}"
+                    ))
+                
+                # create_all создает индексы только вместе с новой таблицей,
+                # поэтому для существующей таблицы добавляем недостающие индексы отдельно
+                for index in Review.__table__.indexes:
+                    await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
+                print(f"Векторный индекс: {VECTOR_INDEX_TYPE} ({VECTOR_STORAGE})")
                 return
                 
         except Exception as e:
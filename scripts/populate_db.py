@@ -1,18 +1,30 @@
 import os
+import io
+import csv
 import time
-import torch
+import queue
+import argparse
+import threading
 from datasets import load_dataset
-from transformers import DistilBertForSequenceClassification, DistilBertTokenizer
+from pgvector.utils import to_db
 from app.models.review import Review
-from app.dependencies import SessionLocal
+from app.models.ingest import IngestCheckpoint
+from app.dependencies import SessionLocal, sync_engine
+from app.services.embedding import load_model, tokenize_batch, encode_inputs, sentiment_columns
+from app.services.cache import corpus_generation
+from app.services.projection import projected_columns
+from app.services.model_registry import REQUIRED_MODEL_FILES, current_version
+
+# Параметры загрузки по умолчанию
+POPULATE_LIMIT = int(os.getenv("POPULATE_LIMIT", "1000"))  # 0 - весь сплит
+POPULATE_SPLIT = os.getenv("POPULATE_SPLIT", "test")
+POPULATE_BATCH_SIZE = int(os.getenv("POPULATE_BATCH_SIZE", "64"))
+
+# Максимальное число батчей, ожидающих между стадиями конвейера
+PIPELINE_DEPTH = 4
 
 def wait_for_model():
     """Умное ожидание готовности обученной модели без жестких таймаутов"""
-    model_path = './fine_tuned_model'
-    config_file = os.path.join(model_path, 'config.json')
-    model_file = os.path.join(model_path, 'pytorch_model.bin')
-    tokenizer_file = os.path.join(model_path, 'special_tokens_map.json')
-    
     waited = 0
     check_interval = 15  # Проверяем каждые 15 секунд
     
@@ -21,12 +33,13 @@ def wait_for_model():
     print("Прогресс обучения можно отслеживать в логах train сервиса.")
     
     while True:
-        # Проверяем существование директории модели
+        # Каталог текущей версии из реестра моделей (указатель current появляется после публикации)
+        _, model_path = current_version()
         if os.path.exists(model_path):
             print(f"Найдена директория модели: {model_path}")
             
             # Проверяем наличие всех необходимых файлов модели
-            required_files = [config_file, model_file, tokenizer_file]
+            required_files = [os.path.join(model_path, file_name) for file_name in REQUIRED_MODEL_FILES]
             existing_files = [f for f in required_files if os.path.exists(f)]
             
             print(f"Найдено файлов модели: {len(existing_files)}/{len(required_files)}")
@@ -36,16 +49,9 @@ def wait_for_model():
                 try:
                     # Попытка загрузить модель для проверки целостности
                     print("Проверка целостности модели...")
-                    model = DistilBertForSequenceClassification.from_pretrained(
-                        model_path, 
-                        local_files_only=True
-                    )
-                    tokenizer = DistilBertTokenizer.from_pretrained(
-                        model_path, 
-                        local_files_only=True
-                    )
+                    load_model()
                     print("Модель успешно загружена и проверена!")
-                    return model, tokenizer
+                    return
                     
                 except Exception as e:
                     print(f"Модель еще не готова (ошибка загрузки): {e}")
@@ -65,39 +71,144 @@ def wait_for_model():
             minutes = waited // 60
             print(f"Прошло {minutes} мин. Продолжаем ожидание завершения обучения...")
 
-def get_imdb_reviews():
-    """Получение 1000 отзывов из датасета IMDB"""
+def get_imdb_dataset(split):
+    """Загрузка сплита датасета IMDB (arrow-файл в кэше, тексты читаются срезами)"""
     try:
-        print("Загрузка датасета IMDB для извлечения векторных представлений...")
-        dataset = load_dataset("imdb")
-        
-        # Берем первые 1000 отзывов из тестового набора
-        reviews = dataset["test"][:1000]["text"]
-        print(f"Загружено {len(reviews)} отзывов из датасета IMDB")
-        return reviews
+        print(f"Загрузка датасета IMDB ({split}) для извлечения векторных представлений...")
+        dataset = load_dataset("imdb", split=split)
+        print(f"Доступно {len(dataset)} отзывов из датасета IMDB")
+        return dataset
         
     except Exception as e:
         print(f"КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить датасет IMDB: {e}")
         print("Извлечение векторных представлений невозможно без настоящих IMDB отзывов.")
         raise e
 
+def get_checkpoint(name):
+    """Позиция, до которой источник уже загружен (None - загрузка не начиналась)"""
+    with SessionLocal() as session:
+        checkpoint = session.get(IngestCheckpoint, name)
+        return checkpoint.position if checkpoint is not None else None
+
+def _put(target_queue, item, stop):
+    """Постановка в очередь с проверкой сигнала остановки конвейера"""
+    while not stop.is_set():
+        try:
+            target_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(source_queue, stop):
+    """Получение из очереди; None - конец данных или остановка конвейера"""
+    while not stop.is_set():
+        try:
+            return source_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return None
+
+def read_and_tokenize(dataset, start, stop_position, batch_size, out_queue, stop, errors):
+    """Стадия 1: чтение отзывов срезами и токенизация"""
+    try:
+        for offset in range(start, stop_position, batch_size):
+            texts = dataset[offset:min(offset + batch_size, stop_position)]["text"]
+            if not _put(out_queue, (offset + len(texts), texts, tokenize_batch(texts)), stop):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(out_queue, None, stop)
+
+def write_batches(in_queue, checkpoint_name, stop, errors, stats):
+    """Стадия 3: запись батчей через COPY и сохранение контрольной точки в той же транзакции.
+
+    Источник отзывов (столбец source) - имя контрольной точки, например imdb:test.
+    """
+    connection = sync_engine.raw_connection()
+    try:
+        while True:
+            item = _get(in_queue, stop)
+            if item is None:
+                return
+            
+            position, texts, vectors, logits, version = item
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            columns = ["text", "vector", "sentiment_label", "sentiment_score", "text_length", "source", "model_version"]
+            rows = [
+                [
+                    text, to_db(vector), sentiment["sentiment_label"], sentiment["sentiment_score"], len(text),
+                    checkpoint_name, version
+                ]
+                for text, vector, sentiment in zip(texts, vectors, sentiment_columns(logits))
+            ]
+            projected = projected_columns(vectors)
+            if projected:
+                # Проекция включена - сразу сохраняем и вектор меньшей размерности
+                columns += ["vector_reduced", "projection_version"]
+                for row, reduced in zip(rows, projected["vector_reduced"]):
+                    row += [to_db(reduced), projected["projection_version"]]
+            writer.writerows(rows)
+            buffer.seek(0)
+            
+            with connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY reviews ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+                cursor.execute(
+                    "INSERT INTO ingest_checkpoints (name, position, updated_at) VALUES (%s, %s, now()) "
+                    "ON CONFLICT (name) DO UPDATE SET position = EXCLUDED.position, updated_at = now()",
+                    (checkpoint_name, position)
+                )
+            connection.commit()
+            corpus_generation.bump()
+            stats["inserted"] += len(texts)
+            stats["position"] = position
+    except Exception as e:
+        connection.rollback()
+        errors.append(e)
+        stop.set()
+    finally:
+        connection.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Заполнение базы данных векторными представлениями отзывов IMDB")
+    parser.add_argument("--limit", type=int, default=POPULATE_LIMIT,
+                        help="Сколько отзывов загрузить (0 - весь сплит)")
+    parser.add_argument("--split", default=POPULATE_SPLIT,
+                        help="Сплит датасета IMDB, например test или train+test для всех 50 000 отзывов")
+    parser.add_argument("--batch-size", type=int, default=POPULATE_BATCH_SIZE,
+                        help="Размер батча векторизации и записи")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    checkpoint_name = f"imdb:{args.split}"
     print("Начинается заполнение базы данных векторными представлениями...")
     
-    # Проверка наличия данных в базе
+    # Проверка состояния загрузки: продолжаем с контрольной точки
     try:
-        with SessionLocal() as session:
-            existing_count = session.query(Review).count()
+        start = get_checkpoint(checkpoint_name)
+        if start is None:
+            with SessionLocal() as session:
+                existing_count = session.query(Review).filter(Review.source == checkpoint_name).count()
             if existing_count > 0:
-                print(f"База данных уже содержит {existing_count} отзывов. Пропуск заполнения...")
+                # Сплит загружен без контрольной точки - повторная загрузка создала бы дубликаты.
+                # Отзывы других сплитов и API загрузке не мешают
+                print(f"База данных уже содержит {existing_count} отзывов {checkpoint_name}. Пропуск заполнения...")
                 return
+            start = 0
+        elif start > 0:
+            print(f"Найдена контрольная точка: загружено {start} отзывов, продолжаем с этой позиции")
     except Exception as e:
         print(f"Предупреждение: Не удалось проверить состояние базы данных: {e}")
         print("Продолжаем с заполнением...")
+        start = 0
     
     # Умное ожидание готовности модели
     try:
-        model, tokenizer = wait_for_model()
+        wait_for_model()
     except KeyboardInterrupt:
         print("\n Процесс прерван пользователем")
         return
@@ -105,56 +216,86 @@ def main():
         print(f"Неожиданная ошибка при ожидании модели: {e}")
         return
     
-    # Установка модели в режим оценки
-    model.eval()
-    print("Модель переведена в режим оценки")
-    
-    # Получение 1000 IMDB отзывов
     try:
-        reviews = get_imdb_reviews()
+        dataset = get_imdb_dataset(args.split)
     except Exception as e:
         print(f"Ошибка загрузки датасета: {e}")
         return
     
-    print(f"Извлечение векторных представлений для {len(reviews)} отзывов...")
-    print("Это займет несколько минут...")
+    stop_position = len(dataset) if args.limit <= 0 else min(args.limit, len(dataset))
+    if start >= stop_position:
+        print(f"Все {stop_position} отзывов уже загружены. Пропуск заполнения...")
+        return
+    
+    print(f"Извлечение векторных представлений для отзывов {start}-{stop_position} "
+          f"батчами по {args.batch_size}...")
     
-    # Генерация векторов и сохранение в базу данных
-    successful_inserts = 0
-    failed_inserts = 0
+    # Конвейер: токенизация, инференс и запись в БД выполняются параллельно
+    tokenized = queue.Queue(maxsize=PIPELINE_DEPTH)
+    embedded = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stop = threading.Event()
+    errors = []
+    stats = {"inserted": 0, "position": start}
     
-    with torch.no_grad():
-        for i, review in enumerate(reviews):
-            # Прогресс каждые 100 отзывов
-            if (i + 1) % 100 == 0:
-                print(f"Обработано {i+1}/{len(reviews)} отзывов... "
-                      f"(Успешно: {successful_inserts}, Ошибок: {failed_inserts})")
+    reader = threading.Thread(
+        target=read_and_tokenize,
+        args=(dataset, start, stop_position, args.batch_size, tokenized, stop, errors),
+        daemon=True
+    )
+    writer = threading.Thread(
+        target=write_batches,
+        args=(embedded, checkpoint_name, stop, errors, stats),
+        daemon=True
+    )
+    reader.start()
+    writer.start()
+    
+    started = time.time()
+    last_report = started
+    try:
+        while True:
+            item = _get(tokenized, stop)
+            if item is None:
+                break
             
-            try:
-                # Токенизация и генерация эмбеддинга
-                inputs = tokenizer(review, return_tensors="pt", truncation=True, max_length=512)
-                outputs = model.distilbert(**inputs)
-                
-                # Извлечение последнего скрытого слоя (CLS токен)
-                embedding = outputs.last_hidden_state[:, 0, :].detach().numpy().tolist()[0]
-                
-                # Сохранение в базу данных
-                with SessionLocal() as session:
-                    db_review = Review(text=review, vector=embedding)
-                    session.add(db_review)
-                    session.commit()
-                    successful_inserts += 1
-                    
-            except Exception as e:
-                print(f"Ошибка обработки отзыва {i}: {e}")
-                failed_inserts += 1
-                continue
+            position, texts, inputs = item
+            # Векторы и логиты тональности из одного прямого прохода; версия - модели, токенизировавшей батч
+            vectors, logits = encode_inputs(inputs, with_logits=True)
+            if not _put(embedded, (position, texts, vectors, logits, inputs.model.version), stop):
+                break
+            
+            # Прогресс не чаще раза в 10 секунд
+            now = time.time()
+            if now - last_report >= 10:
+                last_report = now
+                done = stats["position"] - start
+                rate = done / (now - started) if done else 0
+                eta = (stop_position - stats["position"]) / rate if rate else float("inf")
+                print(f"Обработано {stats['position']}/{stop_position} отзывов "
+                      f"({rate:.1f} отзывов/с, осталось ~{eta:.0f} с)")
+    except KeyboardInterrupt:
+        print("\n Процесс прерван пользователем, прогресс сохранен в контрольной точке")
+        stop.set()
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(embedded, None, stop)
+        writer.join()
+        stop.set()
+        reader.join()
+    
+    elapsed = time.time() - started
+    if errors:
+        print(f"Ошибка заполнения базы данных: {errors[0]}")
+        print(f"Загружено {stats['position']} отзывов, повторный запуск продолжит с этой позиции")
+        raise errors[0]
     
-    print(f"Заполнение базы данных успешно завершено!")
-    print(f"Статистика:")
-    print(f"   - Всего отзывов: {len(reviews)}")
-    print(f"   - Успешно сохранено: {successful_inserts}")
-    print(f"   - Ошибок: {failed_inserts}")
+    print("Заполнение базы данных успешно завершено!")
+    print("Статистика:")
+    print(f"   - Всего отзывов: {stop_position}")
+    print(f"   - Сохранено за этот запуск: {stats['inserted']}")
+    print(f"   - Время: {elapsed:.1f} с ({stats['inserted'] / max(elapsed, 1e-9):.1f} отзывов/с)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
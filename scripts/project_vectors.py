@@ -0,0 +1,169 @@
+# Проекция векторов отзывов в пространство меньшей размерности: обучение, миграция, отчет
+
+import argparse
+import os
+import time
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from app.models.review import Review, PROJECTION_DIM
+from app.dependencies import SessionLocal
+from app.services.cache import corpus_generation
+from app.services.projection import Projection, PROJECTION_METHODS, PROJECTION_PATH, load_projection
+from app.services.model_registry import current_version
+from app.services.search import VECTOR_RERANK_FACTOR
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Проекция векторов reviews.vector (PCA или случайная ортогональная)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fit = commands.add_parser("fit", help="Обучить проекцию на векторах корпуса и сохранить новую версию")
+    fit.add_argument("--method", choices=PROJECTION_METHODS, default="pca")
+    fit.add_argument("--dim", type=int, default=PROJECTION_DIM, help="Размерность после проекции")
+    fit.add_argument("--sample", type=int, default=50000, help="Число случайных векторов для обучения PCA")
+    fit.add_argument("--output-dir", default=None,
+                     help="Каталог версий проекции (по умолчанию projections в каталоге активной версии модели)")
+
+    apply = commands.add_parser("apply", help="Пересчитать vector_reduced для строк другой версии проекции")
+    apply.add_argument("--path", default=PROJECTION_PATH,
+                       help="Файл проекции (по умолчанию PROJECTION_PATH), имя без каталога - среди проекций модели")
+    apply.add_argument("--batch-size", type=int, default=1000)
+
+    report = commands.add_parser("report", help="Полнота поиска в зависимости от размерности")
+    report.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 384])
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--corpus", type=int, default=20000, help="Число случайных векторов корпуса")
+    report.add_argument("--samples", type=int, default=200, help="Число запросов из этих векторов")
+    report.add_argument("--rerank-factor", type=int, default=VECTOR_RERANK_FACTOR,
+                        help="Множитель кандидатов для переранжирования полными векторами")
+    return parser.parse_args()
+
+def sample_vectors(session, limit):
+    """Случайная выборка векторов корпуса"""
+    rows = session.execute(
+        select(Review.vector).where(Review.vector.isnot(None)).order_by(func.random()).limit(limit)
+    ).scalars().all()
+    return np.stack([np.asarray(vector, dtype=np.float32) for vector in rows]) if rows else None
+
+def fit(args):
+    if args.method == "pca":
+        with SessionLocal() as session:
+            sample = sample_vectors(session, args.sample)
+        if sample is None:
+            print("Таблица reviews пуста - обучать PCA не на чем")
+            return
+        projection = Projection.fit_pca(sample, args.dim)
+    else:
+        projection = Projection.fit_random(args.dim)
+
+    projection.model_version = current_version()[0]
+    path = projection.save(args.output_dir)
+    print(f"✅ Проекция для модели {projection.model_version} сохранена: {path}")
+    name = os.path.basename(path) if args.output_dir is None else path
+    print(f"   Для включения: PROJECTION_PATH={name} PROJECTION_DIM={projection.dim}")
+    print("   Затем пересчитайте существующие строки: python scripts/project_vectors.py apply")
+
+def apply(args):
+    if not args.path:
+        print("Не указан файл проекции (--path или PROJECTION_PATH)")
+        return
+    model_version, model_path = current_version()
+    projection = load_projection(model_version, model_path, args.path)
+
+    statement = (
+        update(Review.__table__)
+        .where(Review.__table__.c.id == bindparam("row_id"))
+        .values(
+            vector_reduced=bindparam("reduced", type_=Review.__table__.c.vector_reduced.type),
+            projection_version=projection.version
+        )
+    )
+
+    with SessionLocal() as session:
+        pending = session.execute(
+            select(func.count()).select_from(Review).where(Review.projection_version.is_distinct_from(projection.version))
+        ).scalar()
+        print(f"Строк для пересчета проекцией {projection.version}: {pending}")
+
+        # Обход по первичному ключу: каждая порция - отдельная короткая транзакция,
+        # прерванную миграцию можно просто запустить снова
+        last_id = 0
+        done = 0
+        started = time.time()
+        while True:
+            rows = session.execute(
+                select(Review.id, Review.vector)
+                .where(Review.id > last_id, Review.projection_version.is_distinct_from(projection.version))
+                .order_by(Review.id)
+                .limit(args.batch_size)
+            ).all()
+            if not rows:
+                break
+
+            reduced = projection.apply(np.stack([np.asarray(row.vector, dtype=np.float32) for row in rows]))
+            session.execute(statement, [{"row_id": row.id, "reduced": vector} for row, vector in zip(rows, reduced)])
+            session.commit()
+
+            last_id = rows[-1].id
+            done += len(rows)
+            elapsed = time.time() - started
+            print(f"   {done}/{pending} ({done / max(elapsed, 1e-9):.0f} строк/с)")
+
+    corpus_generation.bump()
+    print("✅ Миграция завершена")
+
+def _top(matrix, queries, count, exclude):
+    """Индексы count ближайших по косинусу строк matrix для каждой строки queries (без самих запросов)"""
+    scores = queries @ matrix.T
+    scores[np.arange(len(queries)), exclude] = -np.inf
+    top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+def _unit(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def report(args):
+    with SessionLocal() as session:
+        corpus = sample_vectors(session, args.corpus)
+    if corpus is None or len(corpus) <= args.k:
+        print("Недостаточно векторов в таблице reviews для отчета")
+        return
+
+    query_positions = np.arange(min(args.samples, len(corpus)))
+    full = _unit(corpus)
+    expected = _top(full, full[query_positions], args.k, query_positions)
+    candidates = min(args.k * max(1, args.rerank_factor), len(corpus) - 1)
+
+    print(f"📊 Полнота recall@{args.k}: корпус {len(corpus)} векторов, {len(query_positions)} запросов, "
+          f"переранжирование {candidates} кандидатов")
+    print(f"{'метод':<8}{'dim':>6}{'байт/вектор':>14}{'recall':>10}{'с перер.':>10}")
+    print(f"{'full':<8}{corpus.shape[1]:>6}{corpus.shape[1] * 4 + 8:>14}{1.0:>10.4f}{1.0:>10.4f}")
+
+    for method in PROJECTION_METHODS:
+        for dim in args.dims:
+            if dim >= corpus.shape[1] or (method == "pca" and dim > len(corpus)):
+                continue
+            projection = Projection.fit_pca(corpus, dim) if method == "pca" else Projection.fit_random(dim)
+            reduced = _unit(projection.apply(corpus))
+
+            found = _top(reduced, reduced[query_positions], args.k, query_positions)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(expected, found)])
+
+            # Кандидаты из пространства меньшей размерности, порядок - по полным векторам
+            coarse = _top(reduced, reduced[query_positions], candidates, query_positions)
+            reranked = []
+            for query, rows in zip(query_positions, coarse):
+                exact = full[rows] @ full[query]
+                reranked.append(rows[np.argsort(-exact)[:args.k]])
+            rerank_recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(expected, reranked)])
+
+            print(f"{method:<8}{dim:>6}{dim * 4 + 8:>14}{recall:>10.4f}{rerank_recall:>10.4f}")
+
+    print("Полнота измерена точным перебором; для ANN-индекса используйте scripts/eval_recall.py")
+
+def main():
+    args = parse_args()
+    {"fit": fit, "apply": apply, "report": report}[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Публикация версий дообученной модели и переключение текущей версии без перезапуска сервисов
+
+import argparse
+import sys
+from app.services.model_registry import (
+    LEGACY_MODEL_PATH, MODEL_REPOSITORY, activate, current_version, list_versions, publish
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Версии модели в MODEL_REPOSITORY и указатель current")
+    parser.add_argument("--repository", default=MODEL_REPOSITORY, help="Каталог версий модели")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = commands.add_parser("publish", help="Скопировать модель в новую версию и сделать ее текущей")
+    publish_parser.add_argument("--source", default=LEGACY_MODEL_PATH, help="Каталог сохраненной модели")
+    publish_parser.add_argument("--version", help="Имя версии (по умолчанию - по отпечатку файлов)")
+    publish_parser.add_argument("--no-activate", action="store_true", help="Только опубликовать, не переключать")
+
+    activate_parser = commands.add_parser("activate", help="Сделать текущей опубликованную версию (в т.ч. откат)")
+    activate_parser.add_argument("version")
+
+    commands.add_parser("list", help="Опубликованные версии и текущая")
+    return parser.parse_args()
+
+def publish_command(args):
+    try:
+        version = publish(args.source, args.version, args.repository, make_current=not args.no_activate)
+    except (FileNotFoundError, FileExistsError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Модель из {args.source} опубликована как {version}")
+    if args.no_activate:
+        print(f"   Для переключения: python scripts/publish_model.py activate {version}")
+    else:
+        print("   API и воркеры Celery перейдут на нее в течение MODEL_RELOAD_INTERVAL секунд")
+
+def activate_command(args):
+    try:
+        activate(args.version, args.repository)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Текущая версия модели: {args.version}")
+
+def list_command(args):
+    current, path = current_version(args.repository)
+    versions = list_versions(args.repository)
+    if not versions:
+        print(f"Опубликованных версий нет, используется {path} ({current})")
+        return
+    for version in versions:
+        print(f"{'*' if version == current else ' '} {version}")
+
+def main():
+    args = parse_args()
+    {"publish": publish_command, "activate": activate_command, "list": list_command}[args.command](args)
+
+if __name__ == "__main__":
+    main()
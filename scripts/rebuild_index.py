@@ -0,0 +1,64 @@
+# Перестроение ANN-индекса по столбцу reviews.vector без блокировки записи
+
+import argparse
+import time
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+from app.models.review import (
+    Review, vector_index, VECTOR_INDEX_TYPE, VECTOR_INDEX_NAME, VECTOR_STORAGE, VECTOR_STORAGES,
+    HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS
+)
+from app.dependencies import sync_engine
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Перестроение векторного индекса reviews.vector (CREATE INDEX CONCURRENTLY)")
+    parser.add_argument("--type", choices=["hnsw", "ivfflat", "none"], default=VECTOR_INDEX_TYPE,
+                        help="Тип индекса (none - удалить индекс)")
+    parser.add_argument("--storage", choices=VECTOR_STORAGES, default=VECTOR_STORAGE,
+                        help="Представление векторов в индексе (должно совпадать с VECTOR_STORAGE сервиса)")
+    parser.add_argument("--m", type=int, default=HNSW_M, help="HNSW: число связей на узел")
+    parser.add_argument("--ef-construction", type=int, default=HNSW_EF_CONSTRUCTION,
+                        help="HNSW: размер списка кандидатов при построении")
+    parser.add_argument("--lists", type=int, default=IVFFLAT_LISTS,
+                        help="IVFFlat: число кластеров (рекомендуется rows / 1000)")
+    parser.add_argument("--maintenance-work-mem", default="1GB",
+                        help="Память для построения индекса (maintenance_work_mem)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    new_name = f"{VECTOR_INDEX_NAME}_new"
+
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with sync_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                     {"value": args.maintenance_work_mem})
+
+        # Остатки прерванного перестроения (невалидный индекс) удаляем
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))
+
+        if args.type != "none":
+            index = vector_index(
+                Review.__table__.c.vector,
+                index_type=args.type,
+                name=new_name,
+                m=args.m,
+                ef_construction=args.ef_construction,
+                lists=args.lists,
+                storage=args.storage,
+                postgresql_concurrently=True
+            )
+            print(f"Построение индекса {args.type} ({args.storage}) {new_name}...")
+            started = time.time()
+            conn.execute(CreateIndex(index))
+            print(f"Индекс построен за {time.time() - started:.1f} с")
+
+        # Старый индекс удаляем без блокировки, новый получает его имя
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX_NAME}"))
+        if args.type != "none":
+            conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {VECTOR_INDEX_NAME}"))
+
+    print("Перестроение векторного индекса завершено!")
+
+if __name__ == "__main__":
+    main()
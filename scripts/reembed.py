@@ -0,0 +1,318 @@
+# Фоновый пересчет векторов корпуса новой версией модели с атомарным переключением поиска
+
+import argparse
+import os
+import sys
+import time
+from sqlalchemy import bindparam, func, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from app.models.corpus import VECTORS_VERSION
+from app.models.review import (
+    Review, SHADOW_COLUMNS, SENTIMENT_LABELS, VECTOR_INDEX_NAME, VECTOR_INDEX_TYPE, VECTOR_PARTIAL_INDEXES,
+    VECTOR_STORAGE, vector_index
+)
+from app.dependencies import SessionLocal, sync_engine
+from app.services.cache import corpus_generation
+from app.services.embedding import configure_threads, current_model, encode_batch, sentiment_columns
+from app.services.model_registry import current_version
+from app.services.projection import PROJECTION_PATH
+
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "64"))
+# Доля времени, которую пересчет занимает процессор и БД: после батча, занявшего t секунд,
+# выдерживается пауза t * (1 / REEMBED_DUTY_CYCLE - 1). 1 - без пауз
+REEMBED_DUTY_CYCLE = float(os.getenv("REEMBED_DUTY_CYCLE", "0.5"))
+
+table = Review.__table__
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Пересчет reviews.vector текущей версией модели в теневые столбцы и переключение поиска на них"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Заполнить теневые столбцы и переключить на них поиск")
+    run.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE)
+    run.add_argument("--duty-cycle", type=float, default=REEMBED_DUTY_CYCLE,
+                     help="Доля времени работы (0..1], остальное - паузы между батчами")
+    run.add_argument("--no-switch", action="store_true", help="Только заполнить теневые столбцы")
+    run.add_argument("--lock-timeout", default="5s", help="Ожидание блокировки таблицы при переключении")
+    run.add_argument("--maintenance-work-mem", default="1GB",
+                     help="Память для построения индекса (maintenance_work_mem)")
+
+    switch = commands.add_parser("switch", help="Дописать оставшиеся строки и переключить поиск")
+    switch.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE)
+    switch.add_argument("--lock-timeout", default="5s")
+    switch.add_argument("--maintenance-work-mem", default="1GB")
+
+    commands.add_parser("status", help="Сколько строк уже пересчитано текущей версией модели")
+    return parser.parse_args()
+
+def pending_condition(target: str):
+    """Строки, которые нужно пересчитать: теневые столбцы не от target и основной вектор тоже не от target"""
+    return (
+        table.c.model_version_next.is_distinct_from(target)
+        & table.c.model_version.is_distinct_from(target)
+    )
+
+def shadow_update(target: str):
+    """UPDATE теневых столбцов одной строки по row_id"""
+    return (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values(
+            vector_next=bindparam("next_vector", type_=table.c.vector_next.type),
+            model_version_next=target,
+            sentiment_label_next=bindparam("label"),
+            sentiment_score_next=bindparam("score")
+        )
+    )
+
+def embed_rows(connection, rows, target: str):
+    """Векторы и тональность строк (id, text) текущей моделью в теневые столбцы"""
+    model = current_model()
+    if model.version != target:
+        raise RuntimeError(f"Загружена модель {model.version}, а пересчет идет версией {target}")
+    vectors, logits = encode_batch([row.text for row in rows], with_logits=True, model=model)
+    connection.execute(shadow_update(target), [
+        {
+            "row_id": row.id,
+            "next_vector": vector,
+            "label": sentiment["sentiment_label"],
+            "score": sentiment["sentiment_score"]
+        }
+        for row, vector, sentiment in zip(rows, vectors, sentiment_columns(logits))
+    ])
+
+def copy_current_rows(connection, target: str) -> int:
+    """Строки, уже векторизованные target (добавленные после переключения указателя), копируются без модели"""
+    result = connection.execute(
+        update(table)
+        .where(table.c.model_version == target, table.c.model_version_next.is_distinct_from(target))
+        .values({shadow: table.c[column] for column, shadow in SHADOW_COLUMNS.items()})
+    )
+    return result.rowcount
+
+def fill_shadow(target: str, batch_size: int, duty_cycle: float) -> bool:
+    """Обход таблицы по первичному ключу короткими транзакциями с паузами по duty_cycle.
+
+    Прерванный запуск продолжается с уже пересчитанными строками: они не попадают в выборку.
+    Возвращает False, если указатель текущей версии сменился во время обхода.
+    """
+    with SessionLocal() as session:
+        pending = session.execute(select(func.count()).select_from(table).where(pending_condition(target))).scalar()
+    print(f"Строк для пересчета версией {target}: {pending}")
+
+    last_id = 0
+    done = 0
+    started = time.time()
+    last_report = started
+    while True:
+        if current_version()[0] != target:
+            print("Указатель текущей версии модели сменился - перезапустите пересчет")
+            return False
+
+        batch_started = time.time()
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(table.c.id, table.c.text)
+                .where(table.c.id > last_id, pending_condition(target))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            embed_rows(session, rows, target)
+            session.commit()
+
+        last_id = rows[-1].id
+        done += len(rows)
+
+        # Ограничение нагрузки: пауза пропорциональна времени батча
+        busy = time.time() - batch_started
+        if duty_cycle < 1:
+            time.sleep(busy * (1 / duty_cycle - 1))
+
+        # Прогресс не чаще раза в 10 секунд
+        now = time.time()
+        if now - last_report >= 10:
+            last_report = now
+            rate = done / (now - started)
+            eta = max(pending - done, 0) / rate if rate else float("inf")
+            print(f"   {done}/{pending} ({rate:.1f} строк/с, осталось ~{eta:.0f} с)")
+
+    with SessionLocal() as session:
+        copied = copy_current_rows(session, target)
+        session.commit()
+    print(f"✅ Пересчитано строк: {done}, скопировано уже актуальных: {copied} за {time.time() - started:.0f} с")
+    return True
+
+def projection_in_use() -> bool:
+    """Включена ли проекция: vector_reduced и его индекс не пересчитываются, а проекция
+    обучена на векторах старой модели, поэтому после переключения поиск по ним неверен"""
+    return VECTOR_STORAGE == "reduced" or bool(PROJECTION_PATH)
+
+def check_switch_allowed():
+    if projection_in_use():
+        print("Переключение при включенной проекции (VECTOR_STORAGE=reduced или PROJECTION_PATH) запрещено: "
+              "vector_reduced останется от старой модели.")
+        print("Заполните теневые столбцы (run --no-switch), переведите сервисы на VECTOR_STORAGE=full "
+              "без PROJECTION_PATH и переключите (switch), затем обучите и примените новую проекцию "
+              "(project_vectors.py fit и apply)")
+        sys.exit(1)
+
+def shadow_indexes():
+    """(индекс по vector_next, имя после переключения) - те же ANN-индексы, что у vector"""
+    if VECTOR_INDEX_TYPE == "none":
+        return []
+    indexes = [(vector_index(table.c.vector_next, name=f"{VECTOR_INDEX_NAME}_next", postgresql_concurrently=True),
+                VECTOR_INDEX_NAME)]
+    if VECTOR_PARTIAL_INDEXES:
+        indexes += [
+            (
+                vector_index(
+                    table.c.vector_next,
+                    name=f"{VECTOR_INDEX_NAME}_{label}_next",
+                    postgresql_where=text(f"sentiment_label_next = '{label}'"),
+                    postgresql_concurrently=True
+                ),
+                f"{VECTOR_INDEX_NAME}_{label}"
+            )
+            for label in SENTIMENT_LABELS
+        ]
+    return indexes
+
+def build_shadow_indexes(indexes, maintenance_work_mem: str):
+    """Построение индексов по теневому столбцу без блокировки записи (как в rebuild_index.py)"""
+    with sync_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": maintenance_work_mem})
+        for index, _ in indexes:
+            # Остатки прерванного построения (невалидный индекс) удаляем
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+            print(f"Построение индекса {index.name}...")
+            started = time.time()
+            conn.execute(CreateIndex(index))
+            print(f"Индекс построен за {time.time() - started:.1f} с")
+
+def switch_columns(target: str, indexes, batch_size: int, lock_timeout: str) -> bool:
+    """Замена основных столбцов теневыми в одной транзакции.
+
+    Запись в таблицу блокируется (чтение продолжается), строки, добавленные старой моделью
+    после обхода, дописываются под блокировкой. Затем основные столбцы удаляются вместе
+    с индексами, теневые переименовываются в основные, а пустые теневые создаются заново:
+    изменения только в каталоге, поэтому поиск ждет лишь короткую финальную блокировку.
+    В той же транзакции записывается версия векторов корпуса (corpus_state) - по ней
+    процессы замечают переключение.
+    Возвращает False, если недописанных строк больше batch_size - нужен еще один обход.
+    """
+    with sync_engine.connect() as conn:
+        conn.execute(text("SELECT set_config('lock_timeout', :value, true)"), {"value": lock_timeout})
+        conn.execute(text(f"LOCK TABLE {table.name} IN SHARE ROW EXCLUSIVE MODE"))
+
+        copy_current_rows(conn, target)
+        rows = conn.execute(
+            select(table.c.id, table.c.text).where(pending_condition(target)).limit(batch_size + 1)
+        ).all()
+        if len(rows) > batch_size:
+            conn.rollback()
+            return False
+        if rows:
+            embed_rows(conn, rows, target)
+
+        conn.execute(text(
+            f"ALTER TABLE {table.name} " + ", ".join(f"DROP COLUMN {column}" for column in SHADOW_COLUMNS)
+        ))
+        for column, shadow in SHADOW_COLUMNS.items():
+            conn.execute(text(f"ALTER TABLE {table.name} RENAME COLUMN {shadow} TO {column}"))
+        for index, name in indexes:
+            conn.execute(text(f"ALTER INDEX {index.name} RENAME TO {name}"))
+        conn.execute(text(f"ALTER TABLE {table.name} " + ", ".join(
+            f"ADD COLUMN {CreateColumn(table.c[shadow]).compile(dialect=conn.dialect)}"
+            for shadow in SHADOW_COLUMNS.values()
+        )))
+        conn.execute(
+            text(
+                "INSERT INTO corpus_state (name, value, updated_at) VALUES (:name, :value, now()) "
+                "ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = now()"
+            ),
+            {"name": VECTORS_VERSION, "value": target}
+        )
+        conn.commit()
+    return True
+
+def up_to_date(target: str) -> bool:
+    """Все основные векторы уже посчитаны версией target"""
+    with SessionLocal() as session:
+        stale = session.execute(
+            select(table.c.id).where(table.c.model_version.is_distinct_from(target)).limit(1)
+        ).first()
+    if stale is None:
+        print(f"Все векторы уже посчитаны версией {target}")
+    return stale is None
+
+def switch_reads(target: str, args) -> bool:
+    indexes = shadow_indexes()
+    build_shadow_indexes(indexes, args.maintenance_work_mem)
+    for attempt in range(5):
+        try:
+            switched = switch_columns(target, indexes, args.batch_size, args.lock_timeout)
+        except OperationalError as e:
+            print(f"Не удалось получить блокировку таблицы (попытка {attempt + 1}/5): {e.orig}")
+            time.sleep(5)
+            continue
+        if not switched:
+            print("Во время обхода добавлено много строк старой моделью - нужен еще один обход")
+            return False
+        corpus_generation.bump()
+        print(f"🔄 Поиск переключен на векторы версии {target}")
+        return True
+    print("Таблица занята - повторите переключение: python scripts/reembed.py switch")
+    sys.exit(1)
+
+def run(args):
+    target, _ = current_version()
+    if not 0 < args.duty_cycle <= 1:
+        print("--duty-cycle должен быть в диапазоне (0, 1]")
+        sys.exit(1)
+    if up_to_date(target):
+        return
+    # Проверка до обхода: иначе часы пересчета закончатся отказом переключения
+    if not args.no_switch:
+        check_switch_allowed()
+    configure_threads()
+    while True:
+        if not fill_shadow(target, args.batch_size, args.duty_cycle):
+            sys.exit(1)
+        if args.no_switch or switch_reads(target, args):
+            return
+
+def switch(args):
+    target, _ = current_version()
+    if up_to_date(target):
+        return
+    check_switch_allowed()
+    if not switch_reads(target, args):
+        print("Запустите python scripts/reembed.py run для пересчета оставшихся строк")
+        sys.exit(1)
+
+def status(args):
+    target, _ = current_version()
+    with SessionLocal() as session:
+        versions = session.execute(
+            select(table.c.model_version, func.count()).group_by(table.c.model_version)
+        ).all()
+        shadow = session.execute(
+            select(func.count()).select_from(table).where(table.c.model_version_next == target)
+        ).scalar()
+        pending = session.execute(select(func.count()).select_from(table).where(pending_condition(target))).scalar()
+    print(f"Текущая версия модели: {target}")
+    for version, count in versions:
+        print(f"   vector версии {version or 'неизвестна'}: {count}")
+    print(f"   в теневых столбцах версии {target}: {shadow}, осталось пересчитать: {pending}")
+
+def main():
+    args = parse_args()
+    {"run": run, "switch": switch, "status": status}[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# Сохранение снимка векторного индекса в памяти (SEARCH_BACKEND=numpy) для загрузки через mmap
+
+import argparse
+import time
+from app.dependencies import SessionLocal
+from app.services.vector_index import InMemoryVectorIndex, VECTOR_INDEX_SNAPSHOT
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Снимок нормированных векторов reviews.vector в файлы .npy")
+    parser.add_argument("--path", default=VECTOR_INDEX_SNAPSHOT or "./vector_index",
+                        help="Путь снимка без расширения (по умолчанию VECTOR_INDEX_SNAPSHOT)")
+    parser.add_argument("--full", action="store_true",
+                        help="Перечитать все векторы из БД, не используя существующий снимок")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    started = time.time()
+
+    # Без --full существующий снимок открывается и дополняется только новыми строками
+    index = InMemoryVectorIndex(snapshot_path="" if args.full else args.path)
+    with SessionLocal() as session:
+        index.refresh_sync(session)
+    index.save_snapshot(args.path)
+
+    print(f"✅ Снимок сохранен: {args.path}.ids.npy, {args.path}.vectors.npy, {args.path}.meta.json "
+          f"({len(index)} векторов, {time.time() - started:.1f} с)")
+
+if __name__ == "__main__":
+    main()